@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# archive benchmark
+# compares encrypting/decrypting a tree of many small files one file at a
+# time (encryptFiles/decryptFiles) with encrypting it into a single
+# archive (encryptTree/decryptTree)
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import pyAesCrypt
+from pyAesCrypt.batch import filePairs
+
+from .common import makeFile, parseSize, password
+
+
+# time func(), returning the elapsed wall-clock time
+def elapsed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tree archives.")
+    parser.add_argument("-n", "--count", type=int, default=2000,
+                        help="number of files")
+    parser.add_argument("-s", "--size", default="1K",
+                        help="size of each file")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="workers for encryptFiles/decryptFiles "
+                        "(default: number of CPUs)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        src = os.path.join(tmpdir, "src")
+        for i in range(args.count):
+            sub = os.path.join(src, "d%03d" % (i // 100))
+            os.makedirs(sub, exist_ok=True)
+            makeFile(os.path.join(sub, "f%06d" % i), parseSize(args.size))
+
+        enc = os.path.join(tmpdir, "enc")
+        dec = os.path.join(tmpdir, "dec")
+        archive = os.path.join(tmpdir, "src.tar.aes")
+        out = os.path.join(tmpdir, "out")
+
+        times = [
+            ("per-file", "encrypt", elapsed(lambda: pyAesCrypt.encryptFiles(
+                filePairs(src, enc), password, workers=args.jobs))),
+            ("per-file", "decrypt", elapsed(lambda: pyAesCrypt.decryptFiles(
+                filePairs(enc, dec, True), password, workers=args.jobs))),
+            ("archive", "encrypt", elapsed(lambda: pyAesCrypt.encryptTree(
+                src, archive, password))),
+            ("archive", "decrypt", elapsed(lambda: pyAesCrypt.decryptTree(
+                archive, out, password))),
+        ]
+        shutil.rmtree(out)
+
+        print("%-9s %-8s %10s %10s" % ("mode", "op", "seconds", "files/s"))
+        for mode, op, seconds in times:
+            print("%-9s %-8s %10.3f %10.1f" % (mode, op, seconds,
+                                               args.count / seconds))
+
+
+if __name__ == "__main__":
+    main()
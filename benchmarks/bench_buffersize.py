@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# buffer size benchmark
+# measures encryptStream/decryptStream throughput on files for a range of
+# buffer sizes, and for bufferSize="auto"
+
+import argparse
+import os
+import tempfile
+import time
+
+import pyAesCrypt
+from pyAesCrypt.crypto import autoBufferSize
+
+from .common import makeFile, password
+
+# buffer sizes to measure - 16KB to 8MB
+bufferSizes = [2 ** i * 1024 for i in range(4, 14)] + ["auto"]
+
+
+# run func(fIn, fOut, password, bufferSize) on files,
+# returning the best wall-clock time in seconds
+def timeStream(func, infile, outfile, bufferSize, repeat):
+    best = None
+    for i in range(repeat):
+        with open(infile, "rb") as fIn:
+            with open(outfile, "wb") as fOut:
+                start = time.perf_counter()
+                func(fIn, fOut, password, bufferSize, zeroCopy=True)
+                elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark buffer sizes.")
+    parser.add_argument("-s", "--size", type=int, default=128,
+                        help="plaintext size in MB")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="number of timing runs (best is reported)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pt = os.path.join(tmpdir, "pt")
+        ct = os.path.join(tmpdir, "ct")
+        dec = os.path.join(tmpdir, "dec")
+        makeFile(pt, args.size * 1024 * 1024)
+        pyAesCrypt.encryptFile(pt, ct, password)
+        with open(pt, "rb") as fIn:
+            print("auto buffer size: %d bytes" % autoBufferSize(fIn))
+
+        print("%-12s %14s %14s" % ("buffer size", "encrypt MB/s",
+                                   "decrypt MB/s"))
+        for bufferSize in bufferSizes:
+            # timings include key stretching (the same for every size)
+            tEnc = timeStream(pyAesCrypt.encryptStream, pt, ct, bufferSize,
+                              args.repeat)
+            tDec = timeStream(pyAesCrypt.decryptStream, ct, dec, bufferSize,
+                              args.repeat)
+            label = bufferSize if bufferSize == "auto" \
+                else "%dK" % (bufferSize // 1024)
+            print("%-12s %14.1f %14.1f" % (label, args.size / tEnc,
+                                           args.size / tDec))
+
+
+if __name__ == "__main__":
+    main()
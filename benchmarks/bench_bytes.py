@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# in-memory bytes benchmark
+# compares per-call time of encryptBytes/decryptBytes with BytesIO round
+# trips through the stream functions, for small payloads; sessions are
+# used, so that key stretching is excluded
+
+import argparse
+import io
+import os
+import timeit
+
+import pyAesCrypt
+
+from .common import password
+
+
+# BytesIO round trip encryption
+def encryptViaStream(enc, data):
+    fOut = io.BytesIO()
+    enc.encryptStream(io.BytesIO(data), fOut)
+    return fOut.getvalue()
+
+
+# BytesIO round trip decryption
+def decryptViaStream(dec, data):
+    fOut = io.BytesIO()
+    dec.decryptStream(io.BytesIO(data), fOut)
+    return fOut.getvalue()
+
+
+# time func(), returning the best per-call time in seconds
+def timeCall(func, number, repeat):
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bytes API.")
+    parser.add_argument("-n", "--number", type=int, default=5000,
+                        help="calls per timing run")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="number of timing runs (best is reported)")
+    args = parser.parse_args()
+
+    enc = pyAesCrypt.Encryptor(password)
+    dec = pyAesCrypt.Decryptor(password)
+
+    print("%-8s %16s %16s %16s %16s" % ("size", "encryptStream us",
+                                        "encryptBytes us", "decryptStream us",
+                                        "decryptBytes us"))
+    for size in (16, 100, 500, 1000, 4096):
+        data = os.urandom(size)
+        ctext = enc.encryptBytes(data)
+        # warm up the key cache
+        dec.decryptBytes(ctext)
+        times = [
+            timeCall(lambda: encryptViaStream(enc, data), args.number,
+                     args.repeat),
+            timeCall(lambda: enc.encryptBytes(data), args.number,
+                     args.repeat),
+            timeCall(lambda: decryptViaStream(dec, ctext), args.number,
+                     args.repeat),
+            timeCall(lambda: dec.decryptBytes(ctext), args.number,
+                     args.repeat),
+        ]
+        print("%-8d %16.2f %16.2f %16.2f %16.2f" % ((size,) +
+                                                    tuple(t * 1e6 for t in times)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# chunked container benchmark
+# compares wall-clock throughput of AES Crypt v2 files and of chunked
+# containers encrypted/decrypted by 1 to N workers, on a temporary file,
+# and the rate of authenticated random reads from a chunked container
+# (key stretching is included once per file, hence use large sizes)
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pyAesCrypt
+
+from .common import makeFile, parseSize, password
+
+
+# time one file operation, returning the best wall-clock time
+def timeOp(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chunked mode.")
+    parser.add_argument("-s", "--size", default="256M",
+                        help="plaintext size")
+    parser.add_argument("-c", "--chunk-size", default="1M",
+                        help="chunk size")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="maximum number of workers")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="number of timing runs (best is reported)")
+    parser.add_argument("-n", "--reads", type=int, default=1000,
+                        help="number of 4K random reads")
+    args = parser.parse_args()
+
+    size = parseSize(args.size)
+    chunkSize = parseSize(args.chunk_size)
+    keyCache = pyAesCrypt.KeyCache()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pt = os.path.join(tmpdir, "pt")
+        ct = os.path.join(tmpdir, "ct")
+        makeFile(pt, size)
+
+        print("%d CPUs" % os.cpu_count())
+        print("%-8s %-12s %10s" % ("op", "mode", "MB/s"))
+        workersList = sorted({1, 2, 4, args.jobs} & set(range(1, args.jobs + 1)))
+        modes = [("v2", None, 1)]
+        modes += [("chunked/%d" % w, chunkSize, w) for w in workersList]
+        for mode, cSize, workers in modes:
+            seconds = timeOp(
+                lambda: pyAesCrypt.encryptFile(pt, ct, password,
+                                               chunkSize=cSize,
+                                               workers=workers),
+                args.repeat)
+            print("%-8s %-12s %10.1f" % ("encrypt", mode,
+                                         size / 1e6 / seconds))
+            seconds = timeOp(
+                lambda: pyAesCrypt.decryptFile(ct, os.devnull, password,
+                                               keyCache=keyCache,
+                                               workers=workers),
+                args.repeat)
+            print("%-8s %-12s %10.1f" % ("decrypt", mode,
+                                         size / 1e6 / seconds))
+
+        # authenticated random reads (the file holds the last chunked run)
+        offsets = [random.randrange(max(size - 4096, 1))
+                   for i in range(args.reads)]
+        with pyAesCrypt.openDecrypted(ct, password, keyCache) as fDec:
+            start = time.perf_counter()
+            for offset in offsets:
+                fDec.readRange(offset, 4096)
+            elapsed = time.perf_counter() - start
+        print("%d random 4K reads: %.1f reads/s" % (args.reads,
+                                                    args.reads / elapsed))
+
+
+if __name__ == "__main__":
+    main()
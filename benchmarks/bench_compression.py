@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# compression benchmark
+# compares end-to-end encryptFile/decryptFile throughput and output size
+# of plain mode and of every available compression codec, on a
+# compressible (log-like) file and on an incompressible (random) one;
+# sessions are used, so that key stretching is excluded
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import pyAesCrypt
+from pyAesCrypt.compression import zstandard
+
+from .common import password
+
+
+# write about size bytes of log-like text to path
+def makeLogFile(path, size):
+    rnd = random.Random(0)
+    words = ["GET", "POST", "/index.html", "/api/v1/items", "200", "404",
+             "500", "user", "session", "timeout", "cache", "miss", "hit"]
+    with open(path, "wb") as fOut:
+        written = 0
+        n = 0
+        while written < size:
+            line = "2020-01-01T00:00:%02d.%06d INFO %s\n" % (
+                n % 60, n, " ".join(rnd.choice(words) for i in range(8)))
+            written += fOut.write(line.encode())
+            n += 1
+
+
+# write size random bytes to path (without repeated chunks, which
+# long-range codecs would find)
+def makeRandomFile(path, size):
+    with open(path, "wb") as fOut:
+        while size > 0:
+            size -= fOut.write(os.urandom(min(size, 1024 * 1024)))
+
+
+# time func(), returning the best wall-clock time
+def bestTime(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compression.")
+    parser.add_argument("-s", "--size", type=int, default=64,
+                        help="plaintext size in MB")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="number of timing runs (best is reported)")
+    args = parser.parse_args()
+
+    codecs = [None, "zlib", "lzma"]
+    if zstandard is not None:
+        codecs.append("zstd")
+
+    enc = pyAesCrypt.Encryptor(password)
+    dec = pyAesCrypt.Decryptor(password)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ct = os.path.join(tmpdir, "ct")
+        dt = os.path.join(tmpdir, "dt")
+        size = args.size * 1024 * 1024
+
+        print("%-7s %-6s %12s %12s %8s" % ("data", "codec", "enc MB/s",
+                                          "dec MB/s", "ratio"))
+        for kind, make in (("logs", makeLogFile), ("random", makeRandomFile)):
+            pt = os.path.join(tmpdir, kind)
+            make(pt, size)
+            size = os.path.getsize(pt)
+            for codec in codecs:
+                encSecs = bestTime(
+                    lambda: enc.encryptFile(pt, ct, compress=codec),
+                    args.repeat)
+                # warm up the key cache
+                dec.decryptFile(ct, dt)
+                decSecs = bestTime(lambda: dec.decryptFile(ct, dt),
+                                   args.repeat)
+                print("%-7s %-6s %12.1f %12.1f %8.2f" % (
+                    kind, codec or "none", size / 1024 ** 2 / encSecs,
+                    size / 1024 ** 2 / decSecs, size / os.path.getsize(ct)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# header write benchmark
+# compares the number of write calls and the time needed to write the
+# header to an unbuffered sink (every write is a system call) with the
+# original one-field-per-write header writer
+
+import argparse
+import os
+import timeit
+
+from pyAesCrypt.crypto import version, writeHeader
+
+
+# original AES Crypt v2 header writer (reference implementation)
+def writeHeaderLegacy(fOut, iv1, c_iv_key, hmac1):
+    fOut.write(bytes("AES", "utf8"))
+    fOut.write(b"\x02")
+    fOut.write(b"\x00")
+    cby = "pyAesCrypt " + version
+    fOut.write(b"\x00" + bytes([1 + len("CREATED_BY" + cby)]))
+    fOut.write(bytes("CREATED_BY", "utf8") + b"\x00" + bytes(cby, "utf8"))
+    fOut.write(b"\x00\x80")
+    for i in range(128):
+        fOut.write(b"\x00")
+    fOut.write(b"\x00\x00")
+    fOut.write(iv1)
+    fOut.write(c_iv_key)
+    fOut.write(hmac1)
+
+
+# output sink counting write calls
+class CountingSink:
+    def __init__(self):
+        self.calls = 0
+        self.data = bytearray()
+
+    def write(self, data):
+        self.calls += 1
+        self.data += data
+        return len(data)
+
+
+# time func writing the header to an unbuffered sink,
+# returning the best per-header time in seconds
+def timeHeader(func, fOut, fields, number, repeat):
+    timer = timeit.Timer(lambda: func(fOut, *fields))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark header writes.")
+    parser.add_argument("-n", "--number", type=int, default=2000,
+                        help="headers per timing run")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="number of timing runs (best is reported)")
+    args = parser.parse_args()
+
+    fields = (os.urandom(16), os.urandom(48), os.urandom(32))
+
+    # both implementations must produce the same header
+    sinkLegacy = CountingSink()
+    writeHeaderLegacy(sinkLegacy, *fields)
+    sink = CountingSink()
+    writeHeader(sink, *fields)
+    if sink.data != sinkLegacy.data:
+        raise SystemExit("Error: header differs from reference.")
+
+    with open(os.devnull, "wb", buffering=0) as fOut:
+        tLegacy = timeHeader(writeHeaderLegacy, fOut, fields, args.number,
+                             args.repeat)
+        tNew = timeHeader(writeHeader, fOut, fields, args.number, args.repeat)
+
+    print("%-14s %12s %14s" % ("", "write calls", "us/header"))
+    print("%-14s %12d %14.2f" % ("legacy header", sinkLegacy.calls,
+                                 tLegacy * 1e6))
+    print("%-14s %12d %14.2f" % ("header", sink.calls, tNew * 1e6))
+    print("speedup:       %8.2fx" % (tLegacy / tNew))
+
+
+if __name__ == "__main__":
+    main()
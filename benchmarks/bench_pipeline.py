@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# pipeline benchmark
+# compares wall-clock throughput of encryptStream/decryptStream in the
+# default, zero-copy and pipelined modes, on a temporary file; sessions
+# are used, so that key stretching is excluded (the pipelined mode only
+# helps with more than one CPU)
+
+import argparse
+import os
+import tempfile
+import time
+
+import pyAesCrypt
+
+from .common import makeFile, password
+
+# stream modes: name -> keyword arguments
+modes = (
+    ("default", {}),
+    ("zerocopy", {"zeroCopy": True}),
+    ("pipeline", {"pipeline": True}),
+)
+
+
+# time one stream operation, returning the best wall-clock time
+def timeOp(func, infile, outfile, bufferSize, kwargs, repeat):
+    best = None
+    for i in range(repeat):
+        with open(infile, "rb") as fIn:
+            with open(outfile, "wb") as fOut:
+                start = time.perf_counter()
+                func(fIn, fOut, bufferSize, **kwargs)
+                elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipelined mode.")
+    parser.add_argument("-s", "--size", type=int, default=256,
+                        help="plaintext size in MB")
+    parser.add_argument("-b", "--buffer-size", type=int, default=1024 * 1024,
+                        help="buffer size in bytes")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="number of timing runs (best is reported)")
+    args = parser.parse_args()
+
+    enc = pyAesCrypt.Encryptor(password)
+    dec = pyAesCrypt.Decryptor(password)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pt = os.path.join(tmpdir, "pt")
+        ct = os.path.join(tmpdir, "ct")
+        makeFile(pt, args.size * 1024 * 1024)
+        with open(pt, "rb") as fIn:
+            with open(ct, "wb") as fOut:
+                enc.encryptStream(fIn, fOut)
+        # warm up the key cache
+        with open(ct, "rb") as fIn:
+            with open(os.devnull, "wb") as fOut:
+                dec.decryptStream(fIn, fOut)
+
+        print("%d CPUs" % os.cpu_count())
+        print("%-8s %-9s %10s" % ("op", "mode", "MB/s"))
+        for op, func, infile, outfile in (
+                ("encrypt", enc.encryptStream, pt, ct + ".tmp"),
+                ("decrypt", dec.decryptStream, ct, os.devnull)):
+            for mode, kwargs in modes:
+                seconds = timeOp(func, infile, outfile, args.buffer_size,
+                                 kwargs, args.repeat)
+                print("%-8s %-9s %10.1f" % (op, mode, args.size / seconds))
+
+
+if __name__ == "__main__":
+    main()
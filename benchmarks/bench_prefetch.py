@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# key prefetch benchmark
+# compares decryptFiles rates on many files with and without a
+# KeyPrefetcher, and reports the key derivation time hidden behind
+# payload work
+
+import argparse
+import os
+import tempfile
+import time
+
+import pyAesCrypt
+
+from .common import makeFile, parseSize, password
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark key prefetching.")
+    parser.add_argument("-n", "--count", type=int, default=200,
+                        help="number of files")
+    parser.add_argument("-s", "--size", default="256K",
+                        help="size of each file")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="payload workers")
+    parser.add_argument("-k", "--key-workers", type=int, default=None,
+                        help="key derivation processes "
+                        "(default: number of CPUs)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pairs = []
+        for i in range(args.count):
+            pt = os.path.join(tmpdir, "f%06d" % i)
+            makeFile(pt, parseSize(args.size))
+            pairs.append((pt, pt + ".aes"))
+        pyAesCrypt.encryptFiles(pairs, password)
+        decPairs = [(ct, pt + ".dec") for pt, ct in pairs]
+
+        print("%d CPUs" % os.cpu_count())
+        for prefetcher in (None, pyAesCrypt.KeyPrefetcher(args.key_workers)):
+            start = time.perf_counter()
+            pyAesCrypt.decryptFiles(decPairs, password, workers=args.jobs,
+                                    prefetcher=prefetcher)
+            elapsed = time.perf_counter() - start
+            mode = "prefetch" if prefetcher is not None else "default"
+            print("%-9s %10.1f files/s" % (mode, args.count / elapsed))
+            if prefetcher is not None:
+                print(prefetcher.report())
+
+
+if __name__ == "__main__":
+    main()
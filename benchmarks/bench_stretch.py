@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# key stretching microbenchmark
+# compares pyAesCrypt.crypto.stretch with the original per-round
+# cryptography Hash loop
+
+import argparse
+import os
+import timeit
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+
+from pyAesCrypt.crypto import stretch
+
+
+# original password stretching function (reference implementation)
+def stretchLegacy(passw, iv1):
+
+    # hash the external iv and the password 8192 times
+    digest = iv1 + (16 * b"\x00")
+
+    for i in range(8192):
+        passHash = hashes.Hash(hashes.SHA256(), backend=default_backend())
+        passHash.update(digest)
+        passHash.update(bytes(passw, "utf_16_le"))
+        digest = passHash.finalize()
+
+    return digest
+
+
+# time func(passw, iv1), returning the best per-call time in seconds
+def timeStretch(func, passw, iv1, number, repeat):
+    timer = timeit.Timer(lambda: func(passw, iv1))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark key stretching.")
+    parser.add_argument("-n", "--number", type=int, default=10,
+                        help="calls per timing run")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="number of timing runs (best is reported)")
+    args = parser.parse_args()
+
+    passw = "please-use-a-long-and-random-password"
+    iv1 = os.urandom(16)
+
+    # both implementations must produce the same key
+    if stretch(passw, iv1) != stretchLegacy(passw, iv1):
+        raise SystemExit("Error: stretch output differs from reference.")
+
+    tLegacy = timeStretch(stretchLegacy, passw, iv1, args.number, args.repeat)
+    tNew = timeStretch(stretch, passw, iv1, args.number, args.repeat)
+
+    print("legacy stretch: %8.3f ms/call" % (tLegacy * 1000))
+    print("stretch:        %8.3f ms/call" % (tNew * 1000))
+    print("speedup:        %8.2fx" % (tLegacy / tNew))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# zero-copy stream benchmark
+# compares CPU time and peak RSS of encryptStream/decryptStream with and
+# without zeroCopy; every run happens in a child process, so that peak RSS
+# is measured separately for each mode (UNIX only)
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import pyAesCrypt
+
+from .common import makeFile, password
+
+
+# child process: run one operation, print CPU seconds and peak RSS (KB)
+def child(op, infile, outfile, bufferSize, zeroCopy):
+    with open(infile, "rb") as fIn:
+        with open(outfile, "wb") as fOut:
+            if op == "encrypt":
+                pyAesCrypt.encryptStream(fIn, fOut, password, bufferSize,
+                                         zeroCopy=zeroCopy)
+            else:
+                pyAesCrypt.decryptStream(fIn, fOut, password, bufferSize,
+                                         zeroCopy=zeroCopy)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    print(usage.ru_utime + usage.ru_stime, usage.ru_maxrss)
+
+
+# run one operation in a child process
+def runChild(op, infile, outfile, bufferSize, zeroCopy):
+    out = subprocess.check_output(
+        [sys.executable, "-m", "benchmarks.bench_zerocopy", "--child", op,
+         infile, outfile, str(bufferSize), str(int(zeroCopy))])
+    cpu, rss = out.split()
+    return float(cpu), int(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark zero-copy mode.")
+    parser.add_argument("-s", "--size", type=int, default=256,
+                        help="plaintext size in MB")
+    parser.add_argument("-b", "--buffer-size", type=int, default=64 * 1024,
+                        help="buffer size in bytes")
+    parser.add_argument("--child", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        op, infile, outfile, bufferSize, zeroCopy = args.child
+        child(op, infile, outfile, int(bufferSize), bool(int(zeroCopy)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pt = os.path.join(tmpdir, "pt")
+        ct = os.path.join(tmpdir, "ct")
+        dec = os.path.join(tmpdir, "dec")
+        makeFile(pt, args.size * 1024 * 1024)
+
+        print("%-8s %-9s %10s %10s %12s" % ("op", "mode", "CPU [s]", "MB/s",
+                                            "peak RSS [KB]"))
+        for op, infile, outfile in (("encrypt", pt, ct), ("decrypt", ct, dec)):
+            for zeroCopy in (False, True):
+                cpu, rss = runChild(op, infile, outfile, args.buffer_size,
+                                    zeroCopy)
+                mode = "zerocopy" if zeroCopy else "default"
+                print("%-8s %-9s %10.3f %10.1f %12d" % (op, mode, cpu,
+                                                       args.size / cpu, rss))
+
+
+if __name__ == "__main__":
+    main()
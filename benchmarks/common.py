@@ -0,0 +1,50 @@
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# helpers shared by the benchmarks
+
+import os
+
+# benchmark password
+password = "please-use-a-long-and-random-password"
+
+# size suffixes accepted by parseSize
+sizeUnits = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+# parse a size such as "0", "4096", "64K", "1M" or "4G" into bytes
+def parseSize(value):
+    mult = sizeUnits.get(value[-1:].upper(), 1)
+    if mult != 1:
+        value = value[:-1]
+    return int(value) * mult
+
+
+# format a size in bytes as parsed by parseSize
+def formatSize(size):
+    for unit in ("G", "M", "K"):
+        if size and size % sizeUnits[unit] == 0:
+            return "%d%s" % (size // sizeUnits[unit], unit)
+    return str(size)
+
+
+# write size random bytes to path, 1MB at a time
+def makeFile(path, size):
+    chunk = os.urandom(min(size, 1024 * 1024))
+    with open(path, "wb") as fOut:
+        while size > 0:
+            fOut.write(chunk[:size])
+            size -= len(chunk)
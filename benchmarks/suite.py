@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+#
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# benchmark suite
+# measures:
+# - stretch() latency
+# - encryptStream/decryptStream throughput and peak RSS, for every
+#   combination of file size and buffer size (each run happens in a child
+#   process, so that peak RSS is measured separately; UNIX only)
+# - encryptFiles/decryptFiles rates on many small files
+# Results can be saved as JSON (--output) and compared with the results
+# of a previous run (--baseline): the exit status is 1 if any result is
+# worse than the baseline by more than the tolerance.
+# benchmarks/baseline.json holds reference results of the default options,
+# along with the machine they were measured on; a baseline for another
+# machine is produced by running the unmodified tree with
+# python -m benchmarks -o benchmarks/baseline.json
+# Everything runs offline, on temporary files.
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import pyAesCrypt
+from pyAesCrypt.crypto import stretch, version
+
+from .common import formatSize, makeFile, parseSize, password
+
+
+# build a result entry
+# value: measured value
+# unit: unit of value
+# higherIsBetter: whether a higher value is an improvement
+def result(value, unit, higherIsBetter):
+    return {"value": value, "unit": unit, "higherIsBetter": higherIsBetter}
+
+
+# measure stretch() latency, in ms (best of repeat runs)
+def benchStretch(repeat):
+    iv1 = os.urandom(16)
+    timer = timeit.Timer(lambda: stretch(password, iv1))
+    best = min(timer.repeat(repeat=repeat, number=5)) / 5
+    return {"stretch": result(best * 1000, "ms", False)}
+
+
+# child process: run one stream operation repeat times, print the best
+# wall-clock time (excluding key stretching) and the peak RSS as JSON
+def child(op, infile, outfile, bufferSize, repeat):
+    if bufferSize != "auto":
+        bufferSize = int(bufferSize)
+
+    # sessions stretch the key beforehand, to time the payload only
+    enc = pyAesCrypt.Encryptor(password)
+    dec = pyAesCrypt.Decryptor(password)
+
+    # warm up the crypto backend
+    warm = io.BytesIO()
+    enc.encryptStream(io.BytesIO(b"warm-up"), warm)
+    dec.decryptStream(io.BytesIO(warm.getvalue()), io.BytesIO())
+
+    best = None
+    for i in range(repeat):
+        with open(infile, "rb") as fIn:
+            with open(outfile, "wb") as fOut:
+                if op == "encrypt":
+                    start = time.perf_counter()
+                    enc.encryptStream(fIn, fOut, bufferSize, zeroCopy=True)
+                else:
+                    dec.keyCache.getKey(password, pyAesCrypt.readHeader(fIn).iv1)
+                    fIn.seek(0)
+                    start = time.perf_counter()
+                    dec.decryptStream(fIn, fOut, bufferSize, zeroCopy=True)
+                elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    print(json.dumps({"seconds": best, "peakRssKB": usage.ru_maxrss}))
+
+
+# run one stream operation in a child process
+def runChild(op, infile, outfile, bufferSize, repeat):
+    out = subprocess.check_output(
+        [sys.executable, "-m", "benchmarks.suite", "--child", op, infile,
+         outfile, str(bufferSize), str(repeat)])
+    return json.loads(out)
+
+
+# measure stream throughput and peak RSS for every size and buffer size
+def benchStreams(tmpdir, sizes, bufferSizes, repeat):
+    results = {}
+    pt = os.path.join(tmpdir, "pt")
+    ct = os.path.join(tmpdir, "ct")
+    for size in sizes:
+        makeFile(pt, size)
+        for bufferSize in bufferSizes:
+            label = "size=%s/buffer=%s" % (
+                formatSize(size),
+                bufferSize if bufferSize == "auto" else formatSize(bufferSize))
+            # decryption output is discarded
+            for op, infile, outfile in (("encrypt", pt, ct),
+                                        ("decrypt", ct, os.devnull)):
+                res = runChild(op, infile, outfile, bufferSize, repeat)
+                # throughput is meaningless for tiny files: report latency
+                if size >= 1024 * 1024:
+                    results["%s/%s" % (op, label)] = result(
+                        size / 1024 ** 2 / max(res["seconds"], 1e-9), "MB/s",
+                        True)
+                else:
+                    results["%s/%s" % (op, label)] = result(
+                        res["seconds"] * 1000, "ms", False)
+                results["rss/%s/%s" % (op, label)] = result(
+                    res["peakRssKB"], "KB", False)
+        os.remove(pt)
+    if os.path.exists(ct):
+        os.remove(ct)
+    return results
+
+
+# measure encryptFiles/decryptFiles rates on count files of size bytes
+def benchSmallFiles(tmpdir, count, size, workers):
+    root = os.path.join(tmpdir, "small")
+    os.mkdir(root)
+    for i in range(count):
+        makeFile(os.path.join(root, "f%06d" % i), size)
+    pairs = [(os.path.join(root, "f%06d" % i),
+              os.path.join(root, "f%06d.aes" % i)) for i in range(count)]
+
+    label = "smallfiles/count=%d/size=%s" % (count, formatSize(size))
+    results = {}
+    start = time.perf_counter()
+    pyAesCrypt.encryptFiles(pairs, password, workers=workers)
+    elapsed = time.perf_counter() - start
+    results["encrypt/" + label] = result(count / elapsed, "files/s", True)
+
+    decPairs = [(ct, pt + ".dec") for pt, ct in pairs]
+    start = time.perf_counter()
+    pyAesCrypt.decryptFiles(decPairs, password, workers=workers)
+    elapsed = time.perf_counter() - start
+    results["decrypt/" + label] = result(count / elapsed, "files/s", True)
+    return results
+
+
+# compare results with baseline results
+# returns: list of (name, baseline value, value, relative change,
+#          regression flag) tuples, for the results found in both
+def compare(results, baseline, tolerance):
+    rows = []
+    for name, res in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None or not base["value"]:
+            continue
+        change = res["value"] / base["value"] - 1
+        worse = -change if res["higherIsBetter"] else change
+        rows.append((name, base["value"], res["value"], change,
+                     worse > tolerance))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run pyAesCrypt benchmarks.")
+    parser.add_argument("--sizes", default="0,1K,1M,64M",
+                        help="comma-separated file sizes (K/M/G suffixes "
+                        "are accepted, e.g. 0,1M,4G)")
+    parser.add_argument("--buffer-sizes", default="64K,1M,auto",
+                        help="comma-separated buffer sizes, or auto")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="number of timing runs (best is reported)")
+    parser.add_argument("--small-files", type=int, default=200,
+                        help="number of files for the small-file benchmark "
+                        "(0 to skip it)")
+    parser.add_argument("--small-size", default="4K",
+                        help="size of each small file")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="workers for the small-file benchmark "
+                        "(default: number of CPUs)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="save results to this JSON file")
+    parser.add_argument("-b", "--baseline", default=None,
+                        help="compare results with this JSON file")
+    parser.add_argument("-t", "--tolerance", type=float, default=0.1,
+                        help="relative change tolerated before a result "
+                        "counts as a regression (default: 0.1)")
+    parser.add_argument("--child", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child[:4], int(args.child[4]))
+        return
+
+    sizes = [parseSize(s) for s in args.sizes.split(",")]
+    bufferSizes = [s if s == "auto" else parseSize(s)
+                   for s in args.buffer_sizes.split(",")]
+
+    results = benchStretch(args.repeat)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results.update(benchStreams(tmpdir, sizes, bufferSizes, args.repeat))
+        if args.small_files:
+            results.update(benchSmallFiles(tmpdir, args.small_files,
+                                           parseSize(args.small_size),
+                                           args.jobs))
+
+    for name, res in sorted(results.items()):
+        print("%-48s %12.2f %s" % (name, res["value"], res["unit"]))
+
+    if args.output:
+        with open(args.output, "w") as fOut:
+            json.dump({
+                "version": version,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            }, fOut, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as fIn:
+            baseline = json.load(fIn)["results"]
+        rows = compare(results, baseline, args.tolerance)
+        print()
+        print("%-48s %12s %12s %8s" % ("comparison with baseline", "baseline",
+                                       "current", "change"))
+        for name, base, value, change, regression in rows:
+            print("%-48s %12.2f %12.2f %+7.1f%%%s" % (
+                name, base, value, change * 100,
+                "  REGRESSION" if regression else ""))
+        if any(row[4] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,13 @@
 from .crypto import encryptFile, decryptFile, encryptStream, decryptStream
+from .crypto import KeyCache, Encryptor, Decryptor
+from .crypto import StreamEncryptor, StreamDecryptor, EncryptingWriter
+from .crypto import DecryptingReader
+from .crypto import DecryptedFile, openDecrypted, decryptRange
+from .crypto import encryptStreamChunked, decryptStreamChunked, ChunkedFile
+from .crypto import Header, readHeader, checkPassword
+from .crypto import verifyFile, verifyStream
+from .crypto import encryptBytes, decryptBytes
+from .stats import Observer, Stats
+from .batch import encryptFiles, decryptFiles, verifyFiles, KeyPrefetcher
+from .aio import encryptStreamAsync, decryptStreamAsync
+from .archive import encryptTree, decryptTree
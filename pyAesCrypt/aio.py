@@ -0,0 +1,219 @@
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# pyAesCrypt asyncio module
+# Coroutine versions of encryptStream/decryptStream.
+# Input streams must have a coroutine read(n) method (e.g.
+# asyncio.StreamReader); output streams must have a write(data) method
+# which is either a coroutine or a plain method, in which case a drain()
+# coroutine (e.g. asyncio.StreamWriter) is awaited after each write, if any.
+# Key stretching, cipher updates on chunks of at least offloadSize bytes
+# and decompression (a small chunk can expand to a huge plaintext) run in
+# an executor, so that the event loop is not blocked.
+
+import asyncio
+import inspect
+from os import urandom
+
+from .compression import StreamDecompressor
+from .crypto import (
+    AESBlockSize,
+    PayloadEncryptor,
+    bufferSizeDef,
+    buildHeader,
+    decryptKeys,
+    getKey,
+    headerParser,
+    maxPassLen,
+    newKeys,
+    payloadDecryptor,
+    stretch,
+)
+
+# default minimum chunk size processed in the executor - 16KB
+offloadSizeDef = 16 * 1024
+
+
+# read up to nbytes bytes from an async input stream
+# (fewer bytes are returned only at the end of stream)
+async def readAsync(fIn, nbytes):
+    fdata = await fIn.read(nbytes)
+    while 0 < len(fdata) < nbytes:
+        more = await fIn.read(nbytes - len(fdata))
+        if not more:
+            break
+        fdata += more
+    return fdata
+
+
+# write data to an async output stream
+async def writeAsync(fOut, data):
+    res = fOut.write(data)
+    if inspect.isawaitable(res):
+        await res
+    else:
+        drain = getattr(fOut, "drain", None)
+        if drain is not None:
+            await drain()
+
+
+# run func(data), in the executor if data is large enough
+async def runCrypto(loop, executor, offloadSize, func, data):
+    if len(data) >= offloadSize:
+        return await loop.run_in_executor(executor, func, data)
+    return func(data)
+
+
+# write the data decompressed from pText to an async output stream,
+# decompressing each bounded chunk in the executor
+async def writeDecompressed(loop, executor, fOut, decompressor, pText):
+    chunks = decompressor.chunks(pText)
+    while True:
+        chunk = await loop.run_in_executor(executor, next, chunks, None)
+        if chunk is None:
+            break
+        await writeAsync(fOut, chunk)
+
+
+# encrypt async binary stream coroutine
+# arguments:
+# fIn: input async binary stream
+# fOut: output async binary stream
+# passw: encryption password
+# bufferSize: encryption buffer size, must be a multiple of
+#             AES block size (16)
+# executor: executor used for CPU-bound work (None means the
+#           default executor of the event loop)
+# offloadSize: chunks of at least offloadSize bytes are encrypted
+#              in the executor
+async def encryptStreamAsync(
+    fIn,
+    fOut,
+    passw,
+    bufferSize=bufferSizeDef,
+    executor=None,
+    offloadSize=offloadSizeDef,
+):
+    # validate bufferSize
+    if bufferSize % AESBlockSize != 0:
+        raise ValueError("Buffer size must be a multiple of AES block size.")
+
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    loop = asyncio.get_running_loop()
+
+    # generate external iv and stretch password in the executor
+    iv1 = urandom(AESBlockSize)
+    key = await loop.run_in_executor(executor, stretch, passw, iv1)
+
+    # generate and encrypt random main iv and internal key
+    iv0, intKey, c_iv_key, hmac1 = newKeys(iv1, key)
+
+    # write header in one go
+    await writeAsync(fOut, buildHeader(iv1, c_iv_key, hmac1))
+
+    # encrypt stream while reading it
+    encryptor = PayloadEncryptor(iv0, intKey)
+    while True:
+        fdata = await readAsync(fIn, bufferSize)
+        if fdata:
+            cText = await runCrypto(
+                loop, executor, offloadSize, encryptor.update, fdata
+            )
+            await writeAsync(fOut, cText)
+        # check if EOF was reached
+        if len(fdata) < bufferSize:
+            break
+
+    # write last block and trailer
+    await writeAsync(fOut, encryptor.finalize())
+
+
+# decrypt async binary stream coroutine
+# arguments:
+# fIn: input async binary stream
+# fOut: output async binary stream
+# passw: encryption password
+# bufferSize: decryption buffer size, must be a multiple of
+#             AES block size (16)
+# executor: executor used for CPU-bound work (None means the
+#           default executor of the event loop)
+# offloadSize: chunks of at least offloadSize bytes are decrypted
+#              in the executor
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+async def decryptStreamAsync(
+    fIn,
+    fOut,
+    passw,
+    bufferSize=bufferSizeDef,
+    executor=None,
+    offloadSize=offloadSizeDef,
+    keyCache=None,
+):
+    # validate bufferSize
+    if bufferSize % AESBlockSize != 0:
+        raise ValueError("Buffer size must be a multiple of AES block size")
+
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    loop = asyncio.get_running_loop()
+
+    # parse header
+    parser = headerParser()
+    nbytes = next(parser)
+    try:
+        while True:
+            nbytes = parser.send(await readAsync(fIn, nbytes))
+    except StopIteration as ex:
+        hdr = ex.value
+
+    # stretch password and iv (or get the key from the cache) in the executor
+    key = await loop.run_in_executor(executor, getKey, passw, hdr.iv1, keyCache)
+
+    # check password and get internal iv and key
+    iv0, intKey = decryptKeys(key, hdr)
+
+    # decompress transparently, if the header records a codec
+    decompressor = None
+    if hdr.compression is not None:
+        decompressor = StreamDecompressor(hdr.compression)
+
+    # decrypt stream while reading it
+    decryptor = payloadDecryptor(hdr, iv0, intKey)
+    while True:
+        cText = await readAsync(fIn, bufferSize)
+        if cText:
+            pText = await runCrypto(
+                loop, executor, offloadSize, decryptor.update, cText
+            )
+            if decompressor is not None:
+                await writeDecompressed(loop, executor, fOut, decompressor, pText)
+            else:
+                await writeAsync(fOut, pText)
+        # check if EOF was reached
+        if len(cText) < bufferSize:
+            break
+
+    # write last block and check HMAC
+    pText = decryptor.finalize()
+    if decompressor is not None:
+        await writeDecompressed(loop, executor, fOut, decompressor, pText)
+        decompressor.finish()
+    else:
+        await writeAsync(fOut, pText)
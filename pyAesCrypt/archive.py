@@ -0,0 +1,138 @@
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# pyAesCrypt archive module
+# Encrypts a whole directory tree into a single encrypted tar stream,
+# and extracts it back, with no temporary tar file: one key derivation,
+# one header and sequential I/O for the whole tree.
+# The output is a regular AES Crypt file, whose plaintext is a tar
+# archive (optionally gzip/xz compressed by tarfile itself).
+
+import os
+import tarfile
+from os import path, remove
+
+from .crypto import (
+    DecryptingReader,
+    EncryptingWriter,
+    bufferSizeDef,
+    maxPassLen,
+    verifyFile,
+)
+
+# tar stream compression for each compression codec
+# (see encryptStream; zstd is not supported by tarfile)
+tarCompression = {None: "", "zlib": "gz", "lzma": "xz"}
+
+
+# encrypt tree function
+# arguments:
+# root: directory to encrypt (stored in the archive under its own name)
+# outfile: encrypted archive file path
+# passw: encryption password
+# compress: optional compression codec ("zlib" or "lzma")
+# bufferSize: size of the chunks written by tarfile
+def encryptTree(root, outfile, passw, compress=None, bufferSize=bufferSizeDef):
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    if compress not in tarCompression:
+        raise ValueError("Unsupported archive compression codec: %s." % compress)
+
+    if not path.isdir(root):
+        raise ValueError("Unable to read input directory.")
+
+    try:
+        with open(outfile, "wb") as fOut:
+            with EncryptingWriter(fOut, passw) as fEnc:
+                with tarfile.open(
+                    fileobj=fEnc,
+                    mode="w|" + tarCompression[compress],
+                    bufsize=bufferSize,
+                ) as tar:
+                    tar.add(root, arcname=path.basename(path.normpath(root)))
+    except (IOError, ValueError):
+        # remove the incomplete archive
+        if path.isfile(outfile):
+            remove(outfile)
+        raise
+
+
+# decrypt tree function
+# extracts an archive written by encryptTree into outdir
+# arguments:
+# infile: encrypted archive file path
+# outdir: output directory
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# verify: check the HMAC of the archive before extracting anything
+#         (requires a second pass over infile); if False, files are
+#         extracted while decrypting and a corrupted archive is only
+#         detected at the end, after its contents have been extracted
+# bufferSize: number of ciphertext bytes read at a time
+def decryptTree(
+    infile, outdir, passw, keyCache=None, verify=True, bufferSize=bufferSizeDef
+):
+    if verify:
+        verifyFile(infile, passw, keyCache=keyCache)
+
+    try:
+        fIn = open(infile, "rb")
+    except IOError:
+        raise ValueError("Unable to read input file.")
+
+    with fIn:
+        fDec = DecryptingReader(fIn, passw, keyCache, bufferSize)
+        try:
+            with tarfile.open(fileobj=fDec, mode="r|*", bufsize=bufferSize) as tar:
+                extractMembers(tar, outdir)
+                # read up to the end of the stream, so that the HMAC is
+                # checked even if tarfile stops before it
+                while fDec.read(bufferSize):
+                    pass
+        except tarfile.TarError:
+            raise ValueError("File is not a valid encrypted archive.")
+
+
+# extract members function
+# extracts the members of tar into outdir, refusing absolute paths,
+# paths outside of outdir, links pointing outside of it and special files
+def extractMembers(tar, outdir):
+    if hasattr(tarfile, "data_filter"):
+        try:
+            tar.extractall(outdir, filter="data")
+        except tarfile.FilterError as ex:
+            raise ValueError("Unsafe archive member: %s." % ex.tarinfo.name)
+        return
+
+    # older Python versions: check members here
+    for member in tar:
+        checkMember(member)
+        tar.extract(member, outdir)
+
+
+# check member function
+# raises ValueError if member cannot be extracted safely
+def checkMember(member):
+    names = [member.name]
+    if member.issym() or member.islnk():
+        names.append(member.linkname)
+    elif not (member.isfile() or member.isdir()):
+        raise ValueError("Unsafe archive member: %s." % member.name)
+    for name in names:
+        if path.isabs(name) or os.pardir in name.replace("\\", "/").split("/"):
+            raise ValueError("Unsafe archive member: %s." % member.name)
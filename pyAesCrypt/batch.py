@@ -0,0 +1,358 @@
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# pyAesCrypt batch module
+# Encrypts/decrypts many files concurrently.
+# CBC encryption of a single stream cannot be parallelized, hence running
+# several files at once is the way to keep all the CPU cores busy.
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .crypto import (
+    KeyCache,
+    decryptFile,
+    encryptFile,
+    readHeader,
+    stretch,
+    verifyBufferSizeDef,
+    verifyFile,
+)
+
+# suffix of encrypted files
+encSuffix = ".aes"
+
+
+# batch file result class
+# infile: input file path
+# outfile: output file path
+# error: error message (None if the file was processed successfully)
+class FileResult:
+    def __init__(self, infile, outfile, error=None):
+        self.infile = infile
+        self.outfile = outfile
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return "FileResult(%r, %r, %r)" % (self.infile, self.outfile, self.error)
+
+
+# run a file job, returning the error message (if any) instead of raising
+# (an OSError escaping func is reported too, so that one unreadable
+# file does not abort the whole batch)
+# arguments:
+# func: file function (e.g. encryptFile)
+# infile: input file path
+# outfile: output file path
+# args: additional positional arguments for func
+# kwargs: additional keyword arguments for func
+def runFileJob(func, infile, outfile, args, kwargs):
+    try:
+        func(infile, outfile, *args, **kwargs)
+    except (ValueError, OSError) as ex:
+        return str(ex)
+    return None
+
+
+# run file jobs in a pool of workers
+# yields a FileResult for each (infile, outfile) pair, in input order,
+# keeping at most 2 jobs per worker in flight (so that pairs can be
+# a lazy iterator over millions of files)
+# arguments:
+# func: file function (e.g. encryptFile)
+# pairs: iterable of (infile, outfile) pairs
+# args: additional positional arguments for func
+# kwargs: additional keyword arguments for func
+# workers: number of workers (default: number of CPUs)
+# useProcesses: use a process pool instead of a thread pool
+def runFileJobs(func, pairs, args=(), kwargs=None, workers=None, useProcesses=False):
+    if kwargs is None:
+        kwargs = {}
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("Number of workers must be at least 1.")
+
+    poolClass = ProcessPoolExecutor if useProcesses else ThreadPoolExecutor
+
+    with poolClass(workers) as pool:
+        pending = deque()
+        for infile, outfile in pairs:
+            if len(pending) >= 2 * workers:
+                pinfile, poutfile, future = pending.popleft()
+                yield FileResult(pinfile, poutfile, future.result())
+            future = pool.submit(runFileJob, func, infile, outfile, args, kwargs)
+            pending.append((infile, outfile, future))
+        while pending:
+            pinfile, poutfile, future = pending.popleft()
+            yield FileResult(pinfile, poutfile, future.result())
+
+
+# encrypt files function
+# arguments:
+# pairs: iterable of (plaintext file path, ciphertext file path) pairs
+# passw: encryption password
+# bufferSize: optional buffer size, must be a multiple of
+#             AES block size (16), or "auto"
+# workers: number of files processed concurrently
+#          (default: number of CPUs)
+# useProcesses: use a process pool instead of a thread pool
+# compress: optional compression codec (see encryptStream)
+# chunkSize: if not None, write chunked containers (see encryptFile)
+# returns: list of FileResult, in input order
+def encryptFiles(
+    pairs,
+    passw,
+    bufferSize="auto",
+    workers=None,
+    useProcesses=False,
+    compress=None,
+    chunkSize=None,
+):
+    return list(
+        runFileJobs(
+            encryptFile,
+            pairs,
+            (passw, bufferSize),
+            {"compress": compress, "chunkSize": chunkSize},
+            workers=workers,
+            useProcesses=useProcesses,
+        )
+    )
+
+
+# decrypt files function
+# arguments:
+# pairs: iterable of (ciphertext file path, plaintext file path) pairs
+# passw: encryption password
+# bufferSize: optional buffer size, must be a multiple of
+#             AES block size (16), or "auto"
+# workers: number of files processed concurrently
+#          (default: number of CPUs)
+# useProcesses: use a process pool instead of a thread pool
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched keys (only shared between workers of a thread pool)
+# prefetcher: optional KeyPrefetcher instance deriving the keys of
+#             upcoming files ahead (not supported with useProcesses)
+# returns: list of FileResult, in input order
+def decryptFiles(
+    pairs,
+    passw,
+    bufferSize="auto",
+    workers=None,
+    useProcesses=False,
+    keyCache=None,
+    prefetcher=None,
+):
+    if useProcesses and keyCache is not None:
+        raise ValueError("A key cache cannot be shared between processes.")
+
+    ownCache = None
+    if prefetcher is not None:
+        if useProcesses:
+            raise ValueError("Prefetched keys cannot be shared between processes.")
+        if keyCache is None:
+            # room for the keys derived ahead and for the files in flight
+            ownCache = keyCache = KeyCache(
+                prefetcher.depth + 2 * (workers or os.cpu_count() or 1)
+            )
+        pairs = prefetcher.schedule(pairs, passw, keyCache)
+
+    try:
+        return list(
+            runFileJobs(
+                decryptFile,
+                pairs,
+                (passw, bufferSize),
+                {"keyCache": keyCache},
+                workers=workers,
+                useProcesses=useProcesses,
+            )
+        )
+    finally:
+        if ownCache is not None:
+            ownCache.clear()
+
+
+# timed stretch function
+# returns: (stretched key, seconds spent stretching)
+def stretchTimed(passw, iv1):
+    start = time.perf_counter()
+    key = stretch(passw, iv1)
+    return key, time.perf_counter() - start
+
+
+# key prefetcher class
+# Reads the headers of upcoming files and stretches their keys ahead in a
+# process pool, so that key derivation overlaps the payload work of
+# decryptFiles (pass an instance as its prefetcher argument).
+# Afterwards, it reports the time spent deriving keys and the time spent
+# waiting for them: the difference is the derivation time hidden behind
+# payload work.
+# arguments:
+# workers: number of key derivation processes (default: number of CPUs)
+# depth: number of files whose keys are derived ahead
+#        (default: 2 per key derivation process)
+class KeyPrefetcher:
+    def __init__(self, workers=None, depth=None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1.")
+        if depth is None:
+            depth = 2 * workers
+        if depth < 1:
+            raise ValueError("Prefetch depth must be at least 1.")
+        self.workers = workers
+        self.depth = depth
+        # number of keys derived
+        self.keys = 0
+        # seconds spent deriving keys (summed over the processes)
+        self.deriveTime = 0.0
+        # seconds spent waiting for keys
+        self.waitTime = 0.0
+
+    # seconds of key derivation hidden behind payload work
+    @property
+    def hiddenTime(self):
+        return max(self.deriveTime - self.waitTime, 0.0)
+
+    # human-readable report
+    def report(self):
+        return "derived %d keys in %.3f s, waited %.3f s (%.3f s hidden)" % (
+            self.keys,
+            self.deriveTime,
+            self.waitTime,
+            self.hiddenTime,
+        )
+
+    # schedule function
+    # yields the (infile, outfile) pairs in order, each one as soon as the
+    # key of infile has been stored in keyCache, while the keys of the
+    # next depth files are being derived
+    # arguments:
+    # pairs: iterable of (ciphertext file path, plaintext file path) pairs
+    # passw: encryption password
+    # keyCache: KeyCache instance receiving the keys
+    def schedule(self, pairs, passw, keyCache):
+        with ProcessPoolExecutor(self.workers) as pool:
+            pending = deque()
+            for infile, outfile in pairs:
+                pending.append((infile, outfile, self.submit(pool, infile, passw)))
+                if len(pending) > self.depth:
+                    yield self.take(pending.popleft(), passw, keyCache)
+            while pending:
+                yield self.take(pending.popleft(), passw, keyCache)
+
+    # read the header of infile and submit the derivation of its key
+    # returns: (external iv, future), or None if the header cannot be read
+    #          (the error is then reported by the payload stage)
+    def submit(self, pool, infile, passw):
+        try:
+            with open(infile, "rb") as fIn:
+                iv1 = readHeader(fIn).iv1
+        except (OSError, ValueError):
+            return None
+        return iv1, pool.submit(stretchTimed, passw, iv1)
+
+    # wait for the key of a pending file, store it and return the pair
+    def take(self, item, passw, keyCache):
+        infile, outfile, job = item
+        if job is not None:
+            iv1, future = job
+            start = time.perf_counter()
+            key, seconds = future.result()
+            self.waitTime += time.perf_counter() - start
+            self.deriveTime += seconds
+            self.keys += 1
+            keyCache.putKey(passw, iv1, key)
+        return infile, outfile
+
+
+# verify file job function
+# adapts verifyFile to the (infile, outfile) signature of file jobs
+def verifyFileJob(infile, outfile, *args, **kwargs):
+    verifyFile(infile, *args, **kwargs)
+
+
+# verify files function
+# checks the HMAC of many encrypted files concurrently, without
+# decrypting them
+# arguments:
+# infiles: iterable of ciphertext file paths
+# passw: encryption password
+# bufferSize: optional read buffer size
+# workers: number of files processed concurrently
+#          (default: number of CPUs)
+# useProcesses: use a process pool instead of a thread pool
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched keys (only shared between workers of a thread pool)
+# returns: list of FileResult (with outfile set to None), in input order
+def verifyFiles(
+    infiles,
+    passw,
+    bufferSize=verifyBufferSizeDef,
+    workers=None,
+    useProcesses=False,
+    keyCache=None,
+):
+    if useProcesses and keyCache is not None:
+        raise ValueError("A key cache cannot be shared between processes.")
+
+    return list(
+        runFileJobs(
+            verifyFileJob,
+            ((infile, None) for infile in infiles),
+            (passw, bufferSize),
+            {"keyCache": keyCache},
+            workers=workers,
+            useProcesses=useProcesses,
+        )
+    )
+
+
+# file pairs function
+# walks a directory tree, yielding (infile, outfile) pairs for encryption
+# (every file not ending in ".aes") or decryption (every ".aes" file)
+# arguments:
+# root: input directory
+# outRoot: output directory (the tree structure is mirrored there and
+#          missing directories are created); if None, output files are
+#          written next to input files
+# decrypt: yield pairs for decryption instead of encryption
+def filePairs(root, outRoot=None, decrypt=False):
+    for dirpath, dirnames, fnames in os.walk(root):
+        dirnames.sort()
+        if outRoot is not None:
+            outDir = os.path.join(outRoot, os.path.relpath(dirpath, root))
+        else:
+            outDir = dirpath
+        for fname in sorted(fnames):
+            if fname.endswith(encSuffix) != decrypt:
+                continue
+            if decrypt:
+                outName = fname[: -len(encSuffix)]
+            else:
+                outName = fname + encSuffix
+            if outRoot is not None:
+                os.makedirs(outDir, exist_ok=True)
+            yield os.path.join(dirpath, fname), os.path.join(outDir, outName)
@@ -0,0 +1,302 @@
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# pyAesCrypt chunked container module
+# Optional container mode in which the payload is split into chunks, each
+# one encrypted with its own random iv and authenticated with its own
+# HMAC-SHA256, bound to the chunk index and to a final-chunk flag.
+# Chunks can therefore be encrypted and decrypted in parallel, decrypted
+# plaintext can be trusted chunk by chunk, and any chunk can be read
+# without reading the others.
+# The mode is announced by a CHUNKED header extension recording the chunk
+# size; the header (external iv, encrypted main iv and internal key) is the
+# AES Crypt v2 one. Other AES Crypt tools do not know the extension, hence
+# they reject such files as corrupted.
+#
+# Payload layout: a sequence of records, each one made of
+# flag (1 byte: 0, or 1 for the final chunk) | iv (16 bytes) |
+# ciphertext | HMAC-SHA256 (32 bytes)
+# where the HMAC covers index (8 bytes, big endian) | flag | iv | ciphertext.
+# Every chunk but the final one holds exactly chunkSize plaintext bytes;
+# the final one holds fewer bytes (possibly none), padded with PKCS#7.
+# Encryption and authentication keys are derived from the internal key.
+
+from os import urandom
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, hmac
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+# identifier of the header extension recording the chunk size
+chunkedExtId = "CHUNKED"
+
+# default chunk size - 1MB
+chunkSizeDef = 1024 * 1024
+
+# maximum chunk size - 64MB
+chunkSizeMax = 64 * 1024 * 1024
+
+# AES block size
+blockSize = 16
+
+# bytes added to each chunk: flag, iv and HMAC-SHA256
+recordOverhead = 1 + blockSize + 32
+
+# flag values
+flagMore = 0
+flagFinal = 1
+
+
+# check chunk size function
+# raises ValueError if chunkSize is not a positive multiple of AES block
+# size (16), not larger than chunkSizeMax
+def checkChunkSize(chunkSize):
+    if chunkSize <= 0 or chunkSize % blockSize != 0:
+        raise ValueError("Chunk size must be a multiple of AES block size.")
+    if chunkSize > chunkSizeMax:
+        raise ValueError("Chunk size must not exceed %d bytes." % chunkSizeMax)
+
+
+# chunked extension function
+# returns: (identifier, contents) of the header extension announcing
+#          the chunked mode, with the chunk size in decimal digits
+def chunkedExtension(chunkSize):
+    return chunkedExtId, str(chunkSize).encode("ascii")
+
+
+# parse chunk size function
+# returns: the chunk size recorded in the contents of a CHUNKED extension
+# raises ValueError if it is not valid
+def parseChunkSize(contents):
+    if not contents.isdigit():
+        raise ValueError("File is corrupted.")
+    chunkSize = int(contents)
+    try:
+        checkChunkSize(chunkSize)
+    except ValueError:
+        raise ValueError("File is corrupted.")
+    return chunkSize
+
+
+# chunk keys function
+# derives the chunk encryption and authentication keys from the internal
+# key, so that no key is used both by AES and by HMAC-SHA256
+# returns: (encryption key, authentication key)
+def chunkKeys(intKey):
+    keys = []
+    for label in (b"pyAesCrypt chunk encryption", b"pyAesCrypt chunk authentication"):
+        kdf = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+        kdf.update(label)
+        keys.append(kdf.finalize())
+    return tuple(keys)
+
+
+# chunk HMAC function
+# returns: HMAC-SHA256 instance updated with index and the record
+#          (without its HMAC)
+def chunkHmac(macKey, index, body):
+    hmacC = hmac.HMAC(macKey, hashes.SHA256(), backend=default_backend())
+    hmacC.update(index.to_bytes(8, byteorder="big"))
+    hmacC.update(body)
+    return hmacC
+
+
+# encrypt chunk function
+# arguments:
+# encKey: chunk encryption key
+# macKey: chunk authentication key
+# index: chunk index
+# final: True for the final chunk
+# data: plaintext (chunkSize bytes, fewer bytes for the final chunk)
+# returns: record (bytearray)
+def encryptChunk(encKey, macKey, index, final, data):
+    iv = urandom(blockSize)
+    if final:
+        # pad data (PKCS#7)
+        padLen = blockSize - len(data) % blockSize
+        data = bytes(data) + bytes([padLen]) * padLen
+
+    # record buffer: the ciphertext is encrypted in place
+    # (update_into requires block size - 1 bytes of room, which the
+    # HMAC provides)
+    record = bytearray(len(data) + recordOverhead)
+    record[0] = flagFinal if final else flagMore
+    record[1 : 1 + blockSize] = iv
+    cipherC = Cipher(algorithms.AES(encKey), modes.CBC(iv), backend=default_backend())
+    encryptorC = cipherC.encryptor()
+    with memoryview(record) as view:
+        encryptorC.update_into(data, view[1 + blockSize :])
+        encryptorC.finalize()
+        view[-32:] = chunkHmac(macKey, index, view[:-32]).finalize()
+    return record
+
+
+# check chunk function
+# checks the layout and the HMAC of a record, without decrypting it
+# arguments:
+# macKey: chunk authentication key
+# index: chunk index
+# record: record bytes
+# chunkSize: chunk size
+# returns: True if the record holds the final chunk
+def checkChunk(macKey, index, record, chunkSize):
+    cLen = len(record) - recordOverhead
+    if cLen < blockSize or cLen % blockSize != 0 or cLen > chunkSize:
+        raise ValueError("File is corrupted.")
+    flag = record[0]
+    if flag not in (flagMore, flagFinal) or (flag == flagMore and cLen != chunkSize):
+        raise ValueError("File is corrupted.")
+
+    # HMAC check
+    with memoryview(record) as view:
+        hmacC = chunkHmac(macKey, index, view[:-32])
+        try:
+            hmacC.verify(bytes(view[-32:]))
+        except InvalidSignature:
+            raise ValueError("Bad HMAC (file is corrupted).")
+
+    return flag == flagFinal
+
+
+# decrypt chunk function
+# checks the HMAC of a record, then decrypts it
+# arguments:
+# encKey: chunk encryption key
+# macKey: chunk authentication key
+# index: chunk index
+# record: record bytes
+# chunkSize: chunk size
+# returns: plaintext (bytearray)
+def decryptChunk(encKey, macKey, index, record, chunkSize):
+    final = checkChunk(macKey, index, record, chunkSize)
+
+    # decrypt into a buffer with block size - 1 bytes of room
+    # (required by update_into)
+    iv = bytes(record[1 : 1 + blockSize])
+    cLen = len(record) - recordOverhead
+    pText = bytearray(cLen + blockSize - 1)
+    cipherC = Cipher(algorithms.AES(encKey), modes.CBC(iv), backend=default_backend())
+    decryptorC = cipherC.decryptor()
+    with memoryview(record) as view:
+        decryptorC.update_into(view[1 + blockSize : -32], pText)
+    decryptorC.finalize()
+
+    if final:
+        # remove padding (PKCS#7)
+        padLen = pText[cLen - 1]
+        if not 1 <= padLen <= blockSize or pText[cLen - padLen : cLen] != bytes([padLen]) * padLen:
+            raise ValueError("File is corrupted.")
+        cLen -= padLen
+    del pText[cLen:]
+
+    return pText
+
+
+# chunked encryptor class
+# Encrypts plaintext pushed in pieces of any size into records:
+# update(data) returns the records of the chunks completed so far,
+# finalize() returns the record of the final chunk.
+# arguments:
+# encKey: chunk encryption key
+# macKey: chunk authentication key
+# chunkSize: chunk size
+class ChunkedEncryptor:
+    def __init__(self, encKey, macKey, chunkSize):
+        self.__encKey = encKey
+        self.__macKey = macKey
+        self.__chunkSize = chunkSize
+        self.__buf = bytearray()
+        self.__index = 0
+
+    def update(self, data):
+        self.__buf += data
+        records = []
+        while len(self.__buf) >= self.__chunkSize:
+            records.append(
+                encryptChunk(
+                    self.__encKey,
+                    self.__macKey,
+                    self.__index,
+                    False,
+                    bytes(self.__buf[: self.__chunkSize]),
+                )
+            )
+            del self.__buf[: self.__chunkSize]
+            self.__index += 1
+        return b"".join(records)
+
+    def finalize(self):
+        record = encryptChunk(
+            self.__encKey, self.__macKey, self.__index, True, bytes(self.__buf)
+        )
+        self.__buf = bytearray()
+        return record
+
+
+# chunked decryptor class
+# Decrypts records pushed in pieces of any size: update(data) returns the
+# plaintext of the records completed so far, finalize() returns the
+# plaintext of the final chunk.
+# Every record is authenticated before its plaintext is returned; a
+# stream missing its final chunk is reported by finalize().
+# arguments:
+# encKey: chunk encryption key
+# macKey: chunk authentication key
+# chunkSize: chunk size
+class ChunkedDecryptor:
+    def __init__(self, encKey, macKey, chunkSize):
+        self.__encKey = encKey
+        self.__macKey = macKey
+        self.__chunkSize = chunkSize
+        self.__recordSize = chunkSize + recordOverhead
+        self.__buf = bytearray()
+        self.__index = 0
+
+    def update(self, data):
+        self.__buf += data
+        recordSize = self.__recordSize
+        pTexts = []
+        pos = 0
+        with memoryview(self.__buf) as view:
+            # the final record is only known to be complete at the end of
+            # the stream, hence it is held back until finalize()
+            while len(view) - pos >= recordSize and view[pos] != flagFinal:
+                pTexts.append(
+                    decryptChunk(
+                        self.__encKey,
+                        self.__macKey,
+                        self.__index,
+                        view[pos : pos + recordSize],
+                        self.__chunkSize,
+                    )
+                )
+                pos += recordSize
+                self.__index += 1
+        del self.__buf[:pos]
+        if len(self.__buf) > recordSize:
+            # data after the final record
+            raise ValueError("File is corrupted.")
+        return b"".join(pTexts)
+
+    def finalize(self):
+        if not self.__buf or self.__buf[0] != flagFinal:
+            raise ValueError("File is corrupted.")
+        pText = decryptChunk(
+            self.__encKey, self.__macKey, self.__index, self.__buf, self.__chunkSize
+        )
+        self.__buf = bytearray()
+        return pText
@@ -0,0 +1,227 @@
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# pyAesCrypt compression module
+# Optional compression of the plaintext before encryption.
+# The codec is recorded in a COMPRESSION header extension, so that
+# decryption can decompress transparently. Other AES Crypt tools ignore
+# the extension, hence they decrypt such files to the compressed data.
+# NOTE: header extensions are not authenticated by the AES Crypt format,
+# but the compressed data is: tampering with the extension can only make
+# decompression fail, or yield the compressed data.
+# NOTE: with compression, the ciphertext size depends on the plaintext
+# contents: do not compress data mixing secrets with contents controlled
+# by an attacker who can observe the file size.
+
+import lzma
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# identifier of the header extension recording the codec
+compressionExtId = "COMPRESSION"
+
+# supported codecs
+codecs = ("zlib", "lzma", "zstd")
+
+# maximum size of each decompressed chunk - 1MB
+decompressChunkSize = 1024 * 1024
+
+# size of the zstd input slices decompressed at a time by chunks() - 1KB
+# (a zstd block expands at most about 32768 times, hence each slice
+# yields at most about 32MB)
+zstdSliceSize = 1024
+
+# errors raised by the decompressors on corrupted data
+decompressErrors = (zlib.error, lzma.LZMAError, EOFError)
+if zstandard is not None:
+    decompressErrors += (zstandard.ZstdError,)
+
+
+# check codec function
+# raises ValueError if codec is not supported or not available
+def checkCodec(codec):
+    if codec not in codecs:
+        raise ValueError("Unsupported compression codec: %s." % codec)
+    if codec == "zstd" and zstandard is None:
+        raise ValueError("zstd compression requires the zstandard package.")
+
+
+# compression extension function
+# returns: the header extension recording codec, as an
+#          (identifier, contents) pair
+def compressionExtension(codec):
+    return compressionExtId, bytes(codec, "utf8")
+
+
+# compressing reader class
+# A readable stream returning the compressed contents of fIn.
+# arguments:
+# fIn: input binary stream
+# codec: compression codec (one of codecs)
+# chunkSize: number of bytes read from fIn at a time
+class CompressingReader:
+    def __init__(self, fIn, codec, chunkSize):
+        checkCodec(codec)
+        if codec == "zlib":
+            self.__compressor = zlib.compressobj()
+        elif codec == "lzma":
+            self.__compressor = lzma.LZMACompressor()
+        else:
+            self.__compressor = zstandard.ZstdCompressor().compressobj()
+        self.__fIn = fIn
+        self.__chunkSize = chunkSize
+        self.__buf = bytearray()
+        self.__eof = False
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        # compress input until n bytes are available (or until EOF)
+        while not self.__eof and (n < 0 or len(self.__buf) < n):
+            data = self.__fIn.read(self.__chunkSize)
+            if data:
+                self.__buf += self.__compressor.compress(data)
+            else:
+                self.__buf += self.__compressor.flush()
+                self.__eof = True
+        if n < 0:
+            n = len(self.__buf)
+        data = bytes(self.__buf[:n])
+        del self.__buf[:n]
+        return data
+
+
+# forwarding sink class
+# A writable stream passing the data written to it to its target function
+# (the zstd stream writer writes decompressed chunks to it).
+class ForwardingSink:
+    def __init__(self):
+        self.target = None
+
+    def write(self, data):
+        self.target(data)
+        return len(data)
+
+
+# push-style decompressor class
+# decompressTo(data, write) passes the decompressed data to write, in
+# chunks of at most decompressChunkSize bytes (so that a small input
+# expanding to a huge output never has to fit in memory); chunks(data)
+# yields the same chunks, decompressing each one only when it is
+# requested (each iterator must be exhausted before the next call);
+# update(data) returns the whole decompressed data; finish() checks
+# that the compressed data is complete.
+# NOTE: the zstd stream writer (the only zstandard API bounding the size
+# of each output chunk) decompresses the whole data written to it at
+# once, hence chunks() writes it slices of zstdSliceSize bytes; it does
+# not report truncated frames either: as the compressed data is
+# authenticated, it can only be truncated by a faulty writer.
+# arguments:
+# codec: compression codec (one of codecs)
+class StreamDecompressor:
+    def __init__(self, codec):
+        checkCodec(codec)
+        self.__codec = codec
+        if codec == "zlib":
+            self.__decompressor = zlib.decompressobj()
+        elif codec == "lzma":
+            self.__decompressor = lzma.LZMADecompressor()
+        else:
+            self.__sink = ForwardingSink()
+            self.__decompressor = zstandard.ZstdDecompressor().stream_writer(
+                self.__sink, write_size=decompressChunkSize
+            )
+
+    def decompressTo(self, data, write):
+        if self.__codec != "zstd":
+            for chunk in self.chunks(data):
+                write(chunk)
+            return
+        self.__sink.target = write
+        try:
+            self.__decompressor.write(data)
+        except decompressErrors:
+            raise ValueError("Compressed data is corrupted.")
+
+    def chunks(self, data):
+        if self.__codec == "zstd":
+            for pos in range(0, len(data), zstdSliceSize):
+                out = []
+                self.decompressTo(data[pos : pos + zstdSliceSize], out.append)
+                yield from out
+            return
+
+        d = self.__decompressor
+        yield self.__decompress(data)
+        if self.__codec == "zlib":
+            while d.unconsumed_tail:
+                yield self.__decompress(d.unconsumed_tail)
+        else:
+            while not d.needs_input and not d.eof:
+                yield self.__decompress(b"")
+
+    # decompress at most decompressChunkSize bytes (zlib and lzma)
+    def __decompress(self, data):
+        try:
+            return self.__decompressor.decompress(data, decompressChunkSize)
+        except decompressErrors:
+            raise ValueError("Compressed data is corrupted.")
+
+    def update(self, data):
+        chunks = []
+        self.decompressTo(data, chunks.append)
+        return b"".join(chunks)
+
+    def finish(self):
+        if self.__codec == "zstd":
+            # see the NOTE above
+            return
+        d = self.__decompressor
+        if not d.eof:
+            raise ValueError("Compressed data is truncated.")
+        if d.unused_data:
+            raise ValueError("Compressed data is corrupted.")
+
+
+# decompressing writer class
+# A writable stream decompressing the data written to it into fOut;
+# call finish() after the last write.
+# arguments:
+# fOut: output binary stream
+# codec: compression codec (one of codecs)
+class DecompressingWriter:
+    def __init__(self, fOut, codec):
+        self.__fOut = fOut
+        self.__decompressor = StreamDecompressor(codec)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.__decompressor.decompressTo(data, self.__write)
+        return len(data)
+
+    def __write(self, chunk):
+        if chunk:
+            self.__fOut.write(chunk)
+
+    def finish(self):
+        self.__decompressor.finish()
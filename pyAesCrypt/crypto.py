@@ -36,53 +36,362 @@
 
 # pyAesCrypt module
 
+import hashlib
 import io
+import math
+import mmap
+import os
+import stat
+import threading
+import time
 import warnings
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from os import path, remove, urandom
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes, hmac
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
+from .chunked import (
+    ChunkedDecryptor,
+    checkChunk,
+    checkChunkSize,
+    chunkKeys,
+    chunkSizeDef,
+    chunkedExtension,
+    chunkedExtId,
+    decryptChunk,
+    encryptChunk,
+    flagFinal,
+    parseChunkSize,
+    recordOverhead,
+)
+from .compression import (
+    CompressingReader,
+    DecompressingWriter,
+    StreamDecompressor,
+    checkCodec,
+    compressionExtension,
+    compressionExtId,
+)
+from .pipeline import PipelineReader, PipelineStage, readChunk, stopPipeline
+from .stats import Instrumentation, observed, timedCall
+
 # pyAesCrypt version - now semver
 version = "6.1.1"
 
 # default encryption/decryption buffer size - 64KB
 bufferSizeDef = 64 * 1024
 
+# bounds of the buffer size chosen by bufferSize="auto" - 64KB to 4MB
+autoBufferSizeMin = 64 * 1024
+autoBufferSizeMax = 4 * 1024 * 1024
+
+# time the buffer size chosen by bufferSize="auto" should take to be
+# encrypted, in seconds
+autoBufferTime = 0.002
+
 # maximum password length (number of chars)
 maxPassLen = 1024
 
 # AES block size in bytes
 AESBlockSize = 16
 
+# default segment size for parallel decryption - 1MB
+segmentSizeDef = 1024 * 1024
+
+# default verification buffer size - 1MB
+verifyBufferSizeDef = 1024 * 1024
+
+# alignment of buffers, offsets and sizes for direct I/O
+directIOAlignment = 4096
+
+# default maximum number of keys held by a KeyCache
+keyCacheSizeDef = 128
+
 
 # password stretching function
 def stretch(passw, iv1):
 
+    # encode the password once, outside of the loop
+    passwBytes = bytes(passw, "utf_16_le")
+
+    # bind the hash constructor to a local name: hashlib's OpenSSL-backed
+    # SHA-256 has a much lower per-call overhead than building a new
+    # cryptography Hash object at each round
+    sha256 = hashlib.sha256
+
     # hash the external iv and the password 8192 times
-    digest = iv1 + (16 * b"\x00")
+    digest = bytes(iv1) + (16 * b"\x00")
 
     for i in range(8192):
-        passHash = hashes.Hash(hashes.SHA256(), backend=default_backend())
-        passHash.update(digest)
-        passHash.update(bytes(passw, "utf_16_le"))
-        digest = passHash.finalize()
+        digest = sha256(digest + passwBytes).digest()
 
     return digest
 
 
+# stretched-key cache class
+# A size-bounded LRU cache of stretched keys, keyed on a fingerprint of the
+# password and on the external iv (iv1).
+# It can be passed to decryptStream/decryptFile to avoid re-stretching the
+# password when the same file is decrypted more than once.
+# NOTE: cached keys are as sensitive as the password itself: call clear()
+# as soon as the cache is no longer needed.
+# arguments:
+# maxSize: maximum number of keys held by the cache (least recently used
+#          keys are evicted first)
+class KeyCache:
+    def __init__(self, maxSize=keyCacheSizeDef):
+        if maxSize < 1:
+            raise ValueError("Key cache size must be at least 1.")
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self.__keys = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__keys)
+
+    # get the stretched key for the given password and external iv,
+    # stretching the password only on cache misses
+    def getKey(self, passw, iv1):
+        ckey = (passwFingerprint(passw), bytes(iv1))
+
+        with self.__lock:
+            key = self.__keys.get(ckey)
+            if key is not None:
+                self.__keys.move_to_end(ckey)
+                self.hits += 1
+                return key
+            self.misses += 1
+
+        # stretch outside of the lock, so that concurrent misses
+        # do not serialize
+        key = stretch(passw, iv1)
+        self.putKey(passw, iv1, key)
+
+        return key
+
+    # store a key stretched elsewhere (e.g. by KeyPrefetcher) for the given
+    # password and external iv
+    def putKey(self, passw, iv1, key):
+        ckey = (passwFingerprint(passw), bytes(iv1))
+
+        with self.__lock:
+            self.__keys[ckey] = key
+            self.__keys.move_to_end(ckey)
+            while len(self.__keys) > self.maxSize:
+                self.__keys.popitem(last=False)
+
+    # remove all the cached keys
+    def clear(self):
+        with self.__lock:
+            self.__keys.clear()
+
+
+# password fingerprint function
+# returns a digest identifying the password, used as cache key
+def passwFingerprint(passw):
+    fp = hashes.Hash(hashes.SHA256(), backend=default_backend())
+    fp.update(b"pyAesCrypt key cache\x00")
+    fp.update(bytes(passw, "utf_16_le"))
+    return fp.finalize()
+
+
+# throughput probe function
+# measures the AES256-CBC + HMAC-SHA256 throughput of this machine, in
+# bytes per second (measured once, then cached)
+probedThroughput = None
+
+
+def probeThroughput():
+    global probedThroughput
+    if probedThroughput is None:
+        data = bytes(256 * 1024)
+        encryptor = Cipher(
+            algorithms.AES(bytes(32)), modes.CBC(bytes(16)), backend=default_backend()
+        ).encryptor()
+        hmac0 = hmac.HMAC(bytes(32), hashes.SHA256(), backend=default_backend())
+        # warm up
+        encryptor.update(data[:AESBlockSize])
+        start = time.perf_counter()
+        hmac0.update(encryptor.update(data))
+        elapsed = time.perf_counter() - start
+        probedThroughput = len(data) / max(elapsed, 1e-6)
+    return probedThroughput
+
+
+# automatic buffer size function
+# chooses a buffer size taking about autoBufferTime seconds to be
+# processed (according to probeThroughput), between autoBufferSizeMin and
+# autoBufferSizeMax, but no larger than the file size, rounded up to a
+# multiple of the file system block size (st_blksize) and of AES block size
+# arguments:
+# fIn: input binary stream (if it is not a file, only the throughput
+#      probe is used)
+def autoBufferSize(fIn=None):
+    size = probeThroughput() * autoBufferTime
+    size = min(max(size, autoBufferSizeMin), autoBufferSizeMax)
+
+    # get file size and file system block size, if available
+    blkSize = AESBlockSize
+    try:
+        st = os.fstat(fIn.fileno())
+    except (AttributeError, OSError, ValueError):
+        pass
+    else:
+        if stat.S_ISREG(st.st_mode):
+            size = min(size, st.st_size)
+        blkSize = getattr(st, "st_blksize", 0) or AESBlockSize
+
+    # round up to a multiple of both block sizes
+    unit = blkSize * AESBlockSize // math.gcd(blkSize, AESBlockSize)
+    return max(-(-int(size) // unit) * unit, unit)
+
+
+# resolve buffer size function
+# returns autoBufferSize(fIn) if bufferSize is "auto", bufferSize otherwise
+def resolveBufferSize(bufferSize, fIn=None):
+    if bufferSize == "auto":
+        return autoBufferSize(fIn)
+    return bufferSize
+
+
 # encrypt file function
 # arguments:
 # infile: plaintext file path
 # outfile: ciphertext file path
 # passw: encryption password
 # bufferSize: optional buffer size, must be a multiple of
-#             AES block size (16)
+#             AES block size (16), or "auto" (see autoBufferSize)
 #             using a larger buffer speeds up things when dealing
 #             with big files
-#             Default is 64KB.
-def encryptFile(infile, outfile, passw, bufferSize=bufferSizeDef):
+#             Default is "auto".
+# useMmap: memory-map the input file and the (preallocated) output file
+# observer: optional stats.Observer instance receiving progress and
+#           per-phase timings (not supported with useMmap)
+# atomic: write to a temporary file in the output directory, renamed to
+#         outfile once complete (outfile is never left half-written)
+# fsync: flush the output file to disk before returning
+# pipeline: overlap reading, encryption, HMAC computation and writing
+#           using background threads (see encryptStream; ignored with
+#           useMmap)
+# compress: optional compression codec (see encryptStream; not supported
+#           with useMmap)
+# chunkSize: if not None, write a chunked container with chunks of
+#            chunkSize plaintext bytes (see encryptStreamChunked; not
+#            supported with useMmap, observer, pipeline or compress)
+# workers: number of parallel encryption workers (requires chunkSize)
+# useProcesses: use a process pool instead of a thread pool for the
+#               parallel encryption workers
+def encryptFile(
+    infile,
+    outfile,
+    passw,
+    bufferSize="auto",
+    useMmap=False,
+    observer=None,
+    atomic=False,
+    fsync=False,
+    pipeline=False,
+    compress=None,
+    chunkSize=None,
+    workers=1,
+    useProcesses=False,
+):
+    if useMmap and observer is not None:
+        raise ValueError("An observer cannot be used with useMmap.")
+
+    if chunkSize is None and workers > 1:
+        raise ValueError("Parallel encryption requires a chunkSize.")
+
+    if chunkSize is not None and (
+        useMmap or observer is not None or pipeline or compress is not None
+    ):
+        raise ValueError(
+            "A chunkSize cannot be used with useMmap, observer, pipeline "
+            "or compress."
+        )
+
+    if useMmap and compress is not None:
+        raise ValueError("Compression cannot be used with useMmap.")
+
+    if useMmap:
+
+        def func(fIn, fOut):
+            bufSize = resolveBufferSize(bufferSize, fIn)
+
+            # validate bufferSize
+            if bufSize % AESBlockSize != 0:
+                raise ValueError("Buffer size must be a multiple of AES block size.")
+
+            if len(passw) > maxPassLen:
+                raise ValueError("Password is too long.")
+
+            # generate external iv and stretch password
+            iv1 = urandom(AESBlockSize)
+            key = stretch(passw, iv1)
+
+            encryptMmap(fIn, fOut, iv1, key, bufSize)
+
+        processFiles(
+            infile, outfile, func, outMode="w+b", atomic=atomic, fsync=fsync
+        )
+    elif chunkSize is not None:
+        processFiles(
+            infile,
+            outfile,
+            lambda fIn, fOut: encryptStreamChunked(
+                fIn, fOut, passw, chunkSize, workers, useProcesses
+            ),
+            atomic=atomic,
+            fsync=fsync,
+        )
+    else:
+        processFiles(
+            infile,
+            outfile,
+            lambda fIn, fOut: encryptStream(
+                fIn,
+                fOut,
+                passw,
+                bufferSize,
+                zeroCopy=not pipeline,
+                observer=observer,
+                pipeline=pipeline,
+                compress=compress,
+            ),
+            atomic=atomic,
+            fsync=fsync,
+        )
+
+
+# file processing function
+# opens the input and the output file and runs func(fIn, fOut) on them
+# arguments:
+# infile: input file path
+# outfile: output file path
+# func: function processing the input stream into the output stream
+# removeOnError: remove the output file if func raises ValueError
+# outMode: output file open mode
+# opener: optional opener for the output file (see the builtin open)
+# atomic: write to a temporary file in the output directory, then rename
+#         it to outfile, so that outfile is either left untouched or
+#         completely written (the temporary file is removed on any error)
+# fsync: flush the output file (and, if atomic, its directory) to disk
+#        before returning
+def processFiles(
+    infile,
+    outfile,
+    func,
+    removeOnError=False,
+    outMode="wb",
+    opener=None,
+    atomic=False,
+    fsync=False,
+):
     try:
         with open(infile, "rb") as fIn:
             # check that output file does not exist
@@ -91,104 +400,192 @@ def encryptFile(infile, outfile, passw, bufferSize=bufferSizeDef):
             if path.isfile(outfile):
                 if path.samefile(infile, outfile):
                     raise ValueError("Input and output files are the same.")
+
+            target = outfile
+            if atomic:
+                if path.exists(outfile) and not path.isfile(outfile):
+                    raise ValueError("Atomic output requires a regular output file.")
+                outfile = tempPath(outfile)
+                # create the temporary file exclusively
+                outMode = outMode.replace("w", "x")
+
             try:
-                with open(outfile, "wb") as fOut:
-                    # encrypt file stream
-                    encryptStream(fIn, fOut, passw, bufferSize)
+                try:
+                    with open(outfile, outMode, opener=opener) as fOut:
+                        try:
+                            # process file stream
+                            func(fIn, fOut)
+                            if fsync:
+                                fOut.flush()
+                                os.fsync(fOut.fileno())
+                        except ValueError as exd:
+                            # should not remove output file here because it is still in use
+                            # re-raise exception
+                            raise ValueError(str(exd))
+                    if atomic:
+                        os.replace(outfile, target)
+                        if fsync:
+                            fsyncDir(path.dirname(target))
+                except BaseException:
+                    # remove temporary file on any error
+                    if atomic and path.exists(outfile):
+                        remove(outfile)
+                    raise
 
             except IOError:
                 raise ValueError("Unable to write output file.")
+            except ValueError as exd:
+                # remove output file on error
+                if removeOnError and not atomic:
+                    remove(outfile)
+                # re-raise exception
+                raise ValueError(str(exd))
 
     except IOError:
         raise ValueError("Unable to read input file.")
 
 
+# temporary path function
+# returns a random hidden file path in the directory of fpath
+def tempPath(fpath):
+    dirname, basename = path.split(fpath)
+    return path.join(dirname, "." + basename + "." + urandom(6).hex() + ".tmp")
+
+
+# directory fsync function
+# flushes directory entries (e.g. a rename) to disk, where supported
+def fsyncDir(dirname):
+    try:
+        fd = os.open(dirname or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # e.g. directories cannot be flushed on Windows
+        pass
+    finally:
+        os.close(fd)
+
+
 # encrypt binary stream function
 # arguments:
 # fIn: input binary stream
 # fOut: output binary stream
 # passw: encryption password
 # bufferSize: encryption buffer size, must be a multiple of
-#             AES block size (16)
+#             AES block size (16), or "auto" (see autoBufferSize)
 #             using a larger buffer speeds up things when dealing
 #             with long streams
-def encryptStream(fIn, fOut, passw, bufferSize=bufferSizeDef):
+# zeroCopy: read into and encrypt from preallocated buffers, which are
+#           reused for every chunk (fOut must not keep references to the
+#           objects passed to its write method)
+# observer: optional stats.Observer instance receiving progress and
+#           per-phase timings
+# pipeline: read and write in background threads, and compute the HMAC of
+#           each chunk in a background thread while the next chunk is
+#           being encrypted (cannot be used with zeroCopy)
+# compress: optional compression codec ("zlib", "lzma" or "zstd", which
+#           requires the zstandard package): the input is compressed before
+#           encryption and the codec is recorded in the header, so that
+#           decryptStream decompresses transparently
+def encryptStream(
+    fIn,
+    fOut,
+    passw,
+    bufferSize=bufferSizeDef,
+    zeroCopy=False,
+    observer=None,
+    pipeline=False,
+    compress=None,
+):
+    bufferSize = resolveBufferSize(bufferSize, fIn)
+
     # validate bufferSize
     if bufferSize % AESBlockSize != 0:
         raise ValueError("Buffer size must be a multiple of AES block size.")
 
+    if zeroCopy and pipeline:
+        raise ValueError("zeroCopy and pipeline cannot be used together.")
+
     if len(passw) > maxPassLen:
         raise ValueError("Password is too long.")
 
+    if compress is not None:
+        checkCodec(compress)
+
+    instrumentation = None
+    if observer is not None:
+        instrumentation = Instrumentation(observer)
+        fIn, fOut = instrumentation.begin(fIn, fOut)
+
     # generate external iv (used to encrypt the main iv and the
     # encryption key)
     iv1 = urandom(AESBlockSize)
 
     # stretch password and iv
-    key = stretch(passw, iv1)
+    key = timedCall(instrumentation, "stretch", stretch, passw, iv1)
 
-    # generate random main iv
-    iv0 = urandom(AESBlockSize)
+    encryptStreamKey(
+        fIn, fOut, iv1, key, bufferSize, zeroCopy, instrumentation, pipeline, compress
+    )
 
-    # generate random internal key
-    intKey = urandom(32)
+    if instrumentation is not None:
+        instrumentation.end()
+
+
+# encrypt binary stream with an already stretched key
+# arguments:
+# fIn: input binary stream
+# fOut: output binary stream
+# iv1: external iv
+# key: key obtained by stretching the password with iv1
+# bufferSize: encryption buffer size, must be a multiple of
+#             AES block size (16)
+# zeroCopy: use preallocated buffers (see encryptStream)
+# instrumentation: optional stats.Instrumentation instance timing the
+#                  AES and HMAC phases
+# pipeline: use background threads (see encryptStream)
+# compress: optional compression codec (see encryptStream)
+def encryptStreamKey(
+    fIn,
+    fOut,
+    iv1,
+    key,
+    bufferSize=bufferSizeDef,
+    zeroCopy=False,
+    instrumentation=None,
+    pipeline=False,
+    compress=None,
+):
+    # generate and encrypt random main iv and internal key
+    iv0, intKey, c_iv_key, hmac1 = newKeys(iv1, key)
 
     # instantiate AES cipher
     cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
-    encryptor0 = cipher0.encryptor()
+    encryptor0 = observed(instrumentation, cipher0.encryptor(), "aes")
 
     # instantiate HMAC-SHA256 for the ciphertext
     hmac0 = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+    hmac0 = observed(instrumentation, hmac0, "hmac")
 
-    # instantiate another AES cipher
-    cipher1 = Cipher(algorithms.AES(key), modes.CBC(iv1), backend=default_backend())
-    encryptor1 = cipher1.encryptor()
-
-    # encrypt main iv and key
-    c_iv_key = encryptor1.update(iv0 + intKey) + encryptor1.finalize()
-
-    # calculate HMAC-SHA256 of the encrypted iv and key
-    hmac1 = hmac.HMAC(key, hashes.SHA256(), backend=default_backend())
-    hmac1.update(c_iv_key)
+    if compress is not None:
+        # encrypt the compressed input, recording the codec in the header
+        fIn = CompressingReader(fIn, compress, bufferSize)
+        prefix = headerTemplate((compressionExtension(compress),))
+    else:
+        prefix = headerPrefix
 
     # write header
-    fOut.write(bytes("AES", "utf8"))
-
-    # write version (AES Crypt version 2 file format -
-    # see https://www.aescrypt.com/aes_file_format.html)
-    fOut.write(b"\x02")
-
-    # reserved byte (set to zero)
-    fOut.write(b"\x00")
-
-    # setup "CREATED-BY" extension
-    cby = "pyAesCrypt " + version
-
-    # write "CREATED-BY" extension length
-    fOut.write(b"\x00" + bytes([1 + len("CREATED_BY" + cby)]))
-
-    # write "CREATED-BY" extension
-    fOut.write(bytes("CREATED_BY", "utf8") + b"\x00" + bytes(cby, "utf8"))
+    writeHeader(fOut, iv1, c_iv_key, hmac1, prefix)
 
-    # write "container" extension length
-    fOut.write(b"\x00\x80")
+    if zeroCopy:
+        encryptPayloadInto(fIn, fOut, encryptor0, hmac0, bufferSize)
+        return
 
-    # write "container" extension
-    for i in range(128):
-        fOut.write(b"\x00")
-
-    # write end-of-extensions tag
-    fOut.write(b"\x00\x00")
-
-    # write the iv used to encrypt the main iv and the
-    # encryption key
-    fOut.write(iv1)
-
-    # write encrypted main iv and key
-    fOut.write(c_iv_key)
-
-    # write HMAC-SHA256 of the encrypted iv and key
-    fOut.write(hmac1.finalize())
+    if pipeline:
+        encryptPayloadPipelined(fIn, fOut, encryptor0, hmac0, bufferSize)
+        return
 
     # encrypt file while reading it
     while True:
@@ -234,44 +631,574 @@ def encryptStream(fIn, fOut, passw, bufferSize=bufferSizeDef):
     fOut.write(hmac0.finalize())
 
 
+# read into buffer function
+# fills view by calling fIn.readinto until view is full or EOF is reached
+# returns: the number of bytes read
+def readFull(fIn, view):
+    nread = 0
+    size = len(view)
+    while nread < size:
+        n = fIn.readinto(view[nread:])
+        if not n:
+            break
+        nread += n
+    return nread
+
+
+# zero-copy payload encryption function
+# encrypts fIn using preallocated buffers, reused for every chunk, then
+# writes the trailer
+# arguments:
+# fIn: input binary stream
+# fOut: output binary stream
+# encryptor0: AES encryptor for the payload
+# hmac0: HMAC-SHA256 for the ciphertext
+# bufferSize: encryption buffer size, must be a multiple of
+#             AES block size (16)
+def encryptPayloadInto(fIn, fOut, encryptor0, hmac0, bufferSize):
+    fIn = getBufferableFileobj(fIn)
+
+    # input buffer and output buffer
+    # (update_into requires block size - 1 bytes of room)
+    inView = memoryview(bytearray(bufferSize))
+    outView = memoryview(bytearray(bufferSize + AESBlockSize - 1))
+
+    # encrypt file while reading it
+    while True:
+        # try to read bufferSize bytes
+        bytesRead = readFull(fIn, inView)
+
+        # check if EOF was reached
+        if bytesRead < bufferSize:
+            # file size mod 16, lsb positions
+            fs16 = bytesRead % AESBlockSize
+            # pad data (this is NOT PKCS#7!)
+            # ...unless no bytes or a multiple of a block size
+            # of bytes was read
+            if fs16 == 0:
+                padLen = 0
+            else:
+                padLen = 16 - fs16
+            inView[bytesRead : bytesRead + padLen] = bytes([padLen]) * padLen
+            # encrypt data
+            n = encryptor0.update_into(inView[: bytesRead + padLen], outView)
+            encryptor0.finalize()
+        else:
+            # encrypt data
+            n = encryptor0.update_into(inView, outView)
+
+        # update HMAC
+        hmac0.update(outView[:n])
+        # write encrypted file content
+        fOut.write(outView[:n])
+
+        if bytesRead < bufferSize:
+            break
+
+    # write plaintext file size mod 16 lsb positions
+    fOut.write(bytes([fs16]))
+
+    # write HMAC-SHA256 of the encrypted file
+    fOut.write(hmac0.finalize())
+
+
+# pipelined payload encryption function
+# encrypts fIn, then writes the trailer; reading, HMAC computation and
+# writing happen in background threads, so that the HMAC of a chunk is
+# computed (and the chunk written) while the next chunk is being
+# encrypted
+# arguments:
+# fIn: input binary stream
+# fOut: output binary stream
+# encryptor0: AES encryptor for the payload
+# hmac0: HMAC-SHA256 for the ciphertext
+# bufferSize: encryption buffer size, must be a multiple of
+#             AES block size (16)
+def encryptPayloadPipelined(fIn, fOut, encryptor0, hmac0, bufferSize):
+    reader = PipelineReader(fIn, bufferSize)
+    hmacStage = PipelineStage(hmac0.update)
+    writer = PipelineStage(fOut.write)
+    try:
+        # encrypt file while reading it
+        while True:
+            fdata = reader.get()
+            bytesRead = len(fdata)
+
+            # check if EOF was reached
+            if bytesRead < bufferSize:
+                # file size mod 16, lsb positions
+                fs16 = bytes([bytesRead % AESBlockSize])
+                # pad data (this is NOT PKCS#7!)
+                # ...unless no bytes or a multiple of a block size
+                # of bytes was read
+                if bytesRead % AESBlockSize == 0:
+                    padLen = 0
+                else:
+                    padLen = 16 - bytesRead % AESBlockSize
+                fdata += bytes([padLen]) * padLen
+                # encrypt data
+                cText = encryptor0.update(fdata) + encryptor0.finalize()
+            else:
+                # encrypt data
+                cText = encryptor0.update(fdata)
+
+            # update HMAC and write encrypted file content
+            # (in the background)
+            hmacStage.put(cText)
+            writer.put(cText)
+
+            if bytesRead < bufferSize:
+                break
+
+        # wait for the HMAC of the last chunk
+        hmacStage.close()
+
+        # write plaintext file size mod 16 lsb positions
+        writer.put(fs16)
+
+        # write HMAC-SHA256 of the encrypted file
+        writer.put(hmac0.finalize())
+
+        writer.close()
+    finally:
+        stopPipeline(reader, hmacStage, writer)
+
+
+# new keys function
+# generates random main iv and internal key, and encrypts them
+# with the stretched key
+# arguments:
+# iv1: external iv
+# key: key obtained by stretching the password with iv1
+# returns: (main iv, internal key, encrypted main iv and key,
+#           HMAC-SHA256 of the encrypted main iv and key)
+def newKeys(iv1, key):
+    # generate random main iv
+    iv0 = urandom(AESBlockSize)
+
+    # generate random internal key
+    intKey = urandom(32)
+
+    # instantiate another AES cipher
+    cipher1 = Cipher(algorithms.AES(key), modes.CBC(iv1), backend=default_backend())
+    encryptor1 = cipher1.encryptor()
+
+    # encrypt main iv and key
+    c_iv_key = encryptor1.update(iv0 + intKey) + encryptor1.finalize()
+
+    # calculate HMAC-SHA256 of the encrypted iv and key
+    hmac1 = hmac.HMAC(key, hashes.SHA256(), backend=default_backend())
+    hmac1.update(c_iv_key)
+
+    return iv0, intKey, c_iv_key, hmac1.finalize()
+
+
+# header template function
+# builds the fixed part of the AES Crypt v2 header written by pyAesCrypt
+# (see https://www.aescrypt.com/aes_file_format.html): file format
+# version 2, "CREATED_BY" extension, additional extensions, 128-byte
+# "container" extension and end-of-extensions tag
+# arguments:
+# extensions: additional extensions, as (identifier, contents) pairs
+def headerTemplate(extensions=()):
+    # setup "CREATED-BY" extension
+    cby = bytes("CREATED_BY", "utf8") + b"\x00" + bytes("pyAesCrypt " + version, "utf8")
+
+    # setup additional extensions
+    exts = b""
+    for identifier, contents in extensions:
+        ext = bytes(identifier, "utf8") + b"\x00" + contents
+        exts += len(ext).to_bytes(2, byteorder="big") + ext
+
+    return (
+        # header, version and reserved byte (set to zero)
+        bytes("AES", "utf8")
+        + b"\x02"
+        + b"\x00"
+        # "CREATED-BY" extension length and extension
+        + len(cby).to_bytes(2, byteorder="big")
+        + cby
+        # additional extensions
+        + exts
+        # "container" extension length and extension
+        + b"\x00\x80"
+        + bytes(128)
+        # end-of-extensions tag
+        + b"\x00\x00"
+    )
+
+
+# fixed part of the header, built once
+headerPrefix = headerTemplate()
+
+
+# build AES Crypt v2 header function
+# arguments:
+# iv1: external iv
+# c_iv_key: encrypted main iv and key
+# hmac1: HMAC-SHA256 of c_iv_key
+# prefix: fixed part of the header (see headerTemplate)
+# returns: the whole header, as a single bytes object
+def buildHeader(iv1, c_iv_key, hmac1, prefix=headerPrefix):
+    # the iv used to encrypt the main iv and the encryption key,
+    # the encrypted main iv and key and their HMAC-SHA256
+    return b"".join((prefix, iv1, c_iv_key, hmac1))
+
+
+# write AES Crypt v2 header function
+# writes the header with a single write call
+# arguments:
+# fOut: output binary stream
+# iv1: external iv
+# c_iv_key: encrypted main iv and key
+# hmac1: HMAC-SHA256 of c_iv_key
+# prefix: fixed part of the header (see headerTemplate)
+def writeHeader(fOut, iv1, c_iv_key, hmac1, prefix=headerPrefix):
+    fOut.write(buildHeader(iv1, c_iv_key, hmac1, prefix))
+
+
+# payload encryptor class
+# Encrypts the payload of an AES Crypt v2 file pushed in chunks of any size.
+# update() returns the ciphertext available so far, finalize() returns the
+# last (padded) ciphertext block followed by the trailer (plaintext size
+# mod 16 and HMAC-SHA256 of the ciphertext).
+# arguments:
+# iv0: main iv
+# intKey: internal key
+class PayloadEncryptor:
+    def __init__(self, iv0, intKey):
+        # instantiate AES cipher
+        cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
+        self.__encryptor0 = cipher0.encryptor()
+
+        # instantiate HMAC-SHA256 for the ciphertext
+        self.__hmac0 = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+
+        # plaintext size mod 16
+        self.__fs16 = 0
+
+    def update(self, data):
+        self.__fs16 = (self.__fs16 + len(data)) % AESBlockSize
+        cText = self.__encryptor0.update(data)
+        self.__hmac0.update(cText)
+        return cText
+
+    def finalize(self):
+        # pad data (this is NOT PKCS#7!)
+        # ...unless no bytes or a multiple of a block size
+        # of bytes was pushed
+        if self.__fs16 == 0:
+            padLen = 0
+        else:
+            padLen = 16 - self.__fs16
+        cText = self.__encryptor0.update(bytes([padLen]) * padLen)
+        cText += self.__encryptor0.finalize()
+        self.__hmac0.update(cText)
+        return cText + bytes([self.__fs16]) + self.__hmac0.finalize()
+
+
+# number of payload bytes held back by PayloadDecryptor:
+# last ciphertext block, plaintext size mod 16 and HMAC-SHA256
+payloadHoldback = AESBlockSize + 1 + 32
+
+
+# payload decryptor class
+# Decrypts the payload of an AES Crypt v2 file pushed in chunks of any size.
+# The last ciphertext block and the trailer are held back until finalize(),
+# which strips the padding and checks the HMAC.
+# NOTE: as with decryptStream, plaintext is returned before the HMAC
+# is checked, so it must not be trusted until finalize() returns.
+# arguments:
+# iv0: main iv
+# intKey: internal key
+class PayloadDecryptor:
+    def __init__(self, iv0, intKey):
+        # instantiate AES cipher
+        cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
+        self.__decryptor0 = cipher0.decryptor()
+
+        # instantiate actual HMAC-SHA256 of the ciphertext
+        self.__hmac0Act = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+
+        # held back bytes
+        self.__tail = b""
+
+    def update(self, data):
+        if len(data) >= payloadHoldback:
+            cText = self.__tail + data[:-payloadHoldback]
+            self.__tail = bytes(data[-payloadHoldback:])
+        else:
+            buf = self.__tail + data
+            cText = buf[:-payloadHoldback]
+            self.__tail = buf[-payloadHoldback:]
+        # update HMAC
+        self.__hmac0Act.update(cText)
+        # decrypt data
+        return self.__decryptor0.update(cText)
+
+    def finalize(self):
+        tail = self.__tail
+        if len(tail) < 32 + 1:
+            raise ValueError("File is corrupted.")
+        cText = tail[: -32 - 1]
+        fs16 = tail[-32 - 1]  # plaintext file size mod 16 lsb positions
+        hmac0 = tail[-32:]
+
+        # update HMAC
+        self.__hmac0Act.update(cText)
+        # decrypt data
+        pText = self.__decryptor0.update(cText)
+
+        # remove padding
+        toremove = (16 - fs16) % 16
+        if toremove:
+            pText = pText[:-toremove]
+
+        # HMAC check
+        if hmac0 != self.__hmac0Act.finalize():
+            raise ValueError("Bad HMAC (file is corrupted).")
+
+        return pText
+
+
+# payload decryptor function
+# returns: the push-style decryptor of the payload of the file described
+#          by hdr (ChunkedDecryptor for chunked files, PayloadDecryptor
+#          otherwise), both with update(data) and finalize() methods
+# arguments:
+# hdr: Header instance
+# iv0: main iv
+# intKey: internal key
+def payloadDecryptor(hdr, iv0, intKey):
+    chunkSize = hdr.chunkSize
+    if chunkSize is not None:
+        encKey, macKey = chunkKeys(intKey)
+        return ChunkedDecryptor(encKey, macKey, chunkSize)
+    return PayloadDecryptor(iv0, intKey)
+
+
+# encrypted size function
+# returns the size of the AES Crypt v2 file written by pyAesCrypt for
+# a plaintext of the given size
+# arguments:
+# size: plaintext size
+# headerSize: header size
+def encryptedSize(size, headerSize):
+    # header + padded payload + plaintext size mod 16 + HMAC-SHA256
+    return headerSize + -(-size // AESBlockSize) * AESBlockSize + 1 + 32
+
+
+# memory-mapped file encryption function
+# encrypts a file into a preallocated output file, both memory-mapped
+# arguments:
+# fIn: input file (opened in binary read mode)
+# fOut: output file (opened in binary read/write mode)
+# iv1: external iv
+# key: key obtained by stretching the password with iv1
+# bufferSize: encryption buffer size, must be a multiple of
+#             AES block size (16)
+def encryptMmap(fIn, fOut, iv1, key, bufferSize=bufferSizeDef):
+    size = os.fstat(fIn.fileno()).st_size
+
+    # empty files cannot be mapped
+    if size == 0:
+        encryptStreamKey(fIn, fOut, iv1, key, bufferSize)
+        return
+
+    # generate and encrypt random main iv and internal key
+    iv0, intKey, c_iv_key, hmac1 = newKeys(iv1, key)
+
+    # instantiate AES cipher
+    cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
+    encryptor0 = cipher0.encryptor()
+
+    # instantiate HMAC-SHA256 for the ciphertext
+    hmac0 = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+
+    # build header
+    header = buildHeader(iv1, c_iv_key, hmac1)
+
+    # preallocate output file
+    outSize = encryptedSize(size, len(header))
+    fOut.truncate(outSize)
+
+    with mmap.mmap(fIn.fileno(), 0, access=mmap.ACCESS_READ) as inMap, mmap.mmap(
+        fOut.fileno(), outSize
+    ) as outMap:
+        with memoryview(inMap) as inView, memoryview(outMap) as outView:
+            # write header
+            outView[: len(header)] = header
+            pos = len(header)
+
+            # encrypt whole blocks directly into the output file
+            # (there is always room for update_into after them:
+            # at least the trailer)
+            fs16 = size % AESBlockSize
+            full = size - fs16
+            for off in range(0, full, bufferSize):
+                n = min(bufferSize, full - off)
+                n = encryptor0.update_into(
+                    inView[off : off + n], outView[pos : pos + n + AESBlockSize - 1]
+                )
+                hmac0.update(outView[pos : pos + n])
+                pos += n
+
+            # pad and encrypt last partial block (this is NOT PKCS#7!)
+            if fs16:
+                padLen = 16 - fs16
+                cText = encryptor0.update(bytes(inView[full:]) + bytes([padLen]) * padLen)
+                outView[pos : pos + AESBlockSize] = cText
+                hmac0.update(cText)
+                pos += AESBlockSize
+            encryptor0.finalize()
+
+            # write plaintext file size mod 16 lsb positions
+            outView[pos] = fs16
+
+            # write HMAC-SHA256 of the encrypted file
+            outView[pos + 1 :] = hmac0.finalize()
+
+
 # decrypt file function
 # arguments:
 # infile: ciphertext file path
 # outfile: plaintext file path
 # passw: encryption password
-# bufferSize: optional buffer size, must be a multiple of AES block size (16)
+# bufferSize: optional buffer size, must be a multiple of AES block size (16),
+#             or "auto" (see autoBufferSize)
 #             using a larger buffer speeds up things when dealing with
 #             big files
-#             Default is 64KB.
-def decryptFile(infile, outfile, passw, bufferSize=bufferSizeDef):
-    try:
-        with open(infile, "rb") as fIn:
-            # check that output file does not exist
-            # or that, if exists, is not the same as the input file
-            # (i.e.: overwrite if it seems safe)
-            if path.isfile(outfile):
-                if path.samefile(infile, outfile):
-                    raise ValueError("Input and output files are the same.")
-            try:
-                with open(outfile, "wb") as fOut:
-                    try:
-                        # decrypt file stream
-                        decryptStream(fIn, fOut, passw, bufferSize)
-                    except ValueError as exd:
-                        # should not remove output file here because it is still in use
-                        # re-raise exception
-                        raise ValueError(str(exd))
-
-            except IOError:
-                raise ValueError("Unable to write output file.")
-            except ValueError as exd:
-                # remove output file on error
-                remove(outfile)
-                # re-raise exception
-                raise ValueError(str(exd))
-
-    except IOError:
-        raise ValueError("Unable to read input file.")
+#             Default is "auto".
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# workers: number of parallel decryption workers; if greater than 1,
+#          the payload is decrypted in segments by a pool of workers
+#          (see decryptStreamParallel)
+# useProcesses: use a process pool instead of a thread pool for the
+#               parallel decryption workers
+# useMmap: memory-map the input file and the (preallocated) output file
+#          (ignored if workers is greater than 1)
+# (compressed files are decrypted as a stream, ignoring workers, useMmap
+# and useFd; they cannot be decrypted with directIO)
+# (chunked files are decrypted chunk by chunk, by workers in parallel,
+# ignoring useMmap and useFd; they cannot be decrypted with directIO)
+# observer: optional stats.Observer instance receiving progress and
+#           per-phase timings (not supported with useMmap or workers > 1)
+# useFd: write the output file through its file descriptor, with
+#        positional writes from an aligned buffer, after preallocating it
+#        (ignored if workers is greater than 1 or useMmap is set)
+# directIO: like useFd, but open the output file with O_DIRECT, bypassing
+#           the page cache (Linux only)
+# atomic: write to a temporary file in the output directory, renamed to
+#         outfile once decrypted and authenticated (an existing outfile is
+#         left untouched on errors)
+# fsync: flush the output file to disk before returning
+# pipeline: overlap reading, decryption, HMAC computation and writing
+#           using background threads (see decryptStream; ignored with
+#           workers > 1, useMmap, useFd or directIO)
+def decryptFile(
+    infile,
+    outfile,
+    passw,
+    bufferSize="auto",
+    keyCache=None,
+    workers=1,
+    useProcesses=False,
+    useMmap=False,
+    observer=None,
+    useFd=False,
+    directIO=False,
+    atomic=False,
+    fsync=False,
+    pipeline=False,
+):
+    if observer is not None and (workers > 1 or useMmap):
+        raise ValueError("An observer cannot be used with useMmap or workers > 1.")
+
+    outMode = "wb"
+    opener = None
+
+    if workers > 1:
+
+        def func(fIn, fOut):
+            decryptStreamParallel(
+                fIn,
+                fOut,
+                passw,
+                workers,
+                keyCache=keyCache,
+                useProcesses=useProcesses,
+            )
+
+    elif useMmap:
+
+        def func(fIn, fOut):
+            decryptMmap(fIn, fOut, passw, bufferSize, keyCache=keyCache)
+
+        outMode = "w+b"
+
+    elif useFd or directIO:
+        if observer is not None:
+            raise ValueError("An observer cannot be used with useFd or directIO.")
+
+        def func(fIn, fOut):
+            decryptToFd(fIn, fOut, passw, bufferSize, keyCache, directIO)
+
+        if directIO:
+            if not hasattr(os, "O_DIRECT"):
+                raise ValueError("Direct I/O is not supported on this platform.")
+
+            def opener(fpath, flags):
+                return os.open(fpath, flags | os.O_DIRECT, 0o666)
+
+    else:
+
+        def func(fIn, fOut):
+            decryptStream(
+                fIn,
+                fOut,
+                passw,
+                bufferSize,
+                keyCache=keyCache,
+                zeroCopy=not pipeline,
+                observer=observer,
+                pipeline=pipeline,
+            )
+
+    if workers > 1 or useMmap or (useFd and not directIO):
+        # chunked files are decrypted chunk by chunk (in parallel, if
+        # workers > 1), compressed files can only be decrypted as a stream
+        fastFunc = func
+
+        def func(fIn, fOut):
+            hdr = parseHeader(fIn)
+            fIn.seek(0)
+            if hdr.chunkSize is not None:
+                decryptStreamChunked(
+                    fIn,
+                    fOut,
+                    passw,
+                    keyCache=keyCache,
+                    workers=workers,
+                    useProcesses=useProcesses,
+                )
+            elif hdr.compression is None:
+                fastFunc(fIn, fOut)
+            else:
+                decryptStream(
+                    fIn, fOut, passw, bufferSize, keyCache=keyCache, zeroCopy=True
+                )
+
+    processFiles(
+        infile,
+        outfile,
+        func,
+        removeOnError=True,
+        outMode=outMode,
+        opener=opener,
+        atomic=atomic,
+        fsync=fsync,
+    )
 
 
 # decrypt stream function
@@ -279,131 +1206,1966 @@ def decryptFile(infile, outfile, passw, bufferSize=bufferSizeDef):
 # fIn: input binary stream
 # fOut: output binary stream
 # passw: encryption password
-# bufferSize: decryption buffer size, must be a multiple of AES block size (16)
+# bufferSize: decryption buffer size, must be a multiple of AES block size (16),
+#             or "auto" (see autoBufferSize)
 #             using a larger buffer speeds up things when dealing with
 #             long streams
 # inputLength: input stream length (DEPRECATED)
-def decryptStream(fIn, fOut, passw, bufferSize=bufferSizeDef, inputLength=None):
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# zeroCopy: read into and decrypt from preallocated buffers, which are
+#           reused for every chunk (fOut must not keep references to the
+#           objects passed to its write method)
+# observer: optional stats.Observer instance receiving progress and
+#           per-phase timings
+# pipeline: read and write in background threads, and compute the HMAC of
+#           each chunk in a background thread while it is being decrypted
+#           (cannot be used with zeroCopy)
+def decryptStream(
+    fIn,
+    fOut,
+    passw,
+    bufferSize=bufferSizeDef,
+    inputLength=None,
+    keyCache=None,
+    zeroCopy=False,
+    observer=None,
+    pipeline=False,
+):
     if inputLength is not None:
         warnings.warn(
             "inputLength parameter is no longer used, and might be removed in a future version",
             DeprecationWarning,
             stacklevel=2,
         )
+    bufferSize = resolveBufferSize(bufferSize, fIn)
+
     # validate bufferSize
     if bufferSize % AESBlockSize != 0:
         raise ValueError("Buffer size must be a multiple of AES block size")
 
+    if zeroCopy and pipeline:
+        raise ValueError("zeroCopy and pipeline cannot be used together.")
+
     if len(passw) > maxPassLen:
         raise ValueError("Password is too long.")
 
-    if not hasattr(fIn, "peek"):
-        fIn = io.BufferedReader(getBufferableFileobj(fIn), bufferSize)
-
-    fdata = fIn.read(3)
-    # check if file is in AES Crypt format (also min length check)
-    if fdata != b"AES":
-        raise ValueError("File is corrupted or not an AES Crypt (or pyAesCrypt) file.")
-
-    # check if file is in AES Crypt format, version 2
-    # (the only one compatible with pyAesCrypt)
-    fdata = fIn.read(1)
-    if len(fdata) != 1:
-        raise ValueError("File is corrupted.")
-
-    if fdata != b"\x02":
-        raise ValueError(
-            "pyAesCrypt is only compatible with version "
-            "2 of the AES Crypt file format."
+    instrumentation = None
+    if observer is not None:
+        instrumentation = Instrumentation(observer)
+        fIn, fOut = instrumentation.begin(fIn, fOut)
+        if not zeroCopy and not pipeline and not hasattr(fIn, "peek"):
+            # use the peek loop, whose AES and HMAC phases can be timed
+            fIn = io.BufferedReader(getBufferableFileobj(fIn), bufferSize)
+
+    if zeroCopy:
+        # no need for peek: the trailer is held back in the buffer
+        fIn = getBufferableFileobj(fIn)
+    elif not pipeline and not hasattr(fIn, "peek"):
+        # no need for an extra buffering layer: push data into a
+        # StreamDecryptor, which holds back the trailer itself
+        decryptor = StreamDecryptor(passw, keyCache)
+        while True:
+            cText = fIn.read(bufferSize)
+            if not cText:
+                break
+            pText = decryptor.feed(cText)
+            if pText:
+                fOut.write(pText)
+        fOut.write(decryptor.finalize())
+        return
+
+    # parse header
+    hdr = parseHeader(fIn)
+
+    # stretch password and iv (or get the key from the cache)
+    key = timedCall(instrumentation, "stretch", getKey, passw, hdr.iv1, keyCache)
+
+    # check password and get internal iv and key
+    iv0, intKey = decryptKeys(key, hdr)
+
+    # decompress transparently, if the header records a codec
+    codec = hdr.compression
+    if codec is not None:
+        fOut = DecompressingWriter(fOut, codec)
+
+    # chunked containers are decrypted record by record
+    chunkSize = hdr.chunkSize
+    if chunkSize is not None:
+        encKey, macKey = chunkKeys(intKey)
+        runChunkJobs(
+            decryptChunk,
+            decryptChunkJobs(fIn, encKey, macKey, chunkSize),
+            fOut.write,
         )
+        if codec is not None:
+            fOut.finish()
+        if instrumentation is not None:
+            instrumentation.end()
+        return
 
-    # skip reserved byte
-    fIn.read(1)
+    # instantiate another AES cipher
+    cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
+    decryptor0 = observed(instrumentation, cipher0.decryptor(), "aes")
 
-    # skip all the extensions
-    while True:
-        fdata = fIn.read(2)
-        if len(fdata) != 2:
-            raise ValueError("File is corrupted.")
-        if fdata == b"\x00\x00":
-            break
-        fIn.read(int.from_bytes(fdata, byteorder="big"))
+    # instantiate actual HMAC-SHA256 of the ciphertext
+    hmac0Act = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+    hmac0Act = observed(instrumentation, hmac0Act, "hmac")
 
-    # read external iv
-    iv1 = fIn.read(16)
-    if len(iv1) != 16:
-        raise ValueError("File is corrupted.")
+    if zeroCopy or pipeline:
+        if zeroCopy:
+            decryptPayloadInto(fIn, fOut, decryptor0, hmac0Act, bufferSize)
+        else:
+            decryptPayloadPipelined(fIn, fOut, decryptor0, hmac0Act, bufferSize)
+        if codec is not None:
+            fOut.finish()
+        if instrumentation is not None:
+            instrumentation.end()
+        return
 
-    # stretch password and iv
-    key = stretch(passw, iv1)
+    # decrypt ciphertext, until last block is reached
+    last_block_reached = False
+    while not last_block_reached:
+        # read data
+        cText = fIn.read(bufferSize)
+
+        # end of buffer
+        if len(fIn.peek(32 + 1)) < 32 + 1:
+            last_block_reached = True
+            cText += fIn.read()
+            fs16 = cText[-32 - 1]  # plaintext file size mod 16 lsb positions
+            hmac0 = cText[-32:]
+            cText = cText[: -32 - 1]
+
+        # update HMAC
+        hmac0Act.update(cText)
+        # decrypt data and write it to output file
+        pText = decryptor0.update(cText)
+
+        # remove padding
+        if last_block_reached:
+            toremove = (16 - fs16) % 16
+            if toremove:
+                pText = pText[:-toremove]
+
+        fOut.write(pText)
+
+    # HMAC check
+    if hmac0 != hmac0Act.finalize():
+        raise ValueError("Bad HMAC (file is corrupted).")
+
+    if codec is not None:
+        fOut.finish()
+
+    if instrumentation is not None:
+        instrumentation.end()
+
+
+# zero-copy payload decryption function
+# decrypts fIn using preallocated buffers, reused for every chunk:
+# the trailer (and last ciphertext block) is held back at the end of the
+# input buffer and moved to its start before reading the next chunk
+# arguments:
+# fIn: input binary stream (with readinto method)
+# fOut: output binary stream
+# decryptor0: AES decryptor for the payload
+# hmac0Act: actual HMAC-SHA256 of the ciphertext
+# bufferSize: decryption buffer size, must be a multiple of
+#             AES block size (16)
+def decryptPayloadInto(fIn, fOut, decryptor0, hmac0Act, bufferSize):
+    # input buffer and output buffer
+    # (update_into requires block size - 1 bytes of room)
+    inBuf = bytearray(bufferSize + payloadHoldback)
+    inView = memoryview(inBuf)
+    outView = memoryview(bytearray(len(inBuf) + AESBlockSize - 1))
+
+    # decrypt ciphertext, until last block is reached
+    held = 0
+    while True:
+        # read data after held back bytes
+        total = held + readFull(fIn, inView[held:])
+
+        # end of stream
+        if total < len(inBuf):
+            break
+
+        # update HMAC
+        hmac0Act.update(inView[:bufferSize])
+        # decrypt data and write it to output file
+        n = decryptor0.update_into(inView[:bufferSize], outView)
+        fOut.write(outView[:n])
+
+        # move held back bytes to the start of the buffer
+        # (memoryview assignment handles overlapping regions)
+        inView[:payloadHoldback] = inView[bufferSize:total]
+        held = payloadHoldback
+
+    if total < 32 + 1:
+        raise ValueError("File is corrupted.")
+    cLen = total - 32 - 1
+    fs16 = inBuf[cLen]  # plaintext file size mod 16 lsb positions
+    hmac0 = bytes(inView[cLen + 1 : total])
+
+    # update HMAC
+    hmac0Act.update(inView[:cLen])
+    # decrypt data
+    n = decryptor0.update_into(inView[:cLen], outView)
+
+    # remove padding
+    toremove = (16 - fs16) % 16
+    fOut.write(outView[: max(n - toremove, 0)])
+
+    # HMAC check
+    if hmac0 != hmac0Act.finalize():
+        raise ValueError("Bad HMAC (file is corrupted).")
+
+
+# pipelined payload decryption function
+# decrypts fIn; reading, HMAC computation and writing happen in
+# background threads, so that the HMAC of a chunk is computed while the
+# chunk is being decrypted (and the previous plaintext chunk written)
+# arguments:
+# fIn: input binary stream
+# fOut: output binary stream
+# decryptor0: AES decryptor for the payload
+# hmac0Act: actual HMAC-SHA256 of the ciphertext
+# bufferSize: decryption buffer size, must be a multiple of
+#             AES block size (16)
+def decryptPayloadPipelined(fIn, fOut, decryptor0, hmac0Act, bufferSize):
+    reader = PipelineReader(fIn, bufferSize)
+    hmacStage = PipelineStage(hmac0Act.update)
+    writer = PipelineStage(fOut.write)
+    try:
+        # chunks not processed yet: the trailer (plaintext size mod 16
+        # and HMAC-SHA256) is always held back
+        pending = deque()
+        held = 0
+        # last plaintext chunk, held back to remove padding
+        pText = b""
+
+        # decrypt ciphertext, until the end of stream is reached
+        while True:
+            cText = reader.get()
+            if not cText:
+                break
+            pending.append(memoryview(cText))
+            held += len(cText)
+
+            # process everything but the trailer
+            n = held - 32 - 1
+            while n > 0:
+                chunk = pending[0]
+                if len(chunk) > n:
+                    pending[0] = chunk[n:]
+                    chunk = chunk[:n]
+                else:
+                    pending.popleft()
+                n -= len(chunk)
+                held -= len(chunk)
+
+                # update HMAC (in the background)
+                hmacStage.put(chunk)
+                # decrypt data
+                out = decryptor0.update(chunk)
+                if out:
+                    # write the previous plaintext chunk (in the background)
+                    if pText:
+                        writer.put(pText)
+                    pText = out
+
+        if held < 32 + 1:
+            raise ValueError("File is corrupted.")
+        trailer = b"".join(pending)
+        fs16 = trailer[0]  # plaintext file size mod 16 lsb positions
+        hmac0 = trailer[1:]
+
+        # remove padding
+        toremove = (16 - fs16) % 16
+        if toremove:
+            pText = pText[:-toremove]
+        writer.put(pText)
+
+        # HMAC check
+        hmacStage.close()
+        if hmac0 != hmac0Act.finalize():
+            raise ValueError("Bad HMAC (file is corrupted).")
+
+        writer.close()
+    finally:
+        stopPipeline(reader, hmacStage, writer)
+
+
+# file descriptor decryption function
+# decrypts a file writing the plaintext with positional writes to the file
+# descriptor of fOut, from a page-aligned buffer: the plaintext size is
+# computed from the input size and the plaintext size mod 16 byte, so
+# that the output file can be preallocated (where posix_fallocate is
+# available)
+# arguments:
+# fIn: input file (opened in binary read mode)
+# fOut: output file (opened in binary write mode; it is not written
+#       through, only its file descriptor is used)
+# passw: encryption password
+# bufferSize: decryption buffer size, must be a multiple of
+#             AES block size (16), or "auto" (see autoBufferSize)
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# directIO: fOut was opened with O_DIRECT (the buffer size is rounded up to
+#           a multiple of directIOAlignment, and so is the last write, then
+#           the file is truncated to the plaintext size)
+def decryptToFd(
+    fIn, fOut, passw, bufferSize=bufferSizeDef, keyCache=None, directIO=False
+):
+    bufferSize = resolveBufferSize(bufferSize, fIn)
+
+    # validate bufferSize
+    if bufferSize % AESBlockSize != 0:
+        raise ValueError("Buffer size must be a multiple of AES block size")
+
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    if directIO:
+        bufferSize = -(-bufferSize // directIOAlignment) * directIOAlignment
+
+    fd = fOut.fileno()
+
+    # parse header and get payload size from the stream size
+    hdr = readHeader(fIn)
+    checkPlainPayload(hdr)
+    payloadStart = fIn.tell()
+
+    # read plaintext file size mod 16 lsb positions and HMAC of the ciphertext
+    fs16, hmac0 = readTrailer(fIn, hdr, payloadStart)
+
+    # stretch password and iv (or get the key from the cache)
+    key = getKey(passw, hdr.iv1, keyCache)
+
+    # check password and get internal iv and key
+    iv0, intKey = decryptKeys(key, hdr)
+
+    # preallocate output file
+    size = max(hdr.payloadSize - (16 - fs16) % 16, 0)
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            # e.g. not supported by the file system
+            pass
+
+    # instantiate AES cipher
+    cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
+    decryptor0 = cipher0.decryptor()
+
+    # instantiate actual HMAC-SHA256 of the ciphertext
+    hmac0Act = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+
+    # input buffer and page-aligned output buffer
+    # (update_into requires block size - 1 bytes of room)
+    inView = memoryview(bytearray(bufferSize))
+    outMap = mmap.mmap(-1, bufferSize + AESBlockSize)
+    outView = memoryview(outMap)
+    try:
+        pos = 0
+        remaining = hdr.payloadSize
+        while remaining:
+            # read ciphertext
+            cLen = min(bufferSize, remaining)
+            if readFull(fIn, inView[:cLen]) < cLen:
+                raise ValueError("File is corrupted.")
+            remaining -= cLen
+
+            # update HMAC
+            hmac0Act.update(inView[:cLen])
+            # decrypt data
+            n = decryptor0.update_into(inView[:cLen], outView)
+
+            # remove padding
+            n = min(n, size - pos)
+
+            # write plaintext
+            wLen = n
+            if directIO and wLen % directIOAlignment:
+                # only whole aligned blocks can be written: pad with zeros
+                # (the file is truncated afterwards)
+                wLen = -(-wLen // directIOAlignment) * directIOAlignment
+                outView[n:wLen] = bytes(wLen - n)
+            writeAt(fd, outView[:wLen], pos)
+            pos += n
+        decryptor0.finalize()
+    finally:
+        outView.release()
+        outMap.close()
+
+    if directIO:
+        os.ftruncate(fd, size)
+
+    # HMAC check
+    if hmac0 != hmac0Act.finalize():
+        raise ValueError("Bad HMAC (file is corrupted).")
+
+
+# positional write function
+# writes the whole view to the file descriptor fd at offset, without
+# moving the file position (where pwritev/pwrite are available)
+def writeAt(fd, view, offset):
+    while len(view):
+        if hasattr(os, "pwritev"):
+            n = os.pwritev(fd, [view], offset)
+        elif hasattr(os, "pwrite"):
+            n = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            n = os.write(fd, view)
+        view = view[n:]
+        offset += n
+
+
+# memory-mapped file decryption function
+# decrypts a memory-mapped file into a preallocated output file, whose
+# size is computed from the input size and the plaintext size mod 16 byte
+# arguments:
+# fIn: input file (opened in binary read mode)
+# fOut: output file (opened in binary read/write mode)
+# passw: encryption password
+# bufferSize: decryption buffer size, must be a multiple of
+#             AES block size (16)
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+def decryptMmap(fIn, fOut, passw, bufferSize=bufferSizeDef, keyCache=None):
+    bufferSize = resolveBufferSize(bufferSize, fIn)
+
+    # validate bufferSize
+    if bufferSize % AESBlockSize != 0:
+        raise ValueError("Buffer size must be a multiple of AES block size")
+
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    # empty files cannot be mapped
+    if os.fstat(fIn.fileno()).st_size == 0:
+        decryptStream(fIn, fOut, passw, bufferSize, keyCache=keyCache)
+        return
+
+    with mmap.mmap(fIn.fileno(), 0, access=mmap.ACCESS_READ) as inMap:
+        # parse header
+        hdr = parseHeader(inMap)
+        checkPlainPayload(hdr)
+
+        # get payload size
+        payloadStart = inMap.tell()
+        payloadSize = len(inMap) - payloadStart - 32 - 1
+        if payloadSize < 0 or payloadSize % AESBlockSize != 0:
+            raise ValueError("File is corrupted.")
+        payloadEnd = payloadStart + payloadSize
+
+        # read plaintext file size mod 16 lsb positions and
+        # HMAC of the ciphertext
+        fs16 = inMap[payloadEnd]
+        hmac0 = inMap[payloadEnd + 1 :]
+
+        # stretch password and iv (or get the key from the cache)
+        key = getKey(passw, hdr.iv1, keyCache)
+
+        # check password and get internal iv and key
+        iv0, intKey = decryptKeys(key, hdr)
+
+        # instantiate AES cipher
+        cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
+        decryptor0 = cipher0.decryptor()
+
+        # instantiate actual HMAC-SHA256 of the ciphertext
+        hmac0Act = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+
+        # preallocate output file (padding removed)
+        outSize = max(payloadSize - (16 - fs16) % 16, 0)
+        fOut.truncate(outSize)
+
+        with memoryview(inMap) as inView:
+            if outSize:
+                outMap = mmap.mmap(fOut.fileno(), outSize)
+                outView = memoryview(outMap)
+            try:
+                pos = 0
+                for off in range(payloadStart, payloadEnd, bufferSize):
+                    with inView[off : min(off + bufferSize, payloadEnd)] as cText:
+                        n = len(cText)
+                        # update HMAC
+                        hmac0Act.update(cText)
+                        # decrypt directly into the output file, if there is
+                        # room for update_into...
+                        if pos + n + AESBlockSize - 1 <= outSize:
+                            decryptor0.update_into(
+                                cText, outView[pos : pos + n + AESBlockSize - 1]
+                            )
+                        # ...otherwise copy (and remove padding)
+                        else:
+                            pText = decryptor0.update(cText)[: outSize - pos]
+                            outView[pos : pos + len(pText)] = pText
+                    pos += n
+            finally:
+                if outSize:
+                    outView.release()
+                    outMap.close()
+
+    # HMAC check
+    if hmac0 != hmac0Act.finalize():
+        raise ValueError("Bad HMAC (file is corrupted).")
+
+
+# parallel decrypt stream function
+# CBC decryption of a block only depends on the ciphertext, hence the
+# payload is split into segments which are decrypted by a pool of workers
+# (each segment using the last ciphertext block of the previous one as iv),
+# while the HMAC of the ciphertext is computed concurrently.
+# Plaintext segments are written in order, so output is identical
+# to the one of decryptStream.
+# arguments:
+# fIn: input binary stream (must be seekable)
+# fOut: output binary stream
+# passw: encryption password
+# workers: number of decryption workers
+# segmentSize: size of the segments decrypted by each worker, must be a
+#              multiple of AES block size (16)
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# useProcesses: use a process pool instead of a thread pool
+def decryptStreamParallel(
+    fIn,
+    fOut,
+    passw,
+    workers,
+    segmentSize=segmentSizeDef,
+    keyCache=None,
+    useProcesses=False,
+):
+    # validate segmentSize
+    if segmentSize <= 0 or segmentSize % AESBlockSize != 0:
+        raise ValueError("Segment size must be a multiple of AES block size.")
+
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    # parse header and get payload size from the stream size
+    hdr = readHeader(fIn)
+    checkPlainPayload(hdr)
+    payloadStart = fIn.tell()
+    payloadSize = hdr.payloadSize
+
+    # read plaintext file size mod 16 lsb positions and HMAC of the ciphertext
+    fs16, hmac0 = readTrailer(fIn, hdr, payloadStart)
+
+    # stretch password and iv (or get the key from the cache)
+    key = getKey(passw, hdr.iv1, keyCache)
+
+    # check password and get internal iv and key
+    iv0, intKey = decryptKeys(key, hdr)
+
+    # instantiate actual HMAC-SHA256 of the ciphertext
+    hmac0Act = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+
+    poolClass = ProcessPoolExecutor if useProcesses else ThreadPoolExecutor
+
+    # HMAC updates are serialized by a single-worker pool
+    with poolClass(workers) as pool, ThreadPoolExecutor(1) as hmacPool:
+        pending = deque()
+        remaining = payloadSize
+        iv = iv0
+        while remaining or pending:
+            # keep up to 2 segments per worker in flight (both decryption
+            # and HMAC update, so that a slower HMAC cannot queue up the
+            # whole payload)
+            while remaining and len(pending) < 2 * workers:
+                cText = fIn.read(min(segmentSize, remaining))
+                if not cText:
+                    raise ValueError("File is corrupted.")
+                remaining -= len(cText)
+                pending.append(
+                    (
+                        pool.submit(decryptSegment, intKey, iv, cText),
+                        hmacPool.submit(hmac0Act.update, cText),
+                    )
+                )
+                iv = cText[-AESBlockSize:]
+
+            decryptFuture, hmacFuture = pending.popleft()
+            pText = decryptFuture.result()
+            hmacFuture.result()
+
+            # remove padding
+            if not remaining and not pending:
+                toremove = (16 - fs16) % 16
+                if toremove:
+                    pText = pText[:-toremove]
+
+            fOut.write(pText)
+
+        hmac0ActVal = hmacPool.submit(hmac0Act.finalize).result()
+
+    # HMAC check
+    if hmac0 != hmac0ActVal:
+        raise ValueError("Bad HMAC (file is corrupted).")
+
+
+# decrypt segment function
+# decrypts a whole number of AES-CBC blocks
+# arguments:
+# intKey: internal key
+# iv: iv for the segment (main iv or last ciphertext block of
+#     the previous segment)
+# cText: segment ciphertext
+def decryptSegment(intKey, iv, cText):
+    cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv), backend=default_backend())
+    decryptor0 = cipher0.decryptor()
+    return decryptor0.update(cText) + decryptor0.finalize()
+
+
+# chunked stream encryption function
+# encrypts fIn into a chunked container (see the chunked module): every
+# chunk gets its own iv and HMAC, hence chunks are encrypted by a pool of
+# workers and the output can be decrypted in parallel, verified chunk by
+# chunk and read at random offsets
+# NOTE: chunked files can only be decrypted by pyAesCrypt.
+# arguments:
+# fIn: input binary stream
+# fOut: output binary stream
+# passw: encryption password
+# chunkSize: plaintext bytes per chunk, must be a multiple of
+#            AES block size (16)
+# workers: number of encryption workers
+# useProcesses: use a process pool instead of a thread pool
+def encryptStreamChunked(
+    fIn, fOut, passw, chunkSize=chunkSizeDef, workers=1, useProcesses=False
+):
+    checkChunkSize(chunkSize)
+
+    if workers < 1:
+        raise ValueError("Number of workers must be at least 1.")
+
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    # generate external iv and stretch password
+    iv1 = urandom(AESBlockSize)
+    key = stretch(passw, iv1)
+
+    # generate and encrypt random main iv and internal key
+    iv0, intKey, c_iv_key, hmac1 = newKeys(iv1, key)
+    encKey, macKey = chunkKeys(intKey)
+
+    # write header, announcing the chunked mode
+    writeHeader(
+        fOut, iv1, c_iv_key, hmac1, headerTemplate((chunkedExtension(chunkSize),))
+    )
+
+    runChunkJobs(
+        encryptChunk,
+        encryptChunkJobs(fIn, encKey, macKey, chunkSize),
+        fOut.write,
+        workers,
+        useProcesses,
+    )
+
+
+# chunk encryption jobs generator
+# reads fIn in chunks, yielding the encryptChunk arguments of each one
+# (only the final chunk is shorter than chunkSize, possibly empty)
+def encryptChunkJobs(fIn, encKey, macKey, chunkSize):
+    index = 0
+    while True:
+        data = readChunk(fIn, chunkSize)
+        final = len(data) < chunkSize
+        yield encKey, macKey, index, final, data
+        if final:
+            return
+        index += 1
+
+
+# chunk decryption jobs generator
+# reads the records of fIn, yielding the decryptChunk arguments of each one
+# raises ValueError if the final record is missing or followed by data
+def decryptChunkJobs(fIn, encKey, macKey, chunkSize):
+    index = 0
+    while True:
+        record = readChunk(fIn, chunkSize + recordOverhead)
+        if not record:
+            raise ValueError("File is corrupted.")
+        yield encKey, macKey, index, record, chunkSize
+        # the flag is authenticated by decryptChunk
+        if record[0] == flagFinal:
+            if fIn.read(1):
+                raise ValueError("File is corrupted.")
+            return
+        index += 1
+
+
+# run chunk jobs function
+# calls func(*args) for each args tuple of jobs, in a pool of workers if
+# workers > 1 (keeping at most 2 jobs per worker in flight), and passes
+# the results to output, in order
+# arguments:
+# func: chunk function (encryptChunk or decryptChunk)
+# jobs: iterable of argument tuples
+# output: function receiving the results
+# workers: number of workers
+# useProcesses: use a process pool instead of a thread pool
+def runChunkJobs(func, jobs, output, workers=1, useProcesses=False):
+    if workers <= 1:
+        for args in jobs:
+            output(func(*args))
+        return
+
+    poolClass = ProcessPoolExecutor if useProcesses else ThreadPoolExecutor
+
+    with poolClass(workers) as pool:
+        pending = deque()
+        for args in jobs:
+            if len(pending) >= 2 * workers:
+                output(pending.popleft().result())
+            pending.append(pool.submit(func, *args))
+        while pending:
+            output(pending.popleft().result())
+
+
+# chunked stream decryption function
+# decrypts a chunked container, authenticating every chunk before
+# writing its plaintext: when an error is raised, fOut holds the
+# plaintext of the chunks preceding the bad one
+# arguments:
+# fIn: input binary stream
+# fOut: output binary stream
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# workers: number of decryption workers
+# useProcesses: use a process pool instead of a thread pool
+def decryptStreamChunked(
+    fIn, fOut, passw, keyCache=None, workers=1, useProcesses=False
+):
+    if workers < 1:
+        raise ValueError("Number of workers must be at least 1.")
+
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    # parse header
+    hdr = parseHeader(fIn)
+    chunkSize = hdr.chunkSize
+    if chunkSize is None:
+        raise ValueError("File is not a chunked file.")
+
+    # stretch password and iv (or get the key from the cache)
+    key = getKey(passw, hdr.iv1, keyCache)
+
+    # check password and get internal key
+    iv0, intKey = decryptKeys(key, hdr)
+    encKey, macKey = chunkKeys(intKey)
+
+    # decompress transparently, if the header records a codec
+    codec = hdr.compression
+    if codec is not None:
+        fOut = DecompressingWriter(fOut, codec)
+
+    runChunkJobs(
+        decryptChunk,
+        decryptChunkJobs(fIn, encKey, macKey, chunkSize),
+        fOut.write,
+        workers,
+        useProcesses,
+    )
+
+    if codec is not None:
+        fOut.finish()
+
+
+# random-access reader base class
+# A seekable, read-only file-like object over plaintext of known size,
+# read through the range function passed by subclasses.
+# arguments:
+# fIn: input binary stream (must be seekable)
+# readRange: function decrypting length plaintext bytes starting at
+#            offset, called as readRange(offset, length) (fewer bytes are
+#            returned at the end of the plaintext)
+# closeInput: close fIn when the object is closed
+class RandomAccessReader(io.RawIOBase):
+    def __init__(self, fIn, readRange, closeInput=False):
+        super().__init__()
+        self.__fIn = fIn
+        self.__readRange = readRange
+        self.__closeInput = closeInput
+        self.__pos = 0
+        # plaintext size (set by subclasses)
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self.__pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError("Invalid whence value.")
+        if pos < 0:
+            raise ValueError("Negative seek position.")
+        self.__pos = pos
+        return pos
+
+    def readinto(self, b):
+        data = self.__readRange(self.__pos, len(b))
+        n = len(data)
+        b[:n] = data
+        self.__pos += n
+        return n
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = max(self.size - self.__pos, 0)
+        data = self.__readRange(self.__pos, size)
+        self.__pos += len(data)
+        return data
+
+    def close(self):
+        if not self.closed and self.__closeInput:
+            self.__fIn.close()
+        super().close()
+
+
+# random-access decrypted file class
+# A seekable, read-only file-like object giving access to the plaintext of
+# an AES Crypt v2 stream: only the ciphertext blocks covering the requested
+# bytes are read and decrypted (each block only depends on the previous
+# ciphertext block).
+# NOTE: the plaintext is NOT authenticated, unless verify() is called
+# (which reads the whole payload).
+# arguments:
+# fIn: input binary stream (must be seekable)
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# closeInput: close fIn when the object is closed
+class DecryptedFile(RandomAccessReader):
+    def __init__(self, fIn, passw, keyCache=None, closeInput=False):
+        if len(passw) > maxPassLen:
+            raise ValueError("Password is too long.")
+
+        super().__init__(fIn, self.readRange, closeInput)
+        self.__fIn = fIn
+
+        # parse header and get payload size from the stream size
+        fIn.seek(0)
+        hdr = readHeader(fIn)
+        checkPlainPayload(hdr)
+        self.__payloadStart = fIn.tell()
+        self.__payloadSize = hdr.payloadSize
+
+        # read plaintext file size mod 16 lsb positions and HMAC of the ciphertext
+        fs16, self.__hmac0 = readTrailer(fIn, hdr, self.__payloadStart)
+
+        # stretch password and iv (or get the key from the cache)
+        key = getKey(passw, hdr.iv1, keyCache)
+
+        # check password and get internal iv and key
+        self.__iv0, self.__intKey = decryptKeys(key, hdr)
+
+        # plaintext size (padding removed)
+        self.size = max(self.__payloadSize - (16 - fs16) % 16, 0)
+
+    # decrypt length plaintext bytes starting at offset
+    # (fewer bytes are returned at the end of the plaintext)
+    def readRange(self, offset, length):
+        if offset < 0 or length < 0:
+            raise ValueError("Offset and length must not be negative.")
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b""
+
+        # blocks covering the range
+        firstBlock = offset // AESBlockSize
+        lastBlock = (end - 1) // AESBlockSize
+
+        # read the previous ciphertext block (the iv of the first block)
+        # and the blocks covering the range
+        if firstBlock == 0:
+            iv = self.__iv0
+            self.__fIn.seek(self.__payloadStart)
+        else:
+            self.__fIn.seek(self.__payloadStart + (firstBlock - 1) * AESBlockSize)
+            iv = self.__fIn.read(AESBlockSize)
+        nbytes = (lastBlock - firstBlock + 1) * AESBlockSize
+        cText = self.__fIn.read(nbytes)
+        if len(iv) != AESBlockSize or len(cText) != nbytes:
+            raise ValueError("File is corrupted.")
+
+        pText = decryptSegment(self.__intKey, iv, cText)
+        start = offset - firstBlock * AESBlockSize
+        return pText[start : start + end - offset]
+
+    # check the HMAC of the whole payload
+    # arguments:
+    # bufferSize: read buffer size
+    def verify(self, bufferSize=bufferSizeDef):
+        hmac0Act = hmac.HMAC(self.__intKey, hashes.SHA256(), backend=default_backend())
+        self.__fIn.seek(self.__payloadStart)
+        remaining = self.__payloadSize
+        while remaining:
+            cText = self.__fIn.read(min(bufferSize, remaining))
+            if not cText:
+                raise ValueError("File is corrupted.")
+            hmac0Act.update(cText)
+            remaining -= len(cText)
+        if self.__hmac0 != hmac0Act.finalize():
+            raise ValueError("Bad HMAC (file is corrupted).")
+
+
+# random-access chunked file class
+# A seekable, read-only file-like object giving access to the plaintext of
+# a chunked container (see encryptStreamChunked): only the chunks covering
+# the requested bytes are read, authenticated and decrypted.
+# Unlike DecryptedFile, every byte returned is authenticated.
+# arguments:
+# fIn: input binary stream (must be seekable)
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# closeInput: close fIn when the object is closed
+class ChunkedFile(RandomAccessReader):
+    def __init__(self, fIn, passw, keyCache=None, closeInput=False):
+        if len(passw) > maxPassLen:
+            raise ValueError("Password is too long.")
+
+        super().__init__(fIn, self.readRange, closeInput)
+        self.__fIn = fIn
+
+        # parse header and get payload size from the stream size
+        fIn.seek(0)
+        hdr = readHeader(fIn)
+        self.__chunkSize = hdr.chunkSize
+        if self.__chunkSize is None:
+            raise ValueError("File is not a chunked file.")
+        if hdr.compression is not None:
+            raise ValueError("Compressed files can only be decrypted as a stream.")
+        self.__payloadStart = fIn.tell()
+        self.__recordSize = self.__chunkSize + recordOverhead
+        self.__chunks = -(-hdr.payloadSize // self.__recordSize)
+
+        # stretch password and iv (or get the key from the cache)
+        key = getKey(passw, hdr.iv1, keyCache)
+
+        # check password and get internal key
+        iv0, intKey = decryptKeys(key, hdr)
+        self.__encKey, self.__macKey = chunkKeys(intKey)
+
+        # last decrypted chunk, as (index, plaintext)
+        self.__cached = (None, b"")
+
+        # plaintext size (the final chunk is decrypted to get its size)
+        last = self.__readChunk(self.__chunks - 1)
+        self.size = (self.__chunks - 1) * self.__chunkSize + len(last)
+
+    # read, authenticate and decrypt chunk index
+    def __readChunk(self, index):
+        if self.__cached[0] == index:
+            return self.__cached[1]
+        self.__fIn.seek(self.__payloadStart + index * self.__recordSize)
+        record = readChunk(self.__fIn, self.__recordSize)
+        if not record:
+            raise ValueError("File is corrupted.")
+        pText = decryptChunk(
+            self.__encKey, self.__macKey, index, record, self.__chunkSize
+        )
+        # only the last record may (and must) hold the final chunk
+        if (record[0] == flagFinal) != (index == self.__chunks - 1):
+            raise ValueError("File is corrupted.")
+        self.__cached = (index, pText)
+        return pText
+
+    # decrypt length plaintext bytes starting at offset
+    # (fewer bytes are returned at the end of the plaintext)
+    def readRange(self, offset, length):
+        if offset < 0 or length < 0:
+            raise ValueError("Offset and length must not be negative.")
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b""
+
+        # chunks covering the range
+        chunkSize = self.__chunkSize
+        pTexts = []
+        for index in range(offset // chunkSize, (end - 1) // chunkSize + 1):
+            pText = self.__readChunk(index)
+            start = max(offset - index * chunkSize, 0)
+            pTexts.append(pText[start : end - index * chunkSize])
+        return b"".join(pTexts)
+
+    # check the HMAC of every chunk
+    # (for symmetry with DecryptedFile: chunks are also checked when read)
+    # arguments:
+    # bufferSize: ignored (chunks are read whole)
+    def verify(self, bufferSize=bufferSizeDef):
+        for index in range(self.__chunks):
+            self.__fIn.seek(self.__payloadStart + index * self.__recordSize)
+            record = readChunk(self.__fIn, self.__recordSize)
+            final = checkChunk(self.__macKey, index, record, self.__chunkSize)
+            if final != (index == self.__chunks - 1):
+                raise ValueError("File is corrupted.")
+
+
+# random-access reader function
+# returns a ChunkedFile for chunked containers, a DecryptedFile otherwise
+# arguments:
+# fIn: input binary stream (must be seekable)
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# closeInput: close fIn when the returned object is closed
+def randomAccessReader(fIn, passw, keyCache=None, closeInput=False):
+    fIn.seek(0)
+    chunked = parseHeader(fIn).chunkSize is not None
+    readerClass = ChunkedFile if chunked else DecryptedFile
+    return readerClass(fIn, passw, keyCache, closeInput)
+
+
+# open decrypted file function
+# returns a DecryptedFile (a ChunkedFile, for chunked containers) giving
+# random access to the plaintext of infile
+# arguments:
+# infile: ciphertext file path
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+def openDecrypted(infile, passw, keyCache=None):
+    try:
+        fIn = open(infile, "rb")
+    except IOError:
+        raise ValueError("Unable to read input file.")
+    try:
+        return randomAccessReader(fIn, passw, keyCache, closeInput=True)
+    except BaseException:
+        fIn.close()
+        raise
+
+
+# decrypt range function
+# decrypts length plaintext bytes starting at offset, reading and
+# decrypting only the needed ciphertext blocks (or chunks)
+# NOTE: the plaintext is NOT authenticated (see DecryptedFile.verify),
+# unless fIn is a chunked container
+# arguments:
+# fIn: input binary stream (must be seekable)
+# passw: encryption password
+# offset: plaintext offset
+# length: number of bytes (fewer bytes are returned at the end
+#         of the plaintext)
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+def decryptRange(fIn, passw, offset, length, keyCache=None):
+    return randomAccessReader(fIn, passw, keyCache).readRange(offset, length)
+
+
+# AES Crypt v2 header class
+# version: file format version
+# extensions: list of (identifier, contents) extensions, as (str, bytes)
+#             (the empty "container" extension is not listed)
+# iv1: external iv
+# c_iv_key: encrypted main iv and key
+# hmac1: HMAC-SHA256 of c_iv_key
+# headerSize: header size, i.e. offset of the payload from the start
+#             of the header
+# payloadSize: encrypted payload size (None if unknown); for chunked
+#              files, the size of all the records
+class Header:
+    __slots__ = (
+        "version",
+        "extensions",
+        "iv1",
+        "c_iv_key",
+        "hmac1",
+        "headerSize",
+        "payloadSize",
+    )
+
+    def __init__(self, version, extensions, iv1, c_iv_key, hmac1, headerSize):
+        self.version = version
+        self.extensions = extensions
+        self.iv1 = iv1
+        self.c_iv_key = c_iv_key
+        self.hmac1 = hmac1
+        self.headerSize = headerSize
+        self.payloadSize = None
+
+    # get the contents of an extension (None if not present)
+    def getExtension(self, identifier):
+        for extId, contents in self.extensions:
+            if extId == identifier:
+                return contents
+        return None
+
+    # software that created the file (None if not known)
+    @property
+    def createdBy(self):
+        cby = self.getExtension("CREATED_BY")
+        if cby is None:
+            return None
+        return cby.decode("utf8", "replace")
+
+    # compression codec of the payload (None if not compressed)
+    @property
+    def compression(self):
+        codec = self.getExtension(compressionExtId)
+        if codec is None:
+            return None
+        return codec.decode("utf8", "replace")
+
+    # chunk size of a chunked container (None for an AES Crypt v2 payload)
+    @property
+    def chunkSize(self):
+        contents = self.getExtension(chunkedExtId)
+        if contents is None:
+            return None
+        return parseChunkSize(contents)
+
+
+# plain payload check function
+# raises ValueError if the file described by hdr is compressed or chunked
+# (only decryptStream, and the functions built on it, can decompress, and
+# chunked files have their own parallel and random-access functions)
+def checkPlainPayload(hdr):
+    if hdr.compression is not None:
+        raise ValueError("Compressed files can only be decrypted as a stream.")
+    if hdr.chunkSize is not None:
+        raise ValueError("Chunked files are not supported by this function.")
+
+
+# read trailer function
+# reads the trailer following the payload of a seekable stream, leaving
+# fIn positioned at the start of the payload
+# arguments:
+# fIn: input binary stream (must be seekable)
+# hdr: Header instance
+# payloadStart: offset of the payload in fIn
+# returns: (plaintext file size mod 16 lsb positions, HMAC of the ciphertext)
+def readTrailer(fIn, hdr, payloadStart):
+    fIn.seek(payloadStart + hdr.payloadSize)
+    trailer = fIn.read(1 + 32)
+    if len(trailer) != 1 + 32:
+        raise ValueError("File is corrupted.")
+    fIn.seek(payloadStart)
+    return trailer[0], trailer[1:]
+
+
+# read AES Crypt v2 header function
+# reads and parses the header from fIn, leaving it positioned at the start
+# of the encrypted payload; if fIn is seekable, the payload size is
+# computed from the stream size (no other byte is read)
+# arguments:
+# fIn: input binary stream
+# returns: Header instance
+def readHeader(fIn):
+    hdr = parseHeader(fIn)
+
+    seekable = getattr(fIn, "seekable", None)
+    if seekable is not None and seekable():
+        payloadStart = fIn.tell()
+        payloadSize = fIn.seek(0, io.SEEK_END) - payloadStart
+        fIn.seek(payloadStart)
+        if hdr.chunkSize is None:
+            # ciphertext, without plaintext size mod 16 and HMAC
+            payloadSize -= 32 + 1
+            if payloadSize < 0 or payloadSize % AESBlockSize != 0:
+                raise ValueError("File is corrupted.")
+        elif payloadSize < recordOverhead + AESBlockSize:
+            # at least the final record
+            raise ValueError("File is corrupted.")
+        hdr.payloadSize = payloadSize
+
+    return hdr
+
+
+# parse AES Crypt v2 header function
+# reads the header from fIn, leaving it positioned at the start of
+# the encrypted payload
+# returns: Header instance (without payload size)
+def parseHeader(fIn):
+    parser = headerParser()
+    nbytes = next(parser)
+    try:
+        while True:
+            nbytes = parser.send(fIn.read(nbytes))
+    except StopIteration as ex:
+        return ex.value
+
+
+# AES Crypt v2 header parser
+# I/O-free parser generator: it yields the number of bytes it needs next,
+# and must be sent the bytes read (fewer bytes only at the end of stream).
+# Its return value is the one of parseHeader.
+def headerParser():
+    fdata = yield 3
+    # check if file is in AES Crypt format (also min length check)
+    if fdata != b"AES":
+        raise ValueError("File is corrupted or not an AES Crypt (or pyAesCrypt) file.")
+
+    # check if file is in AES Crypt format, version 2
+    # (the only one compatible with pyAesCrypt)
+    fdata = yield 1
+    if len(fdata) != 1:
+        raise ValueError("File is corrupted.")
+
+    if fdata != b"\x02":
+        raise ValueError(
+            "pyAesCrypt is only compatible with version "
+            "2 of the AES Crypt file format."
+        )
+
+    # skip reserved byte
+    yield 1
+    headerSize = 3 + 1 + 1
+
+    # read all the extensions
+    extensions = []
+    while True:
+        fdata = yield 2
+        if len(fdata) != 2:
+            raise ValueError("File is corrupted.")
+        headerSize += 2
+        if fdata == b"\x00\x00":
+            break
+        extLen = int.from_bytes(fdata, byteorder="big")
+        fdata = yield extLen
+        if len(fdata) != extLen:
+            raise ValueError("File is corrupted.")
+        headerSize += extLen
+        # identifier and contents are separated by a null byte
+        # (the "container" extension has an empty identifier)
+        extId, sep, contents = fdata.partition(b"\x00")
+        if extId:
+            extensions.append((extId.decode("utf8", "replace"), contents))
+
+    # read external iv
+    iv1 = yield 16
+    if len(iv1) != 16:
+        raise ValueError("File is corrupted.")
 
     # read encrypted main iv and key
-    c_iv_key = fIn.read(48)
+    c_iv_key = yield 48
     if len(c_iv_key) != 48:
         raise ValueError("File is corrupted.")
 
     # read HMAC-SHA256 of the encrypted iv and key
-    hmac1 = fIn.read(32)
+    hmac1 = yield 32
     if len(hmac1) != 32:
         raise ValueError("File is corrupted.")
 
+    headerSize += 16 + 48 + 32
+
+    return Header(2, extensions, iv1, c_iv_key, hmac1, headerSize)
+
+
+# get stretched key function
+# stretches password and iv, or gets the key from keyCache (if not None)
+def getKey(passw, iv1, keyCache=None):
+    if keyCache is not None:
+        return keyCache.getKey(passw, iv1)
+    return stretch(passw, iv1)
+
+
+# check key function
+# checks the HMAC of the encrypted main iv and key
+# arguments:
+# key: key obtained by stretching the password with the header iv1
+# hdr: Header instance
+# returns: True if the key (i.e. the password) is right
+def checkKey(key, hdr):
     # compute actual HMAC-SHA256 of the encrypted iv and key
     hmac1Act = hmac.HMAC(key, hashes.SHA256(), backend=default_backend())
-    hmac1Act.update(c_iv_key)
+    hmac1Act.update(hdr.c_iv_key)
+
+    # HMAC check
+    return hdr.hmac1 == hmac1Act.finalize()
+
 
+# decrypt main iv and key function
+# checks the HMAC of the encrypted main iv and key, then decrypts them
+# arguments:
+# key: key obtained by stretching the password with the header iv1
+# hdr: Header instance
+# returns: (main iv, internal key)
+def decryptKeys(key, hdr):
     # HMAC check
-    if hmac1 != hmac1Act.finalize():
+    if not checkKey(key, hdr):
         raise ValueError("Wrong password (or file is corrupted).")
 
     # instantiate AES cipher
-    cipher1 = Cipher(algorithms.AES(key), modes.CBC(iv1), backend=default_backend())
+    cipher1 = Cipher(algorithms.AES(key), modes.CBC(hdr.iv1), backend=default_backend())
     decryptor1 = cipher1.decryptor()
 
     # decrypt main iv and key
-    iv_key = decryptor1.update(c_iv_key) + decryptor1.finalize()
+    iv_key = decryptor1.update(hdr.c_iv_key) + decryptor1.finalize()
 
     # get internal iv and key
-    iv0 = iv_key[:16]
-    intKey = iv_key[16:]
+    return iv_key[:16], iv_key[16:]
 
-    # instantiate another AES cipher
-    cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
-    decryptor0 = cipher0.decryptor()
 
-    # instantiate actual HMAC-SHA256 of the ciphertext
+# check password function
+# reads just the header of an AES Crypt v2 file and checks the password
+# against it, without reading the payload
+# arguments:
+# infile: ciphertext file path
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# returns: True if the password is right
+def checkPassword(infile, passw, keyCache=None):
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    try:
+        with open(infile, "rb") as fIn:
+            hdr = parseHeader(fIn)
+    except IOError:
+        raise ValueError("Unable to read input file.")
+
+    return checkKey(getKey(passw, hdr.iv1, keyCache), hdr)
+
+
+# verify file function
+# checks the password and the HMAC of the ciphertext of infile,
+# without decrypting the payload
+# arguments:
+# infile: ciphertext file path
+# passw: encryption password
+# bufferSize: read buffer size
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+def verifyFile(infile, passw, bufferSize=verifyBufferSizeDef, keyCache=None):
+    try:
+        with open(infile, "rb") as fIn:
+            verifyStream(fIn, passw, bufferSize, keyCache)
+    except IOError:
+        raise ValueError("Unable to read input file.")
+
+
+# verify stream function
+# checks the password and the HMAC of the ciphertext of fIn, without
+# decrypting the payload: the HMAC is computed over the ciphertext, hence
+# only the encrypted main iv and key are decrypted
+# raises ValueError if the password is wrong or the stream is corrupted
+# arguments:
+# fIn: input binary stream
+# passw: encryption password
+# bufferSize: read buffer size
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+def verifyStream(fIn, passw, bufferSize=verifyBufferSizeDef, keyCache=None):
+    if bufferSize < 1:
+        raise ValueError("Buffer size must be positive.")
+
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    # parse header
+    hdr = parseHeader(fIn)
+
+    # stretch password and iv (or get the key from the cache)
+    key = getKey(passw, hdr.iv1, keyCache)
+
+    # check password and get internal key
+    iv0, intKey = decryptKeys(key, hdr)
+
+    # chunked containers: check the HMAC of every chunk
+    chunkSize = hdr.chunkSize
+    if chunkSize is not None:
+        encKey, macKey = chunkKeys(intKey)
+        for args in decryptChunkJobs(fIn, encKey, macKey, chunkSize):
+            # index, record and chunk size
+            checkChunk(macKey, *args[2:])
+        return
+
+    # compute HMAC of the ciphertext, holding back the trailer
+    fIn = getBufferableFileobj(fIn)
     hmac0Act = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+    inBuf = bytearray(bufferSize + 32 + 1)
+    inView = memoryview(inBuf)
+    held = 0
+    cLen = 0
+    while True:
+        # read data after held back bytes
+        total = held + readFull(fIn, inView[held:])
 
-    # decrypt ciphertext, until last block is reached
-    last_block_reached = False
-    while not last_block_reached:
-        # read data
-        cText = fIn.read(bufferSize)
+        # end of stream
+        if total < len(inBuf):
+            break
 
-        # end of buffer
-        if len(fIn.peek(32 + 1)) < 32 + 1:
-            last_block_reached = True
-            cText += fIn.read()
-            fs16 = cText[-32 - 1]  # plaintext file size mod 16 lsb positions
-            hmac0 = cText[-32:]
-            cText = cText[: -32 - 1]
+        hmac0Act.update(inView[:bufferSize])
+        cLen += bufferSize
 
-        # update HMAC
-        hmac0Act.update(cText)
-        # decrypt data and write it to output file
-        pText = decryptor0.update(cText)
+        # move held back bytes to the start of the buffer
+        inView[: 32 + 1] = inView[bufferSize:total]
+        held = 32 + 1
 
-        # remove padding
-        if last_block_reached:
-            toremove = (16 - fs16) % 16
-            if toremove:
-                pText = pText[:-toremove]
+    if total < 32 + 1:
+        raise ValueError("File is corrupted.")
+    hmac0Act.update(inView[: total - 32 - 1])
+    cLen += total - 32 - 1
 
-        fOut.write(pText)
+    # ciphertext must be made of whole AES blocks
+    if cLen % AESBlockSize != 0:
+        raise ValueError("File is corrupted.")
 
     # HMAC check
-    if hmac0 != hmac0Act.finalize():
+    if bytes(inView[total - 32 : total]) != hmac0Act.finalize():
+        raise ValueError("Bad HMAC (file is corrupted).")
+
+
+# encrypt bytes function
+# encrypts data held in memory into a single preallocated buffer
+# arguments:
+# data: plaintext (bytes or any other buffer-protocol object)
+# passw: encryption password
+# returns: ciphertext bytes
+def encryptBytes(data, passw):
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    # generate external iv and stretch password
+    iv1 = urandom(AESBlockSize)
+    key = stretch(passw, iv1)
+
+    return encryptBytesKey(data, iv1, key)
+
+
+# encrypt bytes with an already stretched key
+# arguments:
+# data: plaintext (bytes or any other buffer-protocol object)
+# iv1: external iv
+# key: key obtained by stretching the password with iv1
+# returns: ciphertext bytes
+def encryptBytesKey(data, iv1, key):
+    with memoryview(data) as dataView, dataView.cast("B") as pView:
+        size = len(pView)
+
+        # generate and encrypt random main iv and internal key
+        iv0, intKey, c_iv_key, hmac1 = newKeys(iv1, key)
+        header = buildHeader(iv1, c_iv_key, hmac1)
+
+        # output buffer of the exact size, starting with the header
+        hLen = len(header)
+        out = bytearray(encryptedSize(size, hLen))
+        out[:hLen] = header
+        outView = memoryview(out)
+
+        # instantiate AES cipher
+        cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
+        encryptor0 = cipher0.encryptor()
+
+        # encrypt whole blocks
+        # (update_into requires block size - 1 bytes of room, which the
+        # trailer provides)
+        full = size - size % AESBlockSize
+        cLen = 0
+        if full:
+            cLen = encryptor0.update_into(pView[:full], outView[hLen:])
+
+        # pad and encrypt the last block (this is NOT PKCS#7!)
+        if size % AESBlockSize:
+            padLen = AESBlockSize - size % AESBlockSize
+            lastBlock = bytes(pView[full:]) + bytes([padLen]) * padLen
+            cLen += encryptor0.update_into(lastBlock, outView[hLen + cLen :])
+        encryptor0.finalize()
+
+    # compute HMAC-SHA256 of the ciphertext
+    hmac0 = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+    hmac0.update(outView[hLen : hLen + cLen])
+
+    # write plaintext size mod 16 lsb positions and HMAC
+    out[hLen + cLen] = size % AESBlockSize
+    outView[hLen + cLen + 1 :] = hmac0.finalize()
+    outView.release()
+
+    return bytes(out)
+
+
+# decrypt bytes function
+# decrypts data held in memory into a single preallocated buffer;
+# since the whole ciphertext is available, the HMAC is checked before
+# decrypting
+# arguments:
+# data: ciphertext (bytes or any other buffer-protocol object)
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# returns: plaintext bytes
+def decryptBytes(data, passw, keyCache=None):
+    if len(passw) > maxPassLen:
+        raise ValueError("Password is too long.")
+
+    with memoryview(data) as dataView, dataView.cast("B") as cView:
+        # parse header
+        parser = headerParser()
+        need = next(parser)
+        pos = 0
+        try:
+            while True:
+                fdata = bytes(cView[pos : pos + need])
+                pos += len(fdata)
+                need = parser.send(fdata)
+        except StopIteration as ex:
+            hdr = ex.value
+
+        # stretch password and iv (or get the key from the cache)
+        key = getKey(passw, hdr.iv1, keyCache)
+
+        # check password and get internal iv and key
+        iv0, intKey = decryptKeys(key, hdr)
+
+        if hdr.chunkSize is not None:
+            # chunked container: each chunk is checked, then decrypted
+            decryptor = payloadDecryptor(hdr, iv0, intKey)
+            pText = decryptor.update(cView[hdr.headerSize :]) + decryptor.finalize()
+        else:
+            pText = decryptBytesPayload(cView, hdr, iv0, intKey)
+
+    # decompress, if the header records a codec
+    if hdr.compression is not None:
+        decompressor = StreamDecompressor(hdr.compression)
+        pText = decompressor.update(pText)
+        decompressor.finish()
+
+    return pText
+
+
+# AES Crypt v2 bytes payload decryption function
+# checks the HMAC of the payload of cView, then decrypts it into a
+# single preallocated buffer
+# arguments:
+# cView: ciphertext memoryview (whole file)
+# hdr: Header instance
+# iv0: main iv
+# intKey: internal key
+# returns: plaintext bytes
+def decryptBytesPayload(cView, hdr, iv0, intKey):
+    # get payload size
+    hLen = hdr.headerSize
+    cLen = len(cView) - hLen - 32 - 1
+    if cLen < 0 or cLen % AESBlockSize != 0:
+        raise ValueError("File is corrupted.")
+
+    # HMAC check
+    hmac0Act = hmac.HMAC(intKey, hashes.SHA256(), backend=default_backend())
+    hmac0Act.update(cView[hLen : hLen + cLen])
+    if cView[hLen + cLen + 1 :] != hmac0Act.finalize():
         raise ValueError("Bad HMAC (file is corrupted).")
 
+    # plaintext size (padding removed)
+    fs16 = cView[hLen + cLen]
+    size = max(cLen - (16 - fs16) % 16, 0)
+
+    # instantiate AES cipher
+    cipher0 = Cipher(algorithms.AES(intKey), modes.CBC(iv0), backend=default_backend())
+    decryptor0 = cipher0.decryptor()
+
+    # decrypt into a buffer with block size - 1 bytes of room
+    # (required by update_into)
+    out = bytearray(cLen + AESBlockSize - 1)
+    if cLen:
+        decryptor0.update_into(cView[hLen : hLen + cLen], out)
+    decryptor0.finalize()
+
+    with memoryview(out) as outView:
+        return bytes(outView[:size])
+
+
+# encryption session class
+# Stretches the password once, then encrypts any number of files/streams
+# sharing the same external iv (iv1) and outer key.
+# Every output still gets its own random main iv and internal key, and
+# can be decrypted with plain decryptStream/decryptFile.
+# arguments:
+# passw: encryption password
+class Encryptor:
+    def __init__(self, passw):
+        if len(passw) > maxPassLen:
+            raise ValueError("Password is too long.")
+
+        # generate external iv and stretch password once
+        self.iv1 = urandom(AESBlockSize)
+        self.__key = stretch(passw, self.iv1)
+
+    def encryptStream(
+        self,
+        fIn,
+        fOut,
+        bufferSize=bufferSizeDef,
+        zeroCopy=False,
+        observer=None,
+        pipeline=False,
+        compress=None,
+    ):
+        bufferSize = resolveBufferSize(bufferSize, fIn)
+
+        # validate bufferSize
+        if bufferSize % AESBlockSize != 0:
+            raise ValueError("Buffer size must be a multiple of AES block size.")
+
+        if zeroCopy and pipeline:
+            raise ValueError("zeroCopy and pipeline cannot be used together.")
+
+        if compress is not None:
+            checkCodec(compress)
+
+        instrumentation = None
+        if observer is not None:
+            instrumentation = Instrumentation(observer)
+            fIn, fOut = instrumentation.begin(fIn, fOut)
+
+        encryptStreamKey(
+            fIn,
+            fOut,
+            self.iv1,
+            self.__key,
+            bufferSize,
+            zeroCopy,
+            instrumentation,
+            pipeline,
+            compress,
+        )
+
+        if instrumentation is not None:
+            instrumentation.end()
+
+    def encryptFile(self, infile, outfile, bufferSize="auto", compress=None):
+        processFiles(
+            infile,
+            outfile,
+            lambda fIn, fOut: self.encryptStream(
+                fIn, fOut, bufferSize, True, compress=compress
+            ),
+        )
+
+    def encryptBytes(self, data):
+        return encryptBytesKey(data, self.iv1, self.__key)
+
+    # get a push-style StreamEncryptor using the session key
+    def streamEncryptor(self):
+        return StreamEncryptor.withKey(self.iv1, self.__key)
+
+
+# push-style stream encryptor class
+# Encrypts data pushed in chunks of any size: the first update(data) call
+# returns the header followed by the ciphertext available so far, further
+# calls return the ciphertext available so far, finalize() returns the last
+# (padded) block and the trailer.
+# The header can also be taken on its own beforehand, by calling header().
+# Memory use is bounded by the chunk size.
+# arguments:
+# passw: encryption password
+class StreamEncryptor:
+    def __init__(self, passw):
+        if len(passw) > maxPassLen:
+            raise ValueError("Password is too long.")
+
+        # generate external iv and stretch password
+        iv1 = urandom(AESBlockSize)
+        self.__setup(iv1, stretch(passw, iv1))
+
+    # build a StreamEncryptor from an external iv and the key obtained by
+    # stretching the password with it
+    @classmethod
+    def withKey(cls, iv1, key):
+        self = cls.__new__(cls)
+        self.__setup(iv1, key)
+        return self
+
+    def __setup(self, iv1, key):
+        # generate and encrypt random main iv and internal key
+        iv0, intKey, c_iv_key, hmac1 = newKeys(iv1, key)
+
+        # build header
+        self.__header = buildHeader(iv1, c_iv_key, hmac1)
+
+        self.__payload = PayloadEncryptor(iv0, intKey)
+
+    # get the header (b"" if it was already returned), so that it can be
+    # sent on its own before any data is available
+    def header(self):
+        header = self.__header
+        self.__header = b""
+        return header
+
+    def update(self, data):
+        cText = self.__payload.update(data)
+        if self.__header:
+            return self.header() + cText
+        return cText
+
+    def finalize(self):
+        return self.header() + self.__payload.finalize()
+
+
+# encrypting writer class
+# A write-only file-like object encrypting everything written to it
+# into fOut. close() writes the trailer (but does not close fOut): if it
+# is used as a context manager and an exception is raised, the trailer is
+# not written, leaving an invalid (rather than a truncated but valid)
+# output.
+# arguments:
+# fOut: output binary stream
+# passw: encryption password
+# encryptor: StreamEncryptor to use instead of passw
+#            (e.g. from Encryptor.streamEncryptor())
+class EncryptingWriter:
+    def __init__(self, fOut, passw=None, encryptor=None):
+        if (passw is None) == (encryptor is None):
+            raise ValueError("Either a password or an encryptor must be provided.")
+        if encryptor is None:
+            encryptor = StreamEncryptor(passw)
+        self.__fOut = fOut
+        self.__encryptor = encryptor
+        self.closed = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        cText = self.__encryptor.update(data)
+        if cText:
+            self.__fOut.write(cText)
+        return len(data)
+
+    def flush(self):
+        flush = getattr(self.__fOut, "flush", None)
+        if flush is not None:
+            flush()
+
+    def close(self):
+        if not self.closed:
+            self.__fOut.write(self.__encryptor.finalize())
+            self.closed = True
+            self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.closed = True
+
+
+# decryption session class
+# Remembers the keys stretched for every external iv (iv1) seen, so that
+# files produced by the same Encryptor session (or decrypted more than once)
+# are decrypted without stretching the password again.
+# arguments:
+# passw: decryption password
+# maxKeys: maximum number of keys remembered by the session
+class Decryptor:
+    def __init__(self, passw, maxKeys=keyCacheSizeDef):
+        if len(passw) > maxPassLen:
+            raise ValueError("Password is too long.")
+
+        self.__passw = passw
+        self.keyCache = KeyCache(maxKeys)
+
+    def decryptStream(
+        self,
+        fIn,
+        fOut,
+        bufferSize=bufferSizeDef,
+        zeroCopy=False,
+        observer=None,
+        pipeline=False,
+    ):
+        decryptStream(
+            fIn,
+            fOut,
+            self.__passw,
+            bufferSize,
+            keyCache=self.keyCache,
+            zeroCopy=zeroCopy,
+            observer=observer,
+            pipeline=pipeline,
+        )
+
+    def decryptFile(self, infile, outfile, bufferSize="auto"):
+        decryptFile(infile, outfile, self.__passw, bufferSize, keyCache=self.keyCache)
+
+    def decryptBytes(self, data):
+        return decryptBytes(data, self.__passw, self.keyCache)
+
+    # get a push-style StreamDecryptor sharing the session keys
+    def streamDecryptor(self):
+        return StreamDecryptor(self.__passw, self.keyCache)
+
+    # forget all the remembered keys
+    def clear(self):
+        self.keyCache.clear()
+
+
+# push-style stream decryptor class
+# Decrypts an AES Crypt v2 stream pushed in chunks of any size: feed(data)
+# returns the plaintext available so far, finalize() returns the last
+# plaintext bytes and checks the HMAC.
+# Only the header (while incomplete) and the last 49 bytes of the stream
+# are held back, so memory use is bounded by the chunk size.
+# NOTE: with compression, a small chunk can expand to a huge plaintext:
+# feedChunks(data) and finalizeChunks() return iterators over the same
+# plaintext, in pieces of at most decompressChunkSize bytes, decompressed
+# only when requested (each iterator must be exhausted before the next
+# call).
+# NOTE: as with decryptStream, plaintext is returned before the HMAC
+# is checked, so it must not be trusted until finalize() returns.
+# arguments:
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+class StreamDecryptor:
+    def __init__(self, passw, keyCache=None):
+        if len(passw) > maxPassLen:
+            raise ValueError("Password is too long.")
+
+        self.__passw = passw
+        self.__keyCache = keyCache
+
+        # header parser, number of bytes it needs and header bytes buffer
+        self.__parser = headerParser()
+        self.__need = next(self.__parser)
+        self.__buf = bytearray()
+
+        # payload decryptor (available once the header is parsed)
+        self.__payload = None
+        # decompressor (if the header records a codec)
+        self.__decompressor = None
+
+    def feed(self, data):
+        return b"".join(self.feedChunks(data))
+
+    def feedChunks(self, data):
+        return self.__decompress(self.__update(data))
+
+    # decrypt data, parsing the header first
+    # returns: the (possibly compressed) plaintext available so far
+    def __update(self, data):
+        if self.__payload is not None:
+            return self.__payload.update(data)
+
+        # parse header as soon as enough bytes are available
+        self.__buf += data
+        while len(self.__buf) >= self.__need:
+            fdata = bytes(self.__buf[: self.__need])
+            del self.__buf[: self.__need]
+            try:
+                self.__need = self.__parser.send(fdata)
+            except StopIteration as ex:
+                hdr = ex.value
+                break
+        else:
+            return b""
+
+        # stretch password and iv (or get the key from the cache)
+        key = getKey(self.__passw, hdr.iv1, self.__keyCache)
+
+        # check password and get internal iv and key
+        iv0, intKey = decryptKeys(key, hdr)
+
+        if hdr.compression is not None:
+            self.__decompressor = StreamDecompressor(hdr.compression)
+
+        self.__payload = payloadDecryptor(hdr, iv0, intKey)
+        rest = bytes(self.__buf)
+        self.__buf = None
+        return self.__payload.update(rest)
+
+    def __decompress(self, data):
+        if self.__decompressor is None:
+            return iter((data,))
+        return self.__decompressor.chunks(data)
+
+    def finalize(self):
+        return b"".join(self.finalizeChunks())
+
+    def finalizeChunks(self):
+        if self.__payload is None:
+            # incomplete header: let the parser report the error
+            fdata = bytes(self.__buf)
+            try:
+                while True:
+                    self.__parser.send(fdata)
+                    fdata = b""
+            except StopIteration:
+                raise ValueError("File is corrupted.")
+
+        yield from self.__decompress(self.__payload.finalize())
+        if self.__decompressor is not None:
+            self.__decompressor.finish()
+
+
+# decrypting reader class
+# A read-only file-like object returning the plaintext of the encrypted
+# stream fIn, pulling ciphertext from it as needed (e.g. to feed
+# tarfile or any other consumer of readable streams).
+# NOTE: as with decryptStream, plaintext is returned before the HMAC is
+# checked: an error is raised only when the end of fIn is reached.
+# arguments:
+# fIn: input binary stream
+# passw: encryption password
+# keyCache: optional KeyCache instance used to look up/store the
+#           stretched key
+# bufferSize: number of ciphertext bytes read from fIn at a time
+class DecryptingReader(io.RawIOBase):
+    def __init__(self, fIn, passw, keyCache=None, bufferSize=bufferSizeDef):
+        super().__init__()
+        self.__fIn = fIn
+        self.__decryptor = StreamDecryptor(passw, keyCache)
+        self.__bufferSize = bufferSize
+        self.__buf = b""
+        self.__pos = 0
+        # iterator over the plaintext of the last ciphertext read
+        # (bounded pieces, even if it is decompressed)
+        self.__chunks = iter(())
+        self.__eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        # decrypt until some plaintext is available (or until EOF)
+        while self.__pos == len(self.__buf):
+            self.__buf = next(self.__chunks, None)
+            self.__pos = 0
+            if self.__buf is not None:
+                continue
+            self.__buf = b""
+            if self.__eof:
+                break
+            cText = self.__fIn.read(self.__bufferSize)
+            if cText:
+                self.__chunks = self.__decryptor.feedChunks(cText)
+            else:
+                # last bytes and HMAC check
+                self.__chunks = self.__decryptor.finalizeChunks()
+                self.__eof = True
+
+        n = min(len(b), len(self.__buf) - self.__pos)
+        with memoryview(b) as view:
+            view[:n] = self.__buf[self.__pos : self.__pos + n]
+        self.__pos += n
+        return n
+
+
 # BufferableFileobj class
 # A fileobj suitable as input to io.BufferedReader
 class BufferableFileobj:
@@ -418,6 +3180,10 @@ class BufferableFileobj:
         return self.__fileobj.read(n)
 
     def readinto(self, b):
+        # read directly into b, if the backing fileobj allows it
+        readinto = getattr(self.__fileobj, "readinto", None)
+        if readinto is not None:
+            return readinto(b)
         rbuf = self.read(len(b))
         n = len(rbuf)
         b[0:n] = rbuf
@@ -0,0 +1,147 @@
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# pyAesCrypt pipeline module
+# Background threads used by the pipelined stream mode: a reader thread
+# reading chunks ahead, and stages running a function (e.g. HMAC update or
+# output write) over chunks, in order. OpenSSL releases the GIL while
+# hashing/encrypting and so does the OS while reading/writing, hence
+# these overlap with the AES work done by the calling thread.
+
+import queue
+import threading
+
+# default number of chunks queued between threads
+pipelineDepthDef = 2
+
+# seconds close() waits for a reader thread to stop
+pipelineJoinTimeout = 1.0
+
+# end of items marker
+pipelineEnd = object()
+
+
+# read chunk function
+# reads size bytes from fIn (fewer bytes only at the end of stream)
+def readChunk(fIn, size):
+    data = fIn.read(size)
+    while 0 < len(data) < size:
+        more = fIn.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+# pipeline reader class
+# Reads chunks of size bytes from fIn in a background thread; get()
+# returns them in order, then b"" at the end of stream.
+# arguments:
+# fIn: input binary stream
+# size: chunk size
+# depth: maximum number of chunks read ahead
+class PipelineReader:
+    def __init__(self, fIn, size, depth=pipelineDepthDef):
+        self.__fIn = fIn
+        self.__size = size
+        self.__queue = queue.Queue(depth)
+        self.__stop = False
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        try:
+            while not self.__stop:
+                data = readChunk(self.__fIn, self.__size)
+                self.__queue.put(data)
+                if not data:
+                    break
+        except BaseException as ex:
+            # report the error to the consumer
+            self.__queue.put(ex)
+
+    def get(self):
+        item = self.__queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    # stop reading (unread chunks are discarded)
+    # Once the queue is drained, the thread puts at most one more item
+    # without blocking, then stops. A thread still blocked reading fIn
+    # (e.g. a pipe or a socket with no data) is not waited for beyond
+    # pipelineJoinTimeout: being a daemon, it is left to end with the read.
+    def close(self):
+        self.__stop = True
+        while True:
+            try:
+                self.__queue.get_nowait()
+            except queue.Empty:
+                break
+        self.__thread.join(pipelineJoinTimeout)
+
+
+# pipeline stage class
+# Runs func(item) in a background thread for every item put into it,
+# in order. If func raises, the remaining items are discarded and the
+# exception is raised again by the next put() or by close().
+# arguments:
+# func: function to run over the items
+# depth: maximum number of items queued
+class PipelineStage:
+    def __init__(self, func, depth=pipelineDepthDef):
+        self.__func = func
+        self.__queue = queue.Queue(depth)
+        self.__closed = False
+        self.error = None
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is pipelineEnd:
+                break
+            if self.error is None:
+                try:
+                    self.__func(item)
+                except BaseException as ex:
+                    self.error = ex
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        self.__queue.put(item)
+
+    # wait for all the items to be processed
+    def close(self):
+        if not self.__closed:
+            self.__closed = True
+            self.__queue.put(pipelineEnd)
+            self.__thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+# stop pipeline function
+# stops reader and stages after an error, ignoring their own errors
+def stopPipeline(reader, *stages):
+    reader.close()
+    for stage in stages:
+        try:
+            stage.close()
+        except BaseException:
+            pass
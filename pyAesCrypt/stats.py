@@ -0,0 +1,217 @@
+# ==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# pyAesCrypt stats module
+# Observers receive the progress and the per-phase timings of
+# encryptStream/decryptStream (and of the functions built on them).
+# Instrumentation works by wrapping the streams and the crypto objects in
+# timing proxies, so that the processing loops are the same with or without
+# an observer: when no observer is given, nothing is wrapped, hence there is
+# no cost at all.
+
+import os
+import stat
+import time
+
+# phases timed by the instrumentation
+phases = ("stretch", "read", "aes", "hmac", "write")
+
+
+# observer base class
+# Subclass it and override the methods you need.
+class Observer:
+    # called before processing starts
+    # total: input size in bytes (None if unknown)
+    def start(self, total):
+        pass
+
+    # called after every read from the input
+    # done: input bytes read so far
+    # total: input size in bytes (None if unknown)
+    def progress(self, done, total):
+        pass
+
+    # called once processing has completed successfully
+    # timings: dict mapping each phase in phases to the seconds spent in it
+    def finish(self, timings):
+        pass
+
+
+# stats observer class
+# Collects progress and timings, and computes throughput.
+# arguments:
+# onProgress: optional callable, called as onProgress(done, total) after
+#             every read from the input
+class Stats(Observer):
+    def __init__(self, onProgress=None):
+        self.onProgress = onProgress
+        self.total = None
+        self.done = 0
+        self.timings = dict.fromkeys(phases, 0.0)
+        self.elapsed = 0.0
+        self.__start = None
+
+    def start(self, total):
+        self.total = total
+        self.__start = time.perf_counter()
+
+    def progress(self, done, total):
+        self.done = done
+        if self.onProgress is not None:
+            self.onProgress(done, total)
+
+    def finish(self, timings):
+        self.elapsed = time.perf_counter() - self.__start
+        self.timings = timings
+
+    # input bytes processed per second
+    @property
+    def throughput(self):
+        if not self.elapsed:
+            return 0.0
+        return self.done / self.elapsed
+
+    # human-readable report
+    def report(self):
+        lines = [
+            "processed %.1f MB in %.3f s (%.1f MB/s)"
+            % (self.done / 1e6, self.elapsed, self.throughput / 1e6)
+        ]
+        other = self.elapsed - sum(self.timings.values())
+        for phase, seconds in list(self.timings.items()) + [("other", other)]:
+            share = seconds / self.elapsed * 100 if self.elapsed else 0.0
+            lines.append("  %-8s %9.3f s %6.1f%%" % (phase, seconds, share))
+        return "\n".join(lines)
+
+
+# stream size function
+# returns the number of bytes left in fIn, if it is a regular file,
+# None otherwise
+def streamSize(fIn):
+    try:
+        st = os.fstat(fIn.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return max(st.st_size - fIn.tell(), 0)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+# instrumentation class
+# Holds the timings of a single operation and forwards progress to
+# the observer.
+# arguments:
+# observer: Observer instance
+class Instrumentation:
+    def __init__(self, observer):
+        self.observer = observer
+        self.timings = dict.fromkeys(phases, 0.0)
+        self.total = None
+        self.done = 0
+
+    # start observing: returns the wrapped input and output streams
+    def begin(self, fIn, fOut):
+        self.total = streamSize(fIn)
+        self.observer.start(self.total)
+        return ObservedReader(fIn, self), TimedObject(fOut, self.timings, "write")
+
+    # count bytes read from the input
+    def advance(self, nbytes):
+        self.done += nbytes
+        self.observer.progress(self.done, self.total)
+
+    # stop observing, reporting timings
+    def end(self):
+        self.observer.finish(dict(self.timings))
+
+
+# timed call function
+# calls func(*args), adding the time spent to phase if instrumentation
+# is not None
+def timedCall(instrumentation, phase, func, *args):
+    if instrumentation is None:
+        return func(*args)
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        instrumentation.timings[phase] += time.perf_counter() - start
+
+
+# observed object function
+# returns obj wrapped in a TimedObject adding to phase, or obj itself if
+# instrumentation is None
+def observed(instrumentation, obj, phase):
+    if instrumentation is None:
+        return obj
+    return TimedObject(obj, instrumentation.timings, phase)
+
+
+# timing proxy class
+# Forwards attribute access to obj, adding the time spent in every method
+# call to timings[phase].
+class TimedObject:
+    def __init__(self, obj, timings, phase):
+        self.__obj = obj
+        self.__timings = timings
+        self.__phase = phase
+
+    def __getattr__(self, name):
+        attr = getattr(self.__obj, name)
+        if not callable(attr):
+            return attr
+        timings = self.__timings
+        phase = self.__phase
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                timings[phase] += time.perf_counter() - start
+
+        return timed
+
+
+# observed input stream class
+# A TimedObject for the "read" phase which also reports the number of
+# bytes read.
+class ObservedReader(TimedObject):
+    def __init__(self, fIn, instrumentation):
+        super().__init__(fIn, instrumentation.timings, "read")
+        self.__fIn = fIn
+        self.__instrumentation = instrumentation
+
+    def read(self, n=-1):
+        start = time.perf_counter()
+        data = self.__fIn.read(n)
+        self.__instrumentation.timings["read"] += time.perf_counter() - start
+        self.__instrumentation.advance(len(data))
+        return data
+
+    def readinto(self, b):
+        start = time.perf_counter()
+        readinto = getattr(self.__fIn, "readinto", None)
+        if readinto is not None:
+            n = readinto(b)
+        else:
+            data = self.__fIn.read(len(b))
+            n = len(data)
+            b[:n] = data
+        self.__instrumentation.timings["read"] += time.perf_counter() - start
+        if n:
+            self.__instrumentation.advance(n)
+        return n
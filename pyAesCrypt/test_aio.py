@@ -0,0 +1,120 @@
+#==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#==============================================================================
+
+# test suite for pyAesCrypt asyncio module
+
+import unittest
+import asyncio
+import io
+import os
+import pyAesCrypt
+
+# buffer size
+bufferSize = 64 * 1024
+
+# test data sizes
+sizes = [0, 4, 16, bufferSize, 2*bufferSize+19, 3*bufferSize]
+
+# test password
+password = "foopassword!1$A"
+
+
+# build an asyncio.StreamReader returning data
+def streamReader(data):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+# async output stream collecting written data, with coroutine write()
+class AsyncSink:
+    def __init__(self):
+        self.data = b''
+
+    async def write(self, data):
+        self.data += data
+
+
+# output stream with plain write() and coroutine drain(),
+# like asyncio.StreamWriter
+class DrainSink:
+    def __init__(self):
+        self.data = b''
+        self.drains = 0
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        self.drains += 1
+
+
+# test asyncio encryption/decryption
+class TestAsync(unittest.TestCase):
+
+    # encrypt data with encryptStreamAsync
+    def encrypt(self, pt):
+        async def run():
+            sink = AsyncSink()
+            await pyAesCrypt.encryptStreamAsync(streamReader(pt), sink,
+                                                password, bufferSize)
+            return sink.data
+        return asyncio.run(run())
+
+    # decrypt data with decryptStreamAsync
+    def decrypt(self, ct):
+        async def run():
+            sink = DrainSink()
+            await pyAesCrypt.decryptStreamAsync(streamReader(ct), sink,
+                                                password, bufferSize)
+            return sink.data
+        return asyncio.run(run())
+
+    # test async encryption/decryption
+    def test_async_enc_dec(self):
+        for size in sizes:
+            pt = os.urandom(size)
+            self.assertEqual(self.decrypt(self.encrypt(pt)), pt)
+
+    # test interoperability with stream functions
+    def test_async_interop(self):
+        for size in sizes:
+            pt = os.urandom(size)
+            # async encryption, sync decryption
+            fDec = io.BytesIO()
+            pyAesCrypt.decryptStream(io.BytesIO(self.encrypt(pt)), fDec,
+                                     password, bufferSize)
+            self.assertEqual(fDec.getvalue(), pt)
+            # sync encryption, async decryption
+            fCiph = io.BytesIO()
+            pyAesCrypt.encryptStream(io.BytesIO(pt), fCiph, password,
+                                     bufferSize)
+            self.assertEqual(self.decrypt(fCiph.getvalue()), pt)
+
+    # test async decryption of a corrupted stream
+    def test_async_bad_hmac(self):
+        ct = bytearray(self.encrypt(os.urandom(2*bufferSize+19)))
+        ct[-1] ^= 1
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               self.decrypt, bytes(ct))
+        # truncated stream
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               self.decrypt, bytes(ct[:-40]))
+
+
+if __name__ == '__main__':
+    unittest.main()
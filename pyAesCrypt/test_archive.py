@@ -0,0 +1,170 @@
+#==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#==============================================================================
+
+# test suite for pyAesCrypt archive module
+
+import unittest
+import io
+import os
+import shutil
+import filecmp
+import tarfile
+import pyAesCrypt
+from pyAesCrypt.archive import checkMember
+
+# test file directory name
+tfdirname = 'pyAesCryptArchiveTF'
+
+# test password
+password = "foopassword!1$A"
+
+# relative paths and sizes of the test files
+files = [('empty', 0), ('small', 4), (os.path.join('sub', 'med'), 100019),
+         (os.path.join('sub', 'deeper', 'text'), 50000)]
+
+
+# test encrypted archives
+class TestArchive(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        self.src = os.path.join(tfdirname, 'src')
+        for rp, size in files:
+            fp = os.path.join(self.src, rp)
+            os.makedirs(os.path.dirname(fp), exist_ok=True)
+            with open(fp, 'wb') as fout:
+                if rp.endswith('text'):
+                    fout.write(b'a' * size)
+                else:
+                    fout.write(os.urandom(size))
+        os.mkdir(os.path.join(self.src, 'emptydir'))
+        self.archive = os.path.join(tfdirname, 'src.tar.aes')
+        self.out = os.path.join(tfdirname, 'out')
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # check that the extracted tree matches the source tree
+    def checkTree(self):
+        for rp, size in files:
+            self.assertTrue(filecmp.cmp(os.path.join(self.src, rp),
+                                        os.path.join(self.out, 'src', rp),
+                                        shallow=False))
+        self.assertTrue(os.path.isdir(os.path.join(self.out, 'src',
+                                                   'emptydir')))
+
+    # test archive round trips
+    def test_archive(self):
+        for compress in (None, 'zlib', 'lzma'):
+            for verify in (True, False):
+                pyAesCrypt.encryptTree(self.src, self.archive, password,
+                                       compress=compress)
+                pyAesCrypt.decryptTree(self.archive, self.out, password,
+                                       verify=verify)
+                self.checkTree()
+                shutil.rmtree(self.out)
+
+    # test that the archive is a regular AES Crypt file holding a tar
+    def test_format(self):
+        pyAesCrypt.encryptTree(self.src, self.archive, password)
+        fTar = io.BytesIO()
+        with open(self.archive, 'rb') as fIn:
+            pyAesCrypt.decryptStream(fIn, fTar, password)
+        fTar.seek(0)
+        with tarfile.open(fileobj=fTar) as tar:
+            self.assertIn('src/sub/med', tar.getnames())
+
+    # test corrupted archives
+    def test_corrupted(self):
+        pyAesCrypt.encryptTree(self.src, self.archive, password)
+        with open(self.archive, 'r+b') as ftc:
+            ftc.seek(-100, os.SEEK_END)
+            last = ftc.read(1)
+            ftc.seek(-100, os.SEEK_END)
+            ftc.write(bytes([last[0] ^ 1]))
+        # nothing is extracted when verifying first
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               pyAesCrypt.decryptTree, self.archive,
+                               self.out, password)
+        self.assertFalse(os.path.exists(self.out))
+        # otherwise corruption is detected at the end
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               pyAesCrypt.decryptTree, self.archive,
+                               self.out, password, verify=False)
+        self.assertRaisesRegex(ValueError, "Wrong password",
+                               pyAesCrypt.decryptTree, self.archive,
+                               self.out, "wrong")
+
+    # test that unsafe members are not extracted
+    def test_unsafe_member(self):
+        with open(self.archive, 'wb') as fOut:
+            with pyAesCrypt.EncryptingWriter(fOut, password) as fEnc:
+                with tarfile.open(fileobj=fEnc, mode='w|') as tar:
+                    info = tarfile.TarInfo('../evil')
+                    info.size = 4
+                    tar.addfile(info, io.BytesIO(b'evil'))
+        self.assertRaisesRegex(ValueError, "Unsafe archive member",
+                               pyAesCrypt.decryptTree, self.archive,
+                               self.out, password)
+        self.assertFalse(os.path.exists(os.path.join(tfdirname, 'evil')))
+
+    # test member checks used on Python versions without tarfile filters
+    def test_check_member(self):
+        checkMember(tarfile.TarInfo('src/sub/med'))
+        for name, kind, linkname in (('../evil', tarfile.REGTYPE, ''),
+                                     ('/evil', tarfile.REGTYPE, ''),
+                                     ('src/a/../../evil', tarfile.DIRTYPE, ''),
+                                     ('link', tarfile.SYMTYPE, '/etc/passwd'),
+                                     ('link', tarfile.LNKTYPE, '../evil'),
+                                     ('dev', tarfile.CHRTYPE, '')):
+            info = tarfile.TarInfo(name)
+            info.type = kind
+            info.linkname = linkname
+            self.assertRaisesRegex(ValueError, "Unsafe archive member",
+                                   checkMember, info)
+
+    # test errors
+    def test_errors(self):
+        self.assertRaisesRegex(ValueError, "Unsupported archive compression",
+                               pyAesCrypt.encryptTree, self.src, self.archive,
+                               password, compress='zstd')
+        self.assertRaisesRegex(ValueError, "input directory",
+                               pyAesCrypt.encryptTree,
+                               os.path.join(tfdirname, 'missing'),
+                               self.archive, password)
+        self.assertRaisesRegex(ValueError, "Unable to read input file",
+                               pyAesCrypt.decryptTree,
+                               os.path.join(tfdirname, 'missing.aes'),
+                               self.out, password, verify=False)
+        # plain encrypted files are not archives
+        pyAesCrypt.encryptFile(os.path.join(self.src, 'small'), self.archive,
+                               password)
+        self.assertRaisesRegex(ValueError, "not a valid encrypted archive",
+                               pyAesCrypt.decryptTree, self.archive,
+                               self.out, password)
+
+
+if __name__ == '__main__':
+    unittest.main()
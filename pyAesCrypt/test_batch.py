@@ -0,0 +1,170 @@
+#==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#==============================================================================
+
+# test suite for pyAesCrypt batch module
+
+import unittest
+import os
+import shutil
+import filecmp
+import pyAesCrypt
+from pyAesCrypt.batch import filePairs, runFileJobs
+
+# test file directory name
+tfdirname = 'pyAesCryptBatchTF'
+
+# buffer size
+bufferSize = 64 * 1024
+
+# test password
+password = "foopassword!1$A"
+
+# relative paths of the test files
+relpaths = ['empty', 'small', os.path.join('sub', 'med'),
+            os.path.join('sub', 'deeper', 'big')]
+
+# sizes of the test files
+sizes = [0, 4, 2*bufferSize+19, 3*bufferSize]
+
+
+# test batch encryption/decryption
+class TestBatch(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        self.src = os.path.join(tfdirname, 'src')
+        for rp, size in zip(relpaths, sizes):
+            fp = os.path.join(self.src, rp)
+            os.makedirs(os.path.dirname(fp), exist_ok=True)
+            with open(fp, 'wb') as fout:
+                fout.write(os.urandom(size))
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test encryption and decryption of a directory tree
+    def test_batch_tree(self):
+        enc = os.path.join(tfdirname, 'enc')
+        dec = os.path.join(tfdirname, 'dec')
+        results = pyAesCrypt.encryptFiles(filePairs(self.src, enc), password,
+                                          bufferSize, workers=3)
+        self.assertEqual(len(results), len(relpaths))
+        self.assertTrue(all(res.ok for res in results))
+        results = pyAesCrypt.decryptFiles(filePairs(enc, dec, True), password,
+                                          bufferSize, workers=3)
+        self.assertEqual(len(results), len(relpaths))
+        self.assertTrue(all(res.ok for res in results))
+        for rp in relpaths:
+            self.assertTrue(filecmp.cmp(os.path.join(self.src, rp),
+                                        os.path.join(dec, rp)))
+
+    # test batch encryption using a process pool
+    def test_batch_processes(self):
+        pairs = list(filePairs(self.src))
+        results = pyAesCrypt.encryptFiles(pairs, password, bufferSize,
+                                          workers=2, useProcesses=True)
+        self.assertTrue(all(res.ok for res in results))
+        for pt, ct in pairs:
+            pyAesCrypt.decryptFile(ct, pt + '.decr', password)
+            self.assertTrue(filecmp.cmp(pt, pt + '.decr'))
+
+    # test that errors are reported per file
+    def test_batch_errors(self):
+        pairs = list(filePairs(self.src))
+        pyAesCrypt.encryptFiles(pairs, password, bufferSize)
+        # corrupt one of the encrypted files
+        with open(pairs[1][1], 'r+b') as ftc:
+            ftc.truncate(10)
+        decPairs = [(ct, pt + '.decr') for pt, ct in pairs]
+        decPairs.append((os.path.join(tfdirname, 'missing.aes'),
+                         os.path.join(tfdirname, 'missing')))
+        results = pyAesCrypt.decryptFiles(decPairs, password, bufferSize,
+                                          workers=2)
+        self.assertEqual([res.infile for res in results],
+                         [ct for ct, pt in decPairs])
+        self.assertEqual([res.ok for res in results],
+                         [True, False, True, True, False])
+        self.assertEqual(results[1].error, "File is corrupted.")
+        self.assertEqual(results[4].error, "Unable to read input file.")
+
+    # test that an OSError is reported per file, without aborting the batch
+    def test_batch_oserror(self):
+        pairs = list(filePairs(self.src))
+        pairs.insert(1, (os.path.join(tfdirname, 'missing'),
+                         os.path.join(tfdirname, 'missing.copy')))
+        results = list(runFileJobs(shutil.copyfile, pairs, workers=2))
+        self.assertEqual([res.ok for res in results],
+                         [True, False, True, True, True])
+        self.assertIn("No such file", results[1].error)
+        for infile, outfile in pairs[:1] + pairs[2:]:
+            self.assertTrue(filecmp.cmp(infile, outfile))
+
+    # test batch decryption with key prefetching
+    def test_batch_prefetch(self):
+        pairs = list(filePairs(self.src))
+        pyAesCrypt.encryptFiles(pairs, password, bufferSize)
+        decPairs = [(ct, pt + '.decr') for pt, ct in pairs]
+        # a missing file is reported by the payload stage
+        decPairs.insert(1, (os.path.join(tfdirname, 'missing.aes'),
+                            os.path.join(tfdirname, 'missing')))
+        prefetcher = pyAesCrypt.KeyPrefetcher(workers=2, depth=2)
+        keyCache = pyAesCrypt.KeyCache()
+        results = pyAesCrypt.decryptFiles(decPairs, password, bufferSize,
+                                          workers=2, keyCache=keyCache,
+                                          prefetcher=prefetcher)
+        self.assertEqual([res.ok for res in results],
+                         [True, False, True, True, True])
+        for pt, ct in pairs:
+            self.assertTrue(filecmp.cmp(pt, pt + '.decr'))
+        # every key was derived by the prefetcher
+        self.assertEqual(prefetcher.keys, len(pairs))
+        self.assertEqual(keyCache.misses, 0)
+        self.assertGreater(prefetcher.deriveTime, 0)
+        self.assertGreaterEqual(prefetcher.hiddenTime, 0)
+        self.assertIn("hidden", prefetcher.report())
+        # keys cannot be handed to worker processes
+        self.assertRaises(ValueError, pyAesCrypt.decryptFiles, decPairs,
+                          password, useProcesses=True, prefetcher=prefetcher)
+
+    # test verification of many files
+    def test_batch_verify(self):
+        pairs = list(filePairs(self.src))
+        pyAesCrypt.encryptFiles(pairs, password, bufferSize)
+        # corrupt one of the encrypted files
+        with open(pairs[2][1], 'r+b') as ftc:
+            ftc.seek(-1, os.SEEK_END)
+            last = ftc.read(1)
+            ftc.seek(-1, os.SEEK_END)
+            ftc.write(bytes([last[0] ^ 1]))
+        results = pyAesCrypt.verifyFiles([ct for pt, ct in pairs], password,
+                                         workers=2)
+        self.assertEqual([res.ok for res in results],
+                         [True, True, False, True])
+        self.assertEqual(results[2].error, "Bad HMAC (file is corrupted).")
+        self.assertIsNone(results[2].outfile)
+
+
+if __name__ == '__main__':
+    unittest.main()
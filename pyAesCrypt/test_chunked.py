@@ -0,0 +1,294 @@
+#==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#==============================================================================
+
+# test suite for pyAesCrypt chunked container mode
+
+import unittest
+import asyncio
+import io
+import os
+import shutil
+import filecmp
+import subprocess
+import sys
+import pyAesCrypt
+from pyAesCrypt.chunked import recordOverhead
+from pyAesCrypt.test_helpers import SimpleFile
+
+# test file directory name
+tfdirname = 'pyAesCryptChunkedTF'
+
+# chunk size
+chunkSize = 1024
+
+# test password
+password = "foopassword!1$A"
+
+# command line script and the environment to run it from the source tree
+srcdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+script = os.path.join(srcdir, 'bin', 'pyAesCrypt')
+scriptEnv = dict(os.environ, PYTHONPATH=srcdir)
+
+# test data (not a whole number of chunks)
+pdata = os.urandom(10 * chunkSize + 100)
+
+# shared key cache (keeps the tests fast)
+keyCache = pyAesCrypt.KeyCache()
+
+
+# encrypt data into a chunked container
+def encrypt(data=pdata, csize=chunkSize, workers=1):
+    fCiph = io.BytesIO()
+    pyAesCrypt.encryptStreamChunked(io.BytesIO(data), fCiph, password, csize,
+                                    workers)
+    return fCiph.getvalue()
+
+
+# decrypt a chunked container through every decryption path
+def decryptAll(ctext):
+    results = []
+    for kwargs in ({}, {'zeroCopy': True}, {'pipeline': True}):
+        fDec = io.BytesIO()
+        pyAesCrypt.decryptStream(io.BytesIO(ctext), fDec, password,
+                                 keyCache=keyCache, **kwargs)
+        results.append(fDec.getvalue())
+    fDec = io.BytesIO()
+    pyAesCrypt.decryptStream(SimpleFile(io.BytesIO(ctext)), fDec, password,
+                             keyCache=keyCache)
+    results.append(fDec.getvalue())
+    for workers in (1, 3):
+        fDec = io.BytesIO()
+        pyAesCrypt.decryptStreamChunked(io.BytesIO(ctext), fDec, password,
+                                        keyCache, workers)
+        results.append(fDec.getvalue())
+    results.append(pyAesCrypt.decryptBytes(ctext, password, keyCache))
+    dec = pyAesCrypt.StreamDecryptor(password, keyCache)
+    out = b''.join(dec.feed(ctext[i:i + 100])
+                   for i in range(0, len(ctext), 100))
+    results.append(out + dec.finalize())
+    with pyAesCrypt.crypto.randomAccessReader(io.BytesIO(ctext), password,
+                                              keyCache) as fDec:
+        results.append(fDec.read())
+    return results
+
+
+# test chunked encryption/decryption
+class TestChunked(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        self.pt = os.path.join(tfdirname, 'data')
+        with open(self.pt, 'wb') as fout:
+            fout.write(pdata)
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test round trips around chunk boundaries
+    def test_stream(self):
+        for size in (0, 1, 16, chunkSize - 1, chunkSize, chunkSize + 1,
+                     3 * chunkSize, len(pdata)):
+            for workers in (1, 2):
+                ctext = encrypt(pdata[:size], workers=workers)
+                hdr = pyAesCrypt.readHeader(io.BytesIO(ctext))
+                self.assertEqual(hdr.chunkSize, chunkSize)
+                # whole chunks, then a final (padded) chunk
+                self.assertEqual(
+                    hdr.payloadSize,
+                    size // chunkSize * (chunkSize + recordOverhead) +
+                    (size % chunkSize // 16 + 1) * 16 + recordOverhead)
+                for result in decryptAll(ctext):
+                    self.assertEqual(result, pdata[:size])
+                pyAesCrypt.verifyStream(io.BytesIO(ctext), password,
+                                        keyCache=keyCache)
+
+    # test async decryption
+    def test_async(self):
+        ctext = encrypt()
+
+        async def decrypt():
+            reader = asyncio.StreamReader()
+            reader.feed_data(ctext)
+            reader.feed_eof()
+            fDec = io.BytesIO()
+            await pyAesCrypt.decryptStreamAsync(reader, fDec, password,
+                                                keyCache=keyCache)
+            return fDec.getvalue()
+
+        self.assertEqual(asyncio.run(decrypt()), pdata)
+
+    # test detection of tampered, reordered and truncated chunks
+    def test_tampering(self):
+        ctext = encrypt()
+        hdrSize = pyAesCrypt.readHeader(io.BytesIO(ctext)).headerSize
+        recordSize = chunkSize + recordOverhead
+
+        def record(i):
+            return ctext[hdrSize + i * recordSize:hdrSize + (i + 1) * recordSize]
+
+        flipped = bytearray(ctext)
+        flipped[hdrSize + recordSize + 100] ^= 1
+        finalFlag = bytearray(ctext)
+        finalFlag[hdrSize + recordSize] = 1
+        swapped = ctext[:hdrSize] + record(1) + record(0) + ctext[hdrSize + 2 * recordSize:]
+        tampered = [
+            bytes(flipped),
+            bytes(finalFlag),
+            swapped,
+            # truncated at a chunk boundary
+            ctext[:hdrSize + 3 * recordSize],
+            ctext[:-1],
+            ctext + b'\x00',
+            # a chunk repeated
+            ctext[:hdrSize] + record(0) + ctext[hdrSize:],
+        ]
+        for ctext in tampered:
+            for func in (
+                    lambda: pyAesCrypt.decryptBytes(ctext, password, keyCache),
+                    lambda: pyAesCrypt.decryptStream(
+                        io.BytesIO(ctext), io.BytesIO(), password,
+                        keyCache=keyCache),
+                    lambda: pyAesCrypt.decryptStreamChunked(
+                        io.BytesIO(ctext), io.BytesIO(), password, keyCache,
+                        workers=2),
+                    lambda: pyAesCrypt.verifyStream(
+                        io.BytesIO(ctext), password, keyCache=keyCache),
+                    lambda: pyAesCrypt.crypto.randomAccessReader(
+                        io.BytesIO(ctext), password, keyCache).read()):
+                self.assertRaisesRegex(ValueError, "corrupted", func)
+
+        # chunks preceding a bad one are written, and can be trusted
+        fDec = io.BytesIO()
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               pyAesCrypt.decryptStreamChunked,
+                               io.BytesIO(tampered[0]), fDec, password,
+                               keyCache)
+        self.assertEqual(fDec.getvalue(), pdata[:chunkSize])
+
+    # test random access
+    def test_random_access(self):
+        ctext = encrypt()
+        with pyAesCrypt.crypto.randomAccessReader(io.BytesIO(ctext), password,
+                                                  keyCache) as fDec:
+            self.assertIsInstance(fDec, pyAesCrypt.ChunkedFile)
+            self.assertEqual(fDec.size, len(pdata))
+            for offset, length in ((0, 10), (chunkSize - 5, 10),
+                                   (5, 3 * chunkSize), (len(pdata) - 3, 10),
+                                   (len(pdata) + 5, 10)):
+                self.assertEqual(fDec.readRange(offset, length),
+                                 pdata[offset:offset + length])
+            fDec.seek(-50, io.SEEK_END)
+            self.assertEqual(fDec.read(), pdata[-50:])
+            fDec.verify()
+        self.assertEqual(
+            pyAesCrypt.decryptRange(io.BytesIO(ctext), password, 2000, 100,
+                                    keyCache),
+            pdata[2000:2100])
+        # a tampered chunk is only reported when read
+        flipped = bytearray(ctext)
+        flipped[-2000] ^= 1
+        fDec = pyAesCrypt.ChunkedFile(io.BytesIO(bytes(flipped)), password,
+                                      keyCache)
+        self.assertEqual(fDec.readRange(0, 100), pdata[:100])
+        self.assertRaisesRegex(ValueError, "Bad HMAC", fDec.verify)
+
+    # test file encryption/decryption
+    def test_files(self):
+        ct = self.pt + '.aes'
+        dt = self.pt + '.decr'
+        for workers in (1, 2):
+            pyAesCrypt.encryptFile(self.pt, ct, password, chunkSize=chunkSize,
+                                   workers=workers)
+            for kwargs in ({}, {'useMmap': True}, {'workers': 2},
+                           {'workers': 2, 'useProcesses': True},
+                           {'useFd': True}):
+                pyAesCrypt.decryptFile(ct, dt, password, keyCache=keyCache,
+                                       **kwargs)
+                self.assertTrue(filecmp.cmp(self.pt, dt))
+                os.remove(dt)
+            pyAesCrypt.verifyFile(ct, password, keyCache=keyCache)
+            with pyAesCrypt.openDecrypted(ct, password, keyCache) as fDec:
+                self.assertEqual(fDec.read(), pdata)
+        results = pyAesCrypt.encryptFiles([(self.pt, ct)], password,
+                                          chunkSize=chunkSize)
+        self.assertTrue(results[0].ok)
+        self.assertEqual(pyAesCrypt.readHeader(open(ct, 'rb')).chunkSize,
+                         chunkSize)
+
+    # test unsupported uses
+    def test_errors(self):
+        for csize in (0, 1000, 128 * 1024 * 1024):
+            self.assertRaisesRegex(ValueError, "Chunk size", encrypt,
+                                   pdata, csize)
+        self.assertRaisesRegex(ValueError, "requires a chunkSize",
+                               pyAesCrypt.encryptFile, self.pt,
+                               self.pt + '.aes', password, workers=2)
+        self.assertRaisesRegex(ValueError, "cannot be used with",
+                               pyAesCrypt.encryptFile, self.pt,
+                               self.pt + '.aes', password,
+                               chunkSize=chunkSize, compress='zlib')
+        ctext = encrypt()
+        self.assertRaisesRegex(ValueError, "Chunked files",
+                               pyAesCrypt.DecryptedFile, io.BytesIO(ctext),
+                               password, keyCache)
+        fCiph = io.BytesIO()
+        pyAesCrypt.encryptStream(io.BytesIO(pdata), fCiph, password)
+        self.assertRaisesRegex(ValueError, "not a chunked file",
+                               pyAesCrypt.decryptStreamChunked,
+                               io.BytesIO(fCiph.getvalue()), io.BytesIO(),
+                               password)
+        self.assertRaisesRegex(ValueError, "Wrong password",
+                               pyAesCrypt.decryptStreamChunked,
+                               io.BytesIO(ctext), io.BytesIO(), 'wrong')
+
+    # test the command line chunk size option
+    def test_script(self):
+        def run(*args):
+            return subprocess.run(
+                [sys.executable, script, '-p', password] + list(args),
+                env=scriptEnv, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, universal_newlines=True)
+
+        ct = self.pt + '.aes'
+        dt = self.pt + '.decr'
+        res = run('-e', '-c', '1K', '-j', '2', '-o', ct, self.pt)
+        self.assertEqual(res.returncode, 0, res.stderr)
+        self.assertEqual(pyAesCrypt.readHeader(open(ct, 'rb')).chunkSize,
+                         1024)
+        res = run('-d', '-o', dt, ct)
+        self.assertEqual(res.returncode, 0, res.stderr)
+        self.assertTrue(filecmp.cmp(self.pt, dt))
+
+        # invalid sizes are rejected by argument parsing
+        for size, msg in (('auto', 'invalid chunk size'),
+                          ('1000', 'multiple of 16'),
+                          ('128M', 'must not exceed')):
+            res = run('-e', '-c', size, self.pt)
+            self.assertEqual(res.returncode, 2)
+            self.assertIn(msg, res.stderr)
+            self.assertNotIn('Traceback', res.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
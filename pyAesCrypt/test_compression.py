@@ -0,0 +1,243 @@
+#==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#==============================================================================
+
+# test suite for pyAesCrypt compression module
+
+import unittest
+import asyncio
+import io
+import os
+import shutil
+import filecmp
+import lzma
+import zlib
+import pyAesCrypt
+from pyAesCrypt.compression import (DecompressingWriter, StreamDecompressor,
+                                    decompressChunkSize, zstandard)
+from pyAesCrypt.test_helpers import SimpleFile
+
+# test file directory name
+tfdirname = 'pyAesCryptCompressionTF'
+
+# buffer size
+bufferSize = 64 * 1024
+
+# test password
+password = "foopassword!1$A"
+
+# available codecs
+codecs = ['zlib', 'lzma']
+if zstandard is not None:
+    codecs.append('zstd')
+
+# compressible test data
+pdata = b''.join(b'line %d: some log message\n' % i for i in range(20000))
+
+
+# test compressed encryption/decryption
+class TestCompression(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        self.pt = os.path.join(tfdirname, 'data')
+        with open(self.pt, 'wb') as fout:
+            fout.write(pdata)
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # encrypt pdata with codec
+    def encrypt(self, codec, data=pdata, bsize=bufferSize):
+        fCiph = io.BytesIO()
+        pyAesCrypt.encryptStream(io.BytesIO(data), fCiph, password, bsize,
+                                 compress=codec)
+        return fCiph.getvalue()
+
+    # test stream round trips through every decryption path
+    def test_stream(self):
+        for codec in codecs:
+            for data in (b'', b'x', pdata):
+                ctext = self.encrypt(codec, data, 1024)
+                hdr = pyAesCrypt.readHeader(io.BytesIO(ctext))
+                self.assertEqual(hdr.compression, codec)
+                for kwargs in ({}, {'zeroCopy': True}, {'pipeline': True}):
+                    fDec = io.BytesIO()
+                    pyAesCrypt.decryptStream(io.BytesIO(ctext), fDec,
+                                             password, 1024, **kwargs)
+                    self.assertEqual(fDec.getvalue(), data)
+                # peek loop
+                fDec = io.BytesIO()
+                pyAesCrypt.decryptStream(
+                    io.BufferedReader(io.BytesIO(ctext)), fDec, password, 1024)
+                self.assertEqual(fDec.getvalue(), data)
+                # simplest possible input stream
+                fDec = io.BytesIO()
+                pyAesCrypt.decryptStream(SimpleFile(io.BytesIO(ctext)), fDec,
+                                         password, 1024)
+                self.assertEqual(fDec.getvalue(), data)
+            # compressible data gets smaller
+            self.assertLess(len(self.encrypt(codec)), len(pdata) // 5)
+
+    # test that uncompressed files have no codec
+    def test_uncompressed(self):
+        ctext = self.encrypt(None)
+        hdr = pyAesCrypt.readHeader(io.BytesIO(ctext))
+        self.assertIsNone(hdr.compression)
+        self.assertEqual(len(ctext),
+                         hdr.headerSize + -(-len(pdata) // 16) * 16 + 33)
+
+    # test push-style, bytes and async decryption
+    def test_other_apis(self):
+        for codec in codecs:
+            ctext = self.encrypt(codec)
+            dec = pyAesCrypt.StreamDecryptor(password)
+            out = b''.join(dec.feed(ctext[i:i + 100])
+                           for i in range(0, len(ctext), 100))
+            self.assertEqual(out + dec.finalize(), pdata)
+            self.assertEqual(pyAesCrypt.decryptBytes(ctext, password), pdata)
+
+            async def decrypt():
+                reader = asyncio.StreamReader()
+                reader.feed_data(ctext)
+                reader.feed_eof()
+                fDec = io.BytesIO()
+                await pyAesCrypt.decryptStreamAsync(reader, fDec, password)
+                return fDec.getvalue()
+
+            self.assertEqual(asyncio.run(decrypt()), pdata)
+
+    # test file encryption/decryption, falling back to the stream path
+    def test_files(self):
+        ct = self.pt + '.aes'
+        dt = self.pt + '.decr'
+        for codec in codecs:
+            pyAesCrypt.encryptFile(self.pt, ct, password, compress=codec)
+            for kwargs in ({}, {'useMmap': True}, {'workers': 2},
+                           {'useFd': True}):
+                pyAesCrypt.decryptFile(ct, dt, password, **kwargs)
+                self.assertTrue(filecmp.cmp(self.pt, dt))
+                os.remove(dt)
+        results = pyAesCrypt.encryptFiles([(self.pt, ct)], password,
+                                          compress='zlib')
+        self.assertTrue(results[0].ok)
+        enc = pyAesCrypt.Encryptor(password)
+        enc.encryptFile(self.pt, ct, compress='lzma')
+        pyAesCrypt.decryptFile(ct, dt, password)
+        self.assertTrue(filecmp.cmp(self.pt, dt))
+
+    # test unsupported uses
+    def test_errors(self):
+        self.assertRaisesRegex(ValueError, "Unsupported compression codec",
+                               pyAesCrypt.encryptStream, io.BytesIO(pdata),
+                               io.BytesIO(), password, compress='rar')
+        if zstandard is None:
+            self.assertRaisesRegex(ValueError, "requires the zstandard",
+                                   pyAesCrypt.encryptStream,
+                                   io.BytesIO(pdata), io.BytesIO(), password,
+                                   compress='zstd')
+        self.assertRaisesRegex(ValueError, "useMmap", pyAesCrypt.encryptFile,
+                               self.pt, self.pt + '.aes', password,
+                               useMmap=True, compress='zlib')
+        # random access is not possible
+        ctext = self.encrypt('zlib')
+        self.assertRaisesRegex(ValueError, "as a stream",
+                               pyAesCrypt.DecryptedFile, io.BytesIO(ctext),
+                               password)
+
+    # test detection of truncated and corrupted compressed data
+    def test_decompressor(self):
+        for codec, compress in (('zlib', zlib.compress),
+                                ('lzma', lzma.compress)):
+            comp = compress(pdata)
+            dec = StreamDecompressor(codec)
+            self.assertEqual(dec.update(comp), pdata)
+            dec.finish()
+            dec = StreamDecompressor(codec)
+            dec.update(comp[:len(comp) // 2])
+            self.assertRaisesRegex(ValueError, "truncated", dec.finish)
+            dec = StreamDecompressor(codec)
+            self.assertRaisesRegex(ValueError, "corrupted", dec.update,
+                                   b'not compressed data')
+
+    # test that highly compressed data is decompressed in bounded chunks
+    def test_bounded_output(self):
+        compressors = [('zlib', zlib.compress), ('lzma', lzma.compress)]
+        if zstandard is not None:
+            compressors.append(('zstd',
+                                zstandard.ZstdCompressor().compress))
+        size = 16 * decompressChunkSize
+        for codec, compress in compressors:
+            comp = compress(bytes(size))
+            self.assertLess(len(comp), size // 100)
+            chunkSizes = []
+
+            # output stream recording the size of each write
+            class Sink:
+                def write(self, data):
+                    chunkSizes.append(len(data))
+
+            writer = DecompressingWriter(Sink(), codec)
+            writer.write(comp)
+            writer.finish()
+            self.assertEqual(sum(chunkSizes), size)
+            self.assertLessEqual(max(chunkSizes), decompressChunkSize)
+
+    # test that the push-style, reader and async decryption of highly
+    # compressed data yield bounded chunks
+    def test_bounded_decryption(self):
+        size = 8 * decompressChunkSize
+        for codec in codecs:
+            fCiph = io.BytesIO()
+            pyAesCrypt.encryptStream(io.BytesIO(bytes(size)), fCiph,
+                                     password, compress=codec)
+            ctext = fCiph.getvalue()
+
+            dec = pyAesCrypt.StreamDecryptor(password)
+            chunks = list(dec.feedChunks(ctext)) + list(dec.finalizeChunks())
+            self.assertEqual(b''.join(chunks), bytes(size))
+            self.assertLessEqual(max(map(len, chunks)), decompressChunkSize)
+
+            fDec = pyAesCrypt.DecryptingReader(io.BytesIO(ctext), password)
+            self.assertEqual(fDec.read(), bytes(size))
+
+            chunkSizes = []
+
+            # output stream recording the size of each write
+            class Sink:
+                def write(self, data):
+                    chunkSizes.append(len(data))
+
+            async def decrypt():
+                reader = asyncio.StreamReader()
+                reader.feed_data(ctext)
+                reader.feed_eof()
+                await pyAesCrypt.decryptStreamAsync(reader, Sink(), password)
+
+            asyncio.run(decrypt())
+            self.assertEqual(sum(chunkSizes), size)
+            self.assertLessEqual(max(chunkSizes), decompressChunkSize)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,12 +17,16 @@
 # test suite for pyAesCrypt
 
 import unittest
+from unittest import mock
+import io
 import os
 import shutil
 import filecmp
 import subprocess
+import time
 from os.path import isfile
 import pyAesCrypt
+from pyAesCrypt.test_helpers import SimpleFile
 
 # test file directory name
 tfdirname = 'pyAesCryptTF'
@@ -394,16 +398,1030 @@ class TestExceptions(unittest.TestCase):
         # check that the original file was not modified
         self.assertTrue(filecmp.cmp(self.tfile, self.tfilebak))
     
-# simple file access class with only read() and tell() methods, nothing more
-class SimpleFile:
-    def __init__(self, f):
+# test key stretching against reference vectors
+# (computed with the original per-round cryptography Hash loop)
+class TestStretch(unittest.TestCase):
+    # reference vectors: (password, iv1, key)
+    vectors = [
+        ("foopassword!1$A", bytes(range(16)),
+         "c9bb703cff165a85a418a135865aa8d382c25018abffad149fb82c6bbc7572d7"),
+        ("", bytes(range(16)),
+         "3899fa70f6ac07ed70f237750bd18469b4028cc20fcd8f2e4e561388c84c3e6a"),
+        ("p\u00e4ssw\u00f6rd\u2713", bytes(range(16)),
+         "8a04678dfac11b9f3c357bdd15d4410fe972797f7a82c1771e35a5bd5c5ab99e"),
+    ]
+
+    def test_stretch_vectors(self):
+        for passw, iv1, key in self.vectors:
+            self.assertEqual(pyAesCrypt.crypto.stretch(passw, iv1).hex(), key)
+
+
+# test parallel decryption
+class TestParallelDec(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test parallel decryption of files
+    def test_dec_parallel(self):
+        for pt, ct, ou in zip(filenames, encfilenames, decfilenames):
+            pyAesCrypt.encryptFile(pt, ct, password, bufferSize)
+            pyAesCrypt.decryptFile(ct, ou, password, bufferSize, workers=3)
+            self.assertTrue(filecmp.cmp(pt, ou))
+
+    # test parallel decryption with small segments
+    def test_dec_parallel_segments(self):
+        for pt, ct in zip(filenames, encfilenames):
+            pyAesCrypt.encryptFile(pt, ct, password, bufferSize)
+            fDec = io.BytesIO()
+            with open(ct, 'rb') as fIn:
+                pyAesCrypt.crypto.decryptStreamParallel(fIn, fDec, password,
+                                                        4, segmentSize=48)
+            with open(pt, 'rb') as fIn:
+                self.assertEqual(fDec.getvalue(), fIn.read())
+
+    # test that a slow HMAC does not queue up the whole payload
+    def test_dec_parallel_slow_hmac(self):
+        segmentSize = 1024
+        workers = 2
+        counts = {'read': 0, 'hashed': 0, 'lag': 0}
+
+        class CountingFile:
+            def __init__(self, f):
+                self.f = f
+
+            def read(self, size = -1):
+                data = self.f.read(size)
+                if len(data) >= segmentSize:
+                    counts['read'] += 1
+                return data
+
+            def seek(self, *args):
+                return self.f.seek(*args)
+
+            def seekable(self):
+                return True
+
+            def tell(self):
+                return self.f.tell()
+
+        class SlowHMAC:
+            def __init__(self, *args, **kwargs):
+                self.h = realHMAC(*args, **kwargs)
+
+            def update(self, data):
+                if len(data) >= segmentSize:
+                    counts['lag'] = max(counts['lag'],
+                                        counts['read'] - counts['hashed'])
+                    time.sleep(0.005)
+                    counts['hashed'] += 1
+                self.h.update(data)
+
+            def __getattr__(self, name):
+                return getattr(self.h, name)
+
+        realHMAC = pyAesCrypt.crypto.hmac.HMAC
+        pdata = os.urandom(64 * segmentSize)
+        fCiph = io.BytesIO()
+        pyAesCrypt.encryptStream(io.BytesIO(pdata), fCiph, password)
+        fDec = io.BytesIO()
+        with mock.patch.object(pyAesCrypt.crypto.hmac, 'HMAC', SlowHMAC):
+            pyAesCrypt.crypto.decryptStreamParallel(
+                CountingFile(io.BytesIO(fCiph.getvalue())), fDec, password,
+                workers, segmentSize=segmentSize)
+        self.assertEqual(fDec.getvalue(), pdata)
+        self.assertEqual(counts['hashed'], 64)
+        self.assertLessEqual(counts['lag'], 2 * workers)
+
+    # test parallel decryption using a process pool
+    def test_dec_parallel_processes(self):
+        pyAesCrypt.encryptFile(filenames[4], encfilenames[4], password,
+                               bufferSize)
+        pyAesCrypt.decryptFile(encfilenames[4], decfilenames[4], password,
+                               bufferSize, workers=2, useProcesses=True)
+        self.assertTrue(filecmp.cmp(filenames[4], decfilenames[4]))
+
+    # test parallel decryption of a file with bad hmac
+    def test_dec_parallel_bad_hmac(self):
+        pyAesCrypt.encryptFile(filenames[4], encfilenames[4], password,
+                               bufferSize)
+        fsize = os.stat(encfilenames[4]).st_size
+        corruptFile(encfilenames[4], fsize - 100)
+        self.assertRaisesRegex(ValueError, ("Bad HMAC "
+                                            "\\(file is corrupted\\)."),
+                               pyAesCrypt.decryptFile, encfilenames[4],
+                               decfilenames[4], password, bufferSize,
+                               workers=2)
+        # check that decrypted file was deleted
+        self.assertFalse(isfile(decfilenames[4]))
+
+
+# test zero-copy binary stream functions
+class TestZeroCopy(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test zero-copy encryption and decryption, interoperating with
+    # the default mode
+    def test_zerocopy(self):
+        for pt in filenames:
+            with open(pt, 'rb') as fIn:
+                pdata = fIn.read()
+            for bsize in (16, 64, bufferSize):
+                for encZC, decZC in ((True, True), (True, False),
+                                     (False, True)):
+                    fCiph = io.BytesIO()
+                    pyAesCrypt.encryptStream(io.BytesIO(pdata), fCiph,
+                                             password, bsize, zeroCopy=encZC)
+                    fCiph.seek(0)
+                    fDec = io.BytesIO()
+                    pyAesCrypt.decryptStream(fCiph, fDec, password, bsize,
+                                             zeroCopy=decZC)
+                    self.assertEqual(fDec.getvalue(), pdata)
+
+    # test zero-copy mode with simplest possible input stream
+    def test_zerocopy_simplefile(self):
+        with open(filenames[4], "rb") as fIn:
+            with open(encfilenames[4], "wb") as fOut:
+                pyAesCrypt.encryptStream(SimpleFile(fIn), fOut, password,
+                                         bufferSize, zeroCopy=True)
+        with open(encfilenames[4], "rb") as fIn:
+            with open(decfilenames[4], "wb") as fOut:
+                pyAesCrypt.decryptStream(SimpleFile(fIn), fOut, password,
+                                         bufferSize, zeroCopy=True)
+        self.assertTrue(filecmp.cmp(filenames[4], decfilenames[4]))
+
+    # test zero-copy decryption of a corrupted stream
+    def test_zerocopy_bad_hmac(self):
+        fCiph = io.BytesIO()
+        pyAesCrypt.encryptStream(io.BytesIO(os.urandom(100)), fCiph,
+                                 password, bufferSize)
+        ctext = bytearray(fCiph.getvalue())
+        ctext[-40] ^= 1
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               pyAesCrypt.decryptStream,
+                               io.BytesIO(bytes(ctext)), io.BytesIO(),
+                               password, bufferSize, zeroCopy=True)
+
+
+# test pipelined encryption/decryption
+class TestPipeline(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test pipelined encryption and decryption, interoperating with
+    # the default mode
+    def test_pipeline(self):
+        for pt in filenames:
+            with open(pt, 'rb') as fIn:
+                pdata = fIn.read()
+            for bsize in (16, 64, bufferSize):
+                for encPL, decPL in ((True, True), (True, False),
+                                     (False, True)):
+                    fCiph = io.BytesIO()
+                    pyAesCrypt.encryptStream(io.BytesIO(pdata), fCiph,
+                                             password, bsize, pipeline=encPL)
+                    fCiph.seek(0)
+                    fDec = io.BytesIO()
+                    pyAesCrypt.decryptStream(fCiph, fDec, password, bsize,
+                                             pipeline=decPL)
+                    self.assertEqual(fDec.getvalue(), pdata)
+
+    # test pipelined mode with input streams returning short reads
+    def test_pipeline_short_reads(self):
+        pdata = os.urandom(5 * 1000 + 7)
+        fCiph = io.BytesIO()
+        pyAesCrypt.encryptStream(ShortReadFile(io.BytesIO(pdata), 1000),
+                                 fCiph, password, 4096, pipeline=True)
+        # (the header parser itself needs full reads)
+        for maxRead in (200, 1000):
+            fDec = io.BytesIO()
+            pyAesCrypt.decryptStream(
+                ShortReadFile(io.BytesIO(fCiph.getvalue()), maxRead), fDec,
+                password, 4096, pipeline=True)
+            self.assertEqual(fDec.getvalue(), pdata)
+
+    # test pipelined file encryption and decryption
+    def test_pipeline_files(self):
+        for pt, ct, dt in zip(filenames, encfilenames, decfilenames):
+            pyAesCrypt.encryptFile(pt, ct, password, pipeline=True)
+            pyAesCrypt.decryptFile(ct, dt, password, pipeline=True)
+            self.assertTrue(filecmp.cmp(pt, dt))
+
+    # test pipelined decryption of corrupted and truncated streams
+    def test_pipeline_bad_hmac(self):
+        fCiph = io.BytesIO()
+        pyAesCrypt.encryptStream(io.BytesIO(os.urandom(100)), fCiph,
+                                 password, bufferSize)
+        ctext = bytearray(fCiph.getvalue())
+        ctext[-40] ^= 1
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               pyAesCrypt.decryptStream,
+                               io.BytesIO(bytes(ctext)), io.BytesIO(),
+                               password, 16, pipeline=True)
+        hdr = pyAesCrypt.readHeader(io.BytesIO(bytes(ctext)))
+        self.assertRaisesRegex(ValueError, "File is corrupted",
+                               pyAesCrypt.decryptStream,
+                               io.BytesIO(bytes(ctext[:hdr.headerSize + 10])),
+                               io.BytesIO(), password, 16, pipeline=True)
+
+    # test errors raised by the background threads
+    def test_pipeline_thread_errors(self):
+        fCiph = io.BytesIO()
+        pyAesCrypt.encryptStream(io.BytesIO(os.urandom(1000)), fCiph,
+                                 password, 16)
+        # reader error
+        fIn = io.BytesIO(os.urandom(1000))
+        fIn.close()
+        self.assertRaises(ValueError, pyAesCrypt.encryptStream, fIn,
+                          io.BytesIO(), password, 16, pipeline=True)
+        # writer error
+        fOut = io.BytesIO()
+        fOut.close()
+        self.assertRaises(ValueError, pyAesCrypt.decryptStream,
+                          io.BytesIO(fCiph.getvalue()), fOut, password, 16,
+                          pipeline=True)
+
+    # test that closing a reader does not wait for a blocked read
+    def test_pipeline_reader_close(self):
+        rfd, wfd = os.pipe()
+        with os.fdopen(rfd, 'rb', buffering=0) as fIn:
+            # two chunks queued, then a read blocked on the empty pipe
+            os.write(wfd, os.urandom(32))
+            reader = pyAesCrypt.pipeline.PipelineReader(fIn, 16, 2)
+            self.assertEqual(len(reader.get()), 16)
+            self.assertEqual(len(reader.get()), 16)
+            time.sleep(0.1)
+            start = time.perf_counter()
+            reader.close()
+            self.assertLess(time.perf_counter() - start,
+                            pyAesCrypt.pipeline.pipelineJoinTimeout + 1)
+            os.close(wfd)
+
+    # test that zeroCopy and pipeline cannot be combined
+    def test_pipeline_zerocopy(self):
+        self.assertRaisesRegex(ValueError, "cannot be used together",
+                               pyAesCrypt.encryptStream, io.BytesIO(),
+                               io.BytesIO(), password, bufferSize,
+                               zeroCopy=True, pipeline=True)
+
+
+# test memory-mapped file encryption/decryption
+class TestMmap(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test mmap encryption and decryption, interoperating with
+    # the default mode
+    def test_mmap(self):
+        for pt, ct, ou in zip(filenames, encfilenames, decfilenames):
+            for bsize in (16, bufferSize):
+                pyAesCrypt.encryptFile(pt, ct, password, bsize, useMmap=True)
+                pyAesCrypt.decryptFile(ct, ou, password, bsize)
+                self.assertTrue(filecmp.cmp(pt, ou))
+                pyAesCrypt.encryptFile(pt, ct, password, bsize)
+                pyAesCrypt.decryptFile(ct, ou, password, bsize, useMmap=True)
+                self.assertTrue(filecmp.cmp(pt, ou))
+
+    # test mmap decryption of a file with bad hmac
+    def test_mmap_bad_hmac(self):
+        pyAesCrypt.encryptFile(filenames[4], encfilenames[4], password,
+                               bufferSize, useMmap=True)
+        fsize = os.stat(encfilenames[4]).st_size
+        corruptFile(encfilenames[4], fsize - 100)
+        self.assertRaisesRegex(ValueError, ("Bad HMAC "
+                                            "\\(file is corrupted\\)."),
+                               pyAesCrypt.decryptFile, encfilenames[4],
+                               decfilenames[4], password, bufferSize,
+                               useMmap=True)
+        # check that decrypted file was deleted
+        self.assertFalse(isfile(decfilenames[4]))
+
+
+# test file descriptor output
+class TestFdOutput(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+        for pt, ct in zip(filenames, encfilenames):
+            pyAesCrypt.encryptFile(pt, ct, password, bufferSize)
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test decryption through the file descriptor
+    def test_fd(self):
+        for pt, ct, ou in zip(filenames, encfilenames, decfilenames):
+            for bsize in (16, bufferSize):
+                pyAesCrypt.decryptFile(ct, ou, password, bsize, useFd=True)
+                self.assertTrue(filecmp.cmp(pt, ou, shallow=False))
+
+    # test decryption with O_DIRECT
+    @unittest.skipUnless(hasattr(os, 'O_DIRECT'), "requires O_DIRECT")
+    def test_direct_io(self):
+        for pt, ct, ou in zip(filenames, encfilenames, decfilenames):
+            for bsize in (16, bufferSize):
+                try:
+                    pyAesCrypt.decryptFile(ct, ou, password, bsize,
+                                           directIO=True)
+                except ValueError as ex:
+                    # e.g. O_DIRECT not supported by the file system
+                    self.skipTest(str(ex))
+                self.assertTrue(filecmp.cmp(pt, ou, shallow=False))
+
+    # test decryption of a file with bad hmac
+    def test_fd_bad_hmac(self):
+        fsize = os.stat(encfilenames[4]).st_size
+        corruptFile(encfilenames[4], fsize - 100)
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               pyAesCrypt.decryptFile, encfilenames[4],
+                               decfilenames[4], password, bufferSize,
+                               useFd=True)
+        # check that decrypted file was deleted
+        self.assertFalse(isfile(decfilenames[4]))
+
+
+# test atomic file output
+class TestAtomic(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # check that no temporary files were left behind
+    def assertNoTempFiles(self):
+        self.assertEqual([fn for fn in os.listdir(tfdirname)
+                          if fn.endswith('.tmp')], [])
+
+    # test atomic encryption and decryption
+    def test_atomic(self):
+        for pt, ct, ou in zip(filenames, encfilenames, decfilenames):
+            for useMmap in (False, True):
+                pyAesCrypt.encryptFile(pt, ct, password, bufferSize,
+                                       useMmap=useMmap, atomic=True,
+                                       fsync=True)
+                pyAesCrypt.decryptFile(ct, ou, password, bufferSize,
+                                       useMmap=useMmap, atomic=True,
+                                       fsync=True)
+                self.assertTrue(filecmp.cmp(pt, ou, shallow=False))
+        self.assertNoTempFiles()
+
+    # test that an existing output file is left untouched on errors
+    def test_atomic_error(self):
+        pyAesCrypt.encryptFile(filenames[4], encfilenames[4], password,
+                               bufferSize)
+        with open(decfilenames[4], 'wb') as fout:
+            fout.write(b'previous contents')
+        corruptFile(encfilenames[4], os.stat(encfilenames[4]).st_size - 100)
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               pyAesCrypt.decryptFile, encfilenames[4],
+                               decfilenames[4], password, bufferSize,
+                               atomic=True)
+        self.assertRaisesRegex(ValueError, "Wrong password",
+                               pyAesCrypt.decryptFile, encfilenames[4],
+                               decfilenames[4], 'wrongpass', bufferSize,
+                               atomic=True)
+        with open(decfilenames[4], 'rb') as fin:
+            self.assertEqual(fin.read(), b'previous contents')
+        self.assertNoTempFiles()
+
+    # test that the temporary file is removed if processing is interrupted
+    def test_atomic_interrupted(self):
+        def func(fIn, fOut):
+            fOut.write(b'partial')
+            raise KeyboardInterrupt
+
+        self.assertRaises(KeyboardInterrupt, pyAesCrypt.crypto.processFiles,
+                          filenames[4], encfilenames[4], func, atomic=True)
+        self.assertFalse(isfile(encfilenames[4]))
+        self.assertNoTempFiles()
+
+
+# test in-memory bytes API
+class TestBytes(unittest.TestCase):
+
+    # test round trips, interoperating with the stream functions
+    def test_bytes(self):
+        for size in (0, 1, 15, 16, 17, 1000, 2*bufferSize+19):
+            pdata = os.urandom(size)
+            ctext = pyAesCrypt.encryptBytes(pdata, password)
+            self.assertIsInstance(ctext, bytes)
+            fDec = io.BytesIO()
+            pyAesCrypt.decryptStream(io.BytesIO(ctext), fDec, password)
+            self.assertEqual(fDec.getvalue(), pdata)
+            fCiph = io.BytesIO()
+            pyAesCrypt.encryptStream(io.BytesIO(pdata), fCiph, password)
+            pText = pyAesCrypt.decryptBytes(fCiph.getvalue(), password)
+            self.assertIsInstance(pText, bytes)
+            self.assertEqual(pText, pdata)
+            # any buffer-protocol object is accepted
+            self.assertEqual(pyAesCrypt.decryptBytes(
+                memoryview(bytearray(ctext)), password), pdata)
+
+    # test session methods
+    def test_bytes_sessions(self):
+        enc = pyAesCrypt.Encryptor(password)
+        dec = pyAesCrypt.Decryptor(password)
+        for i in range(3):
+            pdata = os.urandom(100 + i)
+            self.assertEqual(dec.decryptBytes(enc.encryptBytes(pdata)), pdata)
+        self.assertEqual(dec.keyCache.misses, 1)
+
+    # test errors
+    def test_bytes_errors(self):
+        ctext = pyAesCrypt.encryptBytes(b'some data', password)
+        self.assertRaisesRegex(ValueError, "Wrong password",
+                               pyAesCrypt.decryptBytes, ctext, 'wrongpass')
+        corrupted = bytearray(ctext)
+        corrupted[-40] ^= 1
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               pyAesCrypt.decryptBytes, corrupted, password)
+        self.assertRaisesRegex(ValueError, "File is corrupted",
+                               pyAesCrypt.decryptBytes, ctext[:-1], password)
+        self.assertRaisesRegex(ValueError, "File is corrupted",
+                               pyAesCrypt.decryptBytes, ctext[:20], password)
+
+
+# test push-style stream decryptor
+class TestStreamDecryptor(unittest.TestCase):
+
+    # encrypt data in memory
+    def encrypt(self, pdata):
+        fCiph = io.BytesIO()
+        pyAesCrypt.encryptStream(io.BytesIO(pdata), fCiph, password,
+                                 bufferSize)
+        return fCiph.getvalue()
+
+    # decrypt data pushing it in chunks of the given size
+    def decrypt(self, ctext, chunkSize):
+        dec = pyAesCrypt.StreamDecryptor(password)
+        pdata = b''
+        for i in range(0, len(ctext), chunkSize):
+            pdata += dec.feed(ctext[i:i + chunkSize])
+        return pdata + dec.finalize()
+
+    # test decryption with several chunk sizes
+    def test_feed(self):
+        for size in (0, 4, 16, 1000, 2*bufferSize+19):
+            pdata = os.urandom(size)
+            ctext = self.encrypt(pdata)
+            for chunkSize in (1, 7, 49, 4096, len(ctext)):
+                self.assertEqual(self.decrypt(ctext, chunkSize), pdata)
+
+    # test decryption of input streams returning short reads
+    def test_short_reads(self):
+        pdata = os.urandom(2*bufferSize+19)
+        fIn = ShortReadFile(io.BytesIO(self.encrypt(pdata)), 1000)
+        fDec = io.BytesIO()
+        pyAesCrypt.decryptStream(fIn, fDec, password, bufferSize)
+        self.assertEqual(fDec.getvalue(), pdata)
+
+    # test errors
+    def test_errors(self):
+        ctext = self.encrypt(os.urandom(100))
+        # truncated header
+        for n in (0, 2, 10, 200):
+            self.assertRaisesRegex(ValueError, "corrupted",
+                                   self.decrypt, ctext[:n], 16)
+        # wrong password
+        dec = pyAesCrypt.StreamDecryptor('wrongpass')
+        self.assertRaisesRegex(ValueError, "Wrong password",
+                               dec.feed, ctext)
+        # bad HMAC
+        self.assertRaisesRegex(ValueError, "Bad HMAC",
+                               self.decrypt, ctext[:-1] + bytes([ctext[-1] ^ 1]), 16)
+
+    # test the decrypting reader
+    def test_reader(self):
+        for size in (0, 4, 16, 1000, 2*bufferSize+19):
+            pdata = os.urandom(size)
+            ctext = self.encrypt(pdata)
+            for readSize in (1, 100, bufferSize):
+                fDec = pyAesCrypt.DecryptingReader(io.BytesIO(ctext),
+                                                   password, bufferSize=1000)
+                out = b''
+                while True:
+                    data = fDec.read(readSize)
+                    if not data:
+                        break
+                    out += data
+                self.assertEqual(out, pdata)
+        fDec = pyAesCrypt.DecryptingReader(
+            io.BytesIO(ctext[:-1] + bytes([ctext[-1] ^ 1])), password)
+        self.assertRaisesRegex(ValueError, "Bad HMAC", fDec.read)
+
+
+# test push-style stream encryptor and encrypting writer
+class TestStreamEncryptor(unittest.TestCase):
+
+    # decrypt data in memory
+    def decrypt(self, ctext):
+        fDec = io.BytesIO()
+        pyAesCrypt.decryptStream(io.BytesIO(ctext), fDec, password,
+                                 bufferSize)
+        return fDec.getvalue()
+
+    # test encryption with several chunk sizes
+    def test_update(self):
+        for size in (0, 4, 16, 1000, 2*bufferSize+19):
+            pdata = os.urandom(size)
+            for chunkSize in (1, 7, 16, 4096, bufferSize):
+                enc = pyAesCrypt.StreamEncryptor(password)
+                ctext = b''
+                for i in range(0, size, chunkSize):
+                    ctext += enc.update(pdata[i:i + chunkSize])
+                ctext += enc.finalize()
+                self.assertEqual(self.decrypt(ctext), pdata)
+
+    # test that the header is emitted by the first call
+    def test_header_first(self):
+        enc = pyAesCrypt.StreamEncryptor(password)
+        ctext = enc.update(b'')
+        self.assertEqual(ctext[:3], b'AES')
+        # incomplete block
+        self.assertEqual(enc.update(b'abc'), b'')
+        ctext += enc.finalize()
+        self.assertEqual(self.decrypt(ctext), b'abc')
+
+    # test taking the header on its own
+    def test_header_only(self):
+        enc = pyAesCrypt.StreamEncryptor(password)
+        header = enc.header()
+        self.assertEqual(enc.header(), b'')
+        ctext = header + enc.update(b'abc') + enc.finalize()
+        self.assertEqual(len(header),
+                         pyAesCrypt.readHeader(io.BytesIO(ctext)).headerSize)
+        self.assertEqual(self.decrypt(ctext), b'abc')
+
+    # test that encryptStream writes the header with a single call
+    def test_header_single_write(self):
+        for zeroCopy in (False, True):
+            fOut = WriteLogFile()
+            pyAesCrypt.encryptStream(io.BytesIO(b'abc'), fOut, password,
+                                     bufferSize, zeroCopy=zeroCopy)
+            ctext = b''.join(fOut.writes)
+            hdr = pyAesCrypt.readHeader(io.BytesIO(ctext))
+            self.assertEqual(len(fOut.writes[0]), hdr.headerSize)
+            self.assertEqual(self.decrypt(ctext), b'abc')
+
+    # test encrypting writer
+    def test_writer(self):
+        pdata = os.urandom(2*bufferSize+19)
+        fCiph = io.BytesIO()
+        with pyAesCrypt.EncryptingWriter(fCiph, password) as fEnc:
+            for i in range(0, len(pdata), 1000):
+                fEnc.write(pdata[i:i + 1000])
+        self.assertTrue(fEnc.closed)
+        self.assertEqual(self.decrypt(fCiph.getvalue()), pdata)
+
+    # test encrypting writer using a session encryptor
+    def test_writer_session(self):
+        session = pyAesCrypt.Encryptor(password)
+        fCiph = io.BytesIO()
+        with pyAesCrypt.EncryptingWriter(
+                fCiph, encryptor=session.streamEncryptor()) as fEnc:
+            fEnc.write(b'session data')
+        self.assertIn(session.iv1, fCiph.getvalue())
+        self.assertEqual(self.decrypt(fCiph.getvalue()), b'session data')
+
+    # test that the trailer is not written if an exception is raised
+    def test_writer_exception(self):
+        fCiph = io.BytesIO()
+        try:
+            with pyAesCrypt.EncryptingWriter(fCiph, password) as fEnc:
+                fEnc.write(os.urandom(100))
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertRaises(ValueError, self.decrypt, fCiph.getvalue())
+        self.assertRaises(ValueError, fEnc.write, b'more')
+
+
+# test random-access decryption
+class TestRandomAccess(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+        for pt, ct in zip(filenames, encfilenames):
+            pyAesCrypt.encryptFile(pt, ct, password, bufferSize)
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test decryption of byte ranges
+    def test_ranges(self):
+        for pt, ct in zip(filenames, encfilenames):
+            with open(pt, 'rb') as fIn:
+                pdata = fIn.read()
+            size = len(pdata)
+            ranges = [(0, size), (0, 1), (size // 2, 100), (15, 2),
+                      (16, 16), (max(size - 3, 0), 10), (size, 5),
+                      (size + 10, 5)]
+            with open(ct, 'rb') as fIn:
+                for offset, length in ranges:
+                    self.assertEqual(
+                        pyAesCrypt.decryptRange(fIn, password, offset, length),
+                        pdata[offset:offset + length])
+
+    # test seekable file object
+    def test_open(self):
+        with open(filenames[4], 'rb') as fIn:
+            pdata = fIn.read()
+        with pyAesCrypt.openDecrypted(encfilenames[4], password) as fDec:
+            self.assertEqual(fDec.size, len(pdata))
+            fDec.seek(1000)
+            self.assertEqual(fDec.read(4096), pdata[1000:5096])
+            self.assertEqual(fDec.tell(), 5096)
+            fDec.seek(-19, io.SEEK_END)
+            self.assertEqual(fDec.read(), pdata[-19:])
+            self.assertEqual(fDec.read(), b'')
+            fDec.verify()
+            fDec.seek(0)
+            self.assertEqual(io.BufferedReader(fDec).read(), pdata)
+        self.assertTrue(fDec.closed)
+
+    # test HMAC verification of a corrupted file
+    def test_verify_bad_hmac(self):
+        fsize = os.stat(encfilenames[4]).st_size
+        corruptFile(encfilenames[4], fsize - 100)
+        with pyAesCrypt.openDecrypted(encfilenames[4], password) as fDec:
+            # range far from the corrupted byte is still readable
+            fDec.read(100)
+            self.assertRaisesRegex(ValueError, "Bad HMAC", fDec.verify)
+
+    # test wrong password
+    def test_wrongpass(self):
+        self.assertRaisesRegex(ValueError, "Wrong password",
+                               pyAesCrypt.openDecrypted, encfilenames[4],
+                               'wrongpass')
+
+
+# test automatic buffer size
+class TestAutoBufferSize(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test chosen buffer sizes
+    def test_auto_size(self):
+        size = pyAesCrypt.crypto.autoBufferSize(io.BytesIO())
+        self.assertEqual(size % 16, 0)
+        self.assertGreaterEqual(size, pyAesCrypt.crypto.autoBufferSizeMin)
+        self.assertLessEqual(size, pyAesCrypt.crypto.autoBufferSizeMax)
+        for fn in filenames:
+            with open(fn, 'rb') as fIn:
+                fsize = os.fstat(fIn.fileno()).st_size
+                blkSize = os.fstat(fIn.fileno()).st_blksize
+                size = pyAesCrypt.crypto.autoBufferSize(fIn)
+            self.assertEqual(size % 16, 0)
+            self.assertEqual(size % blkSize, 0)
+            # no larger than the file, rounded up to the block sizes
+            self.assertLess(size, max(fsize, 1) + 16 * blkSize)
+
+    # test encryption/decryption with "auto" buffer size
+    def test_auto_enc_dec(self):
+        for pt, ct, ou in zip(filenames, encfilenames, decfilenames):
+            pyAesCrypt.encryptFile(pt, ct, password, "auto")
+            pyAesCrypt.decryptFile(ct, ou, password, "auto")
+            self.assertTrue(filecmp.cmp(pt, ou))
+            fDec = io.BytesIO()
+            with open(ct, 'rb') as fIn:
+                pyAesCrypt.decryptStream(fIn, fDec, password, "auto")
+            with open(pt, 'rb') as fIn:
+                self.assertEqual(fIn.read(), fDec.getvalue())
+
+
+# test verify-only mode
+class TestVerify(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+        for pt, ct in zip(filenames, encfilenames):
+            pyAesCrypt.encryptFile(pt, ct, password, bufferSize)
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test verification of good files, with various buffer sizes
+    def test_verify(self):
+        for ct in encfilenames:
+            for bs in [1, 16, 100, bufferSize]:
+                pyAesCrypt.verifyFile(ct, password, bs)
+            with open(ct, 'rb') as fIn:
+                pyAesCrypt.verifyStream(ShortReadFile(fIn, 1000), password,
+                                        4096)
+
+    # test verification of corrupted files
+    def test_verify_corrupted(self):
+        fsize = os.stat(encfilenames[4]).st_size
+        corruptFile(encfilenames[4], fsize - 100)
+        self.assertRaisesRegex(ValueError, "Bad HMAC", pyAesCrypt.verifyFile,
+                               encfilenames[4], password)
+        with open(encfilenames[3], 'r+b') as ftc:
+            ftc.truncate(os.stat(encfilenames[3]).st_size - 1)
+        self.assertRaisesRegex(ValueError, "File is corrupted",
+                               pyAesCrypt.verifyFile, encfilenames[3],
+                               password)
+        self.assertRaisesRegex(ValueError, "Wrong password",
+                               pyAesCrypt.verifyFile, encfilenames[2],
+                               'wrongpass')
+
+
+# test header inspection
+class TestHeader(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate a test file
+        with open(filenames[4], 'wb') as fout:
+            fout.write(os.urandom(2*bufferSize+19))
+        pyAesCrypt.encryptFile(filenames[4], encfilenames[4], password,
+                               bufferSize)
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test header fields
+    def test_read_header(self):
+        with open(encfilenames[4], 'rb') as fIn:
+            hdr = pyAesCrypt.readHeader(fIn)
+            self.assertEqual(fIn.tell(), hdr.headerSize)
+        self.assertEqual(hdr.version, 2)
+        self.assertEqual(hdr.createdBy,
+                         'pyAesCrypt ' + pyAesCrypt.crypto.version)
+        self.assertEqual([ext for ext, val in hdr.extensions], ['CREATED_BY'])
+        self.assertEqual(hdr.payloadSize, 2*bufferSize+32)
+        self.assertEqual(hdr.headerSize + hdr.payloadSize + 33,
+                         os.stat(encfilenames[4]).st_size)
+        # header of a non-seekable stream has no payload size
+        with open(encfilenames[4], 'rb') as fIn:
+            hdr = pyAesCrypt.readHeader(SimpleFile(fIn))
+        self.assertIsNone(hdr.payloadSize)
+
+    # test password check
+    def test_check_password(self):
+        self.assertTrue(pyAesCrypt.checkPassword(encfilenames[4], password))
+        self.assertFalse(pyAesCrypt.checkPassword(encfilenames[4],
+                                                  'wrongpass'))
+        # not an AES Crypt file
+        self.assertRaisesRegex(ValueError, "not an AES Crypt",
+                               pyAesCrypt.checkPassword, filenames[4],
+                               password)
+
+
+# test stretched-key cache
+class TestKeyCache(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate a test file
+        with open(filenames[4], 'wb') as fout:
+            fout.write(os.urandom(2*bufferSize+19))
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test repeated decryption using the cache
+    def test_cache_hits(self):
+        kc = pyAesCrypt.KeyCache()
+        pyAesCrypt.encryptFile(filenames[4], encfilenames[4], password,
+                               bufferSize)
+        for i in range(3):
+            pyAesCrypt.decryptFile(encfilenames[4], decfilenames[4], password,
+                                   bufferSize, keyCache=kc)
+            self.assertTrue(filecmp.cmp(filenames[4], decfilenames[4]))
+        self.assertEqual(kc.misses, 1)
+        self.assertEqual(kc.hits, 2)
+        self.assertEqual(len(kc), 1)
+
+    # test that the cache does not hide a wrong password
+    def test_cache_wrongpass(self):
+        kc = pyAesCrypt.KeyCache()
+        pyAesCrypt.encryptFile(filenames[4], encfilenames[4], password,
+                               bufferSize)
+        pyAesCrypt.decryptFile(encfilenames[4], decfilenames[4], password,
+                               bufferSize, keyCache=kc)
+        self.assertRaisesRegex(ValueError, ("Wrong password "
+                                            "\\(or file is corrupted\\)."),
+                               pyAesCrypt.decryptFile,
+                               encfilenames[4], decfilenames[4],
+                               'wrongpass', bufferSize, kc)
+        self.assertEqual(kc.misses, 2)
+
+    # test LRU eviction and clear
+    def test_cache_eviction(self):
+        kc = pyAesCrypt.KeyCache(2)
+        iv1s = [os.urandom(16) for i in range(3)]
+        for iv1 in iv1s:
+            self.assertEqual(kc.getKey(password, iv1),
+                             pyAesCrypt.crypto.stretch(password, iv1))
+        self.assertEqual(len(kc), 2)
+        # most recently used keys are still cached
+        kc.getKey(password, iv1s[2])
+        self.assertEqual(kc.hits, 1)
+        # least recently used key was evicted
+        kc.getKey(password, iv1s[0])
+        self.assertEqual(kc.misses, 4)
+        kc.clear()
+        self.assertEqual(len(kc), 0)
+
+# test encryption/decryption sessions
+class TestSessions(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate test files
+        genTestFiles()
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test session encryption with plain and session decryption
+    def test_sessions(self):
+        enc = pyAesCrypt.Encryptor(password)
+        for pt, ct in zip(filenames, encfilenames):
+            enc.encryptFile(pt, ct, bufferSize)
+            # check that the session iv1 was used
+            with open(ct, 'rb') as fIn:
+                self.assertIn(enc.iv1, fIn.read())
+        # plain decryption
+        for pt, ct, ou in zip(filenames, encfilenames, decfilenames):
+            pyAesCrypt.decryptFile(ct, ou, password, bufferSize)
+            self.assertTrue(filecmp.cmp(pt, ou))
+        # session decryption stretches the password only once
+        dec = pyAesCrypt.Decryptor(password)
+        for pt, ct, ou in zip(filenames, encfilenames, decfilenames):
+            dec.decryptFile(ct, ou, bufferSize)
+            self.assertTrue(filecmp.cmp(pt, ou))
+        self.assertEqual(dec.keyCache.misses, 1)
+        self.assertEqual(dec.keyCache.hits, len(filenames) - 1)
+
+    # test that session outputs do not share main iv and internal key
+    def test_session_distinct_outputs(self):
+        enc = pyAesCrypt.Encryptor(password)
+        fOut1 = io.BytesIO()
+        fOut2 = io.BytesIO()
+        enc.encryptStream(io.BytesIO(b'same data'), fOut1, bufferSize)
+        enc.encryptStream(io.BytesIO(b'same data'), fOut2, bufferSize)
+        self.assertNotEqual(fOut1.getvalue(), fOut2.getvalue())
+        fDec = io.BytesIO()
+        fOut2.seek(0)
+        pyAesCrypt.Decryptor(password).decryptStream(fOut2, fDec, bufferSize)
+        self.assertEqual(fDec.getvalue(), b'same data')
+
+# output file class logging every write() call
+class WriteLogFile:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return len(data)
+
+# file access class returning at most maxRead bytes for each read()
+class ShortReadFile:
+    def __init__(self, f, maxRead):
         self.f = f
+        self.maxRead = maxRead
 
     def read(self, size = -1):
+        if size < 0 or size > self.maxRead:
+            size = self.maxRead
         return self.f.read(size)
 
-    def tell(self):
-        return self.f.tell()
-
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,117 @@
+#==============================================================================
+# Copyright 2020 Marco Bellaccini - marco.bellaccini[at!]gmail.com
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#==============================================================================
+
+# test suite for pyAesCrypt stats module
+
+import unittest
+import io
+import os
+import shutil
+import filecmp
+import pyAesCrypt
+from pyAesCrypt.stats import phases
+from pyAesCrypt.test_helpers import SimpleFile
+
+# test file directory name
+tfdirname = 'pyAesCryptStatsTF'
+
+# buffer size
+bufferSize = 64 * 1024
+
+# test password
+password = "foopassword!1$A"
+
+
+# test observers
+class TestStats(unittest.TestCase):
+    # fixture for preparing the environment
+    def setUp(self):
+        # make directory for test files
+        try:
+            os.mkdir(tfdirname)
+        # if directory exists, delete and re-create it
+        except FileExistsError:
+            # remove whole tree
+            shutil.rmtree(tfdirname)
+            os.mkdir(tfdirname)
+        # generate a test file
+        self.pt = os.path.join(tfdirname, 'pt')
+        self.ct = os.path.join(tfdirname, 'pt.aes')
+        self.dec = os.path.join(tfdirname, 'pt.decr')
+        with open(self.pt, 'wb') as fout:
+            fout.write(os.urandom(3*bufferSize+19))
+
+    def tearDown(self):
+        # remove whole directory tree
+        shutil.rmtree(tfdirname)
+
+    # test stats of file encryption and decryption
+    def test_file_stats(self):
+        calls = []
+        stats = pyAesCrypt.Stats(lambda done, total: calls.append(done))
+        pyAesCrypt.encryptFile(self.pt, self.ct, password, bufferSize,
+                               observer=stats)
+        size = os.stat(self.pt).st_size
+        self.assertEqual(stats.total, size)
+        self.assertEqual(stats.done, size)
+        self.assertEqual(calls, sorted(calls))
+        self.assertEqual(calls[-1], size)
+        self.assertEqual(set(stats.timings), set(phases))
+        self.assertGreater(stats.timings['stretch'], 0)
+        self.assertGreater(stats.timings['aes'], 0)
+        self.assertGreater(stats.elapsed, sum(stats.timings.values()))
+        self.assertGreater(stats.throughput, 0)
+        self.assertIn("MB/s", stats.report())
+
+        stats = pyAesCrypt.Stats()
+        pyAesCrypt.decryptFile(self.ct, self.dec, password, bufferSize,
+                               observer=stats)
+        self.assertTrue(filecmp.cmp(self.pt, self.dec))
+        self.assertEqual(stats.done, os.stat(self.ct).st_size)
+        self.assertGreater(stats.timings['hmac'], 0)
+
+    # test observed stream decryption on all input paths
+    def test_stream_paths(self):
+        pyAesCrypt.encryptFile(self.pt, self.ct, password, bufferSize)
+        with open(self.pt, 'rb') as fIn:
+            pdata = fIn.read()
+        for zeroCopy in (False, True):
+            for wrap in (lambda f: f, SimpleFile):
+                stats = pyAesCrypt.Stats()
+                fDec = io.BytesIO()
+                with open(self.ct, 'rb') as fIn:
+                    pyAesCrypt.decryptStream(wrap(fIn), fDec, password,
+                                             bufferSize, zeroCopy=zeroCopy,
+                                             observer=stats)
+                self.assertEqual(fDec.getvalue(), pdata)
+                self.assertEqual(stats.done, os.stat(self.ct).st_size)
+                self.assertGreater(stats.timings['aes'], 0)
+
+    # test that finish is not called on errors
+    def test_error(self):
+        pyAesCrypt.encryptFile(self.pt, self.ct, password, bufferSize)
+        observer = pyAesCrypt.Observer()
+        observer.finish = lambda timings: self.fail("finish called")
+        self.assertRaisesRegex(ValueError, "Wrong password",
+                               pyAesCrypt.decryptFile, self.ct, self.dec,
+                               'wrongpass', observer=observer)
+        self.assertRaisesRegex(ValueError, "observer cannot be used",
+                               pyAesCrypt.encryptFile, self.pt, self.ct,
+                               password, useMmap=True, observer=observer)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,7 +6,7 @@ with open(os.path.join(os.path.dirname(__file__), 'README.rst')) as readme:
 
 setup(name='pyAesCrypt',
     version='6.1.1',
-    packages = find_packages(),
+    packages = find_packages(exclude=["benchmarks", "benchmarks.*"]),
     include_package_data=True,
     description='Encrypt and decrypt files and streams in AES Crypt format (version 2)',
     long_description = README,
@@ -15,6 +15,7 @@ setup(name='pyAesCrypt',
     license='Apache License 2.0',
     scripts=['bin/pyAesCrypt'],
     install_requires=['cryptography'],
+    extras_require={'zstd': ['zstandard']},
     keywords = "AES Crypt encrypt decrypt",
     classifiers=[
         'License :: OSI Approved :: Apache Software License',